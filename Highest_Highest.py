@@ -1,13 +1,44 @@
-import sqlite3
-import subprocess
+import os
+from database import get_database
+from event_ingestion import EventIngestor
+from rules import RuleEngine
+from alerts import Alert
+import metrics
+import providers
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.yml')
+
 
 class Highest_Highest:
-    def __init__(self, database_path):
+    def __init__(self, database_path, event_source=None, rules_path=RULES_PATH, alerts=None, backend=None):
         self.database_path = database_path
+        self.alerts = alerts
+        self.database = get_database(database_path)
+        self.rules_path = rules_path
+        self.backend = backend
+        # The rules and the event log backend are loaded on the first detection run, not at startup
+        self._rule_engine = None
+        self._event_source = event_source
+
+    @property
+    def rule_engine(self):
+        if self._rule_engine is None:
+            self._rule_engine = RuleEngine.from_file(self.rules_path)
+        return self._rule_engine
+
+    @property
+    def event_source(self):
+        if self._event_source is None:
+            # The event log only returns the event IDs some rule is interested in
+            self._event_source = providers.create('events', self.backend, event_ids=self.rule_engine.event_ids)
+        return self._event_source
+
+    @event_source.setter
+    def event_source(self, event_source):
+        self._event_source = event_source
         
     def setup_database(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
+        with self.database.writer().transaction() as cursor:
             cursor.execute('''
                            CREATE TABLE IF NOT EXISTS Highest_Sev_Highest_Conf (
                                id INTEGER PRIMARY KEY,
@@ -15,39 +46,53 @@ class Highest_Highest:
                                RecordId TEXT,
                                ProcessId TEXT,
                                MachineName TEXT,
-                               Message TEXT
+                               Message TEXT,
+                               RuleName TEXT
                             )
                             ''')
-            conn.commit()
-            conn.close()
-            
-    def LSASS_Access_From_Non_System_Account(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-        
-        cmd = [
-            'powershell',
-            'Get-WinEvent | where {((($_.ID -eq "4663" -or $_.ID -eq "4656") -and ($_.message -match "AccessMask.*0x40" -or $_.message -match "AccessMask.*0x1400" -or $_.message -match "AccessMask.*0x100000" -or $_.message -match "AccessMask.*0x1410" -or $_.message -match "AccessMask.*0x1010" -or $_.message -match "AccessMask.*0x1438" -or $_.message -match "AccessMask.*0x143a" -or $_.message -match "AccessMask.*0x1418" -or $_.message -match "AccessMask.*0x1f0fff" -or $_.message -match "AccessMask.*0x1f1fff" -or $_.message -match "AccessMask.*0x1f2fff" -or $_.message -match "AccessMask.*0x1f3fff" -or $_.message -match "AccessMask.*40" -or $_.message -match "AccessMask.*1400" -or $_.message -match "AccessMask.*1000" -or $_.message -match "AccessMask.*100000" -or $_.message -match "AccessMask.*1410" -or $_.message -match "AccessMask.*1010" -or $_.message -match "AccessMask.*1438" -or $_.message -match "AccessMask.*143a" -or $_.message -match "AccessMask.*1418" -or $_.message -match "AccessMask.*1f0fff" -or $_.message -match "AccessMask.*1f1fff" -or $_.message -match "AccessMask.*1f2fff" -or $_.message -match "AccessMask.*1f3fff") -and $_.message -match "ObjectType.*Process" -and $_.message -match "ObjectName.*.*\\lsass.exe") -and  -not ($_.message -match "SubjectUserName.*.*$" -or $_.message -match "ProcessName.*C:\\Program Files.*" -or ($_.message -match "ProcessName.*C:\\Windows\\System32\\wbem\\WmiPrvSE.exe" -and $_.message -match "AccessMask.*0x1410") -or $_.message -match "ProcessName.*.*\\SteamLibrary\\steamapps\\.*")) } | select TimeCreated,Id,RecordId,ProcessId,MachineName,Message']
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Parse the output
-        events = eval(result.stdout) # Convert the output JSON string to a python list
+
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS EventBookmarks (
+                               Source TEXT PRIMARY KEY,
+                               RecordId INTEGER NOT NULL
+                            )
+                            ''')
+
+            cursor.execute("PRAGMA table_info(Highest_Sev_Highest_Conf)")
+            if 'RuleName' not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE Highest_Sev_Highest_Conf ADD COLUMN RuleName TEXT")
+
+    def run_detections(self):
+        # One sweep of new events evaluates every rule, adding rules doesn't add event log reads
+        ingestor = EventIngestor(self.database, self.event_source, 'Highest_Highest')
             
         # Save to the database
-        for event in events:
-            cursor.execute('''
-                           INSERT INTO Highest_Sev_Highest_Conf (TimeCreated, RecordId, ProcessId, MachineName, Message)
-                           VALUES (?, ?, ?, ?, ?)
-                           ''', (event['TimeCreated'], event['RecordId'], event['ProcessId'], event['MachineName'], event['Message']))
-            conn.commit()
-            conn.close()
+        alerts = []
+        with self.database.writer() as writer:
+            for event in ingestor.events():
+                metrics.count('items')
+                for rule in self.rule_engine.evaluate(event):
+                    writer.add('''
+                           INSERT INTO Highest_Sev_Highest_Conf (TimeCreated, RecordId, ProcessId, MachineName, Message, RuleName)
+                           VALUES (?, ?, ?, ?, ?, ?)
+                           ''', (event.get('TimeCreated'), event.get('RecordId'), event.get('ProcessId'), event.get('MachineName'),
+                                 event.get('Message'), rule.name))
+                    alerts.append(Alert('events', rule.severity, rule.name, event.get('MachineName'), event.get('Message')))
+            # Alerts go in after the detections so the writer keeps each statement's rows together
+            if self.alerts is not None:
+                self.alerts.add_many(alerts, writer)
+            # Queued last, so the bookmark only moves once the detections and alerts before it are written
+            ingestor.save_bookmark(writer)
+
+    def LSASS_Access_From_Non_System_Account(self):
+        # Kept for existing callers, the LSASS rule now lives in rules.yml with the others
+        self.run_detections()
 
 if __name__ == "__main__":
-    Highest_Highest = Highest_Highest()
+    Highest_Highest = Highest_Highest("GuardianAngel.db")
     Highest_Highest.setup_database()
-    Highest_Highest.LSASS_Access_From_Non_System_Account()
+    Highest_Highest.run_detections()
     
         
         
 
-
@@ -0,0 +1,126 @@
+from collections import namedtuple
+
+# Stable account attributes only. Values such as password_age or the last logon change on their own
+# and would show up as a discrepancy on every scan.
+Account = namedtuple('Account', ['sid', 'username', 'full_name', 'flags', 'rid'])
+
+UF_ACCOUNTDISABLE = 0x0002
+UF_LOCKOUT = 0x0010
+UF_PASSWORD_EXPIRED = 0x800000
+# Lockout and password expiry flip without anyone touching the account, so they aren't compared
+VOLATILE_FLAGS = UF_LOCKOUT | UF_PASSWORD_EXPIRED
+
+
+def account_key(account):
+    # SID when the provider knows it, so a renamed account is a modification rather than an add and a remove
+    return account.sid or account.username.lower()
+
+
+def stable_flags(flags):
+    return None if flags is None else flags & ~VOLATILE_FLAGS
+
+
+def comparable(account, previous=None):
+    # Disabling an account isn't a change: the scans disable Guest and new accounts themselves, and that
+    # shouldn't come back on every later scan. The disable bit is taken from `previous` instead, so an
+    # account that was disabled before and is enabled again still shows up.
+    if account.flags is None or not account.flags & UF_ACCOUNTDISABLE:
+        return account
+    disabled = previous.flags & UF_ACCOUNTDISABLE if previous is not None and previous.flags is not None else 0
+    return account._replace(flags=account.flags & ~UF_ACCOUNTDISABLE | disabled)
+
+
+class AccountProvider:
+    # Returns the local (or domain, on a DC) accounts as a list of Account
+    def accounts(self):
+        raise NotImplementedError
+
+    def snapshot(self):
+        return {account_key(account): account for account in self.accounts()}
+
+
+class Win32NetAccountProvider(AccountProvider):
+    # Level 20 is the smallest NetUserEnum level that has the RID, and the enumeration is paged with
+    # MAX_PREFERRED_LENGTH so a large domain comes back in a handful of calls
+    LEVEL = 20
+
+    def __init__(self, server=None, logger=None):
+        import win32net
+        import win32netcon
+        import win32security
+        self.win32net = win32net
+        self.win32netcon = win32netcon
+        self.win32security = win32security
+        self.server = server
+        self.logger = logger
+        self.domain_sid = None
+
+    def lookup_domain_sid(self, username):
+        # Every account from one server shares the domain part of its SID, so one lookup covers all of them
+        try:
+            sid, _, _ = self.win32security.LookupAccountName(self.server, username)
+            return self.win32security.ConvertSidToStringSid(sid).rsplit('-', 1)[0]
+        except self.win32security.error as e:
+            if self.logger is not None:
+                self.logger.log(f"Error looking up SID for {username}: {str(e)}")
+            return None
+
+    def accounts(self):
+        users = []
+        resume = 0
+        while True:
+            (user_list, total, resume) = self.win32net.NetUserEnum(self.server, self.LEVEL, self.win32netcon.FILTER_NORMAL_ACCOUNT,
+                                                                   resume, self.win32netcon.MAX_PREFERRED_LENGTH)
+            users.extend(user_list)
+            if not resume:
+                break
+
+        if users and self.domain_sid is None:
+            self.domain_sid = self.lookup_domain_sid(users[0]['name'])
+        accounts = []
+        for user in users:
+            rid = user.get('user_id')
+            sid = f"{self.domain_sid}-{rid}" if self.domain_sid and rid is not None else None
+            accounts.append(Account(sid, user['name'], user.get('full_name') or None, stable_flags(user.get('flags')), rid))
+        return accounts
+
+
+class FakeAccountProvider(AccountProvider):
+    # Serves a fixed list of accounts, given as Account tuples or NetUserEnum-style dicts
+    def __init__(self, accounts=()):
+        self.set_accounts(accounts)
+
+    def set_accounts(self, accounts):
+        self.records = []
+        for account in accounts:
+            if isinstance(account, dict):
+                account = Account(account.get('sid'), account['name'], account.get('full_name'),
+                                  stable_flags(account.get('flags')), account.get('user_id'))
+            self.records.append(account)
+
+    def accounts(self):
+        return list(self.records)
+
+
+def account_changed(baseline, current):
+    # Attributes the baseline didn't record (rows from before they were stored) are not compared
+    return any(old is not None and old != new for old, new in zip(baseline, current))
+
+
+def diff_accounts(baseline, current):
+    # One pass over both snapshots ({key: Account}), returns [(ChangeType, Account)].
+    # Baseline rows without a SID are matched on the username instead.
+    by_name = {account.username.lower(): key for key, account in baseline.items() if account.sid is None}
+    matched = set()
+    changes = []
+    for key, account in current.items():
+        baseline_key = key if key in baseline else by_name.get(account.username.lower())
+        if baseline_key is None:
+            changes.append(('added', account))
+            continue
+        matched.add(baseline_key)
+        previous = baseline[baseline_key]
+        if previous != comparable(account, previous) and account_changed(previous, comparable(account, previous)):
+            changes.append(('modified', account))
+    changes.extend(('removed', account) for key, account in baseline.items() if key not in matched)
+    return changes
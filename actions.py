@@ -1,44 +1,147 @@
 import subprocess
 from logger import Logger
-import sqlite3
+from database import get_database
 import os
-import winreg
+import time
+from autoruns import WinRegistry
+
+# Blocked addresses are spread over a few firewall rules instead of one rule per address,
+# each rule holds up to BLOCK_RULE_SIZE addresses so the netsh command line stays short
+BLOCK_RULE_NAME = "Hammer Blocked IPs"
+BLOCK_RULE_SIZE = 200
+
+# Returned instead of True/False by a backend that can't carry an action out on this platform
+SKIPPED = 'skipped'
 
 
 class Actions:
-    def __init__(self):
+    def __init__(self, registry=None):
+        self.registry = registry
         self.database_path = "GuardianAngel.db"
         self.logger = Logger()
+        self.database = get_database(self.database_path)
 
     def fetch_trusted_IPs(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-        cursor.execute("SELECT IP_Address FROM TrustedConnections")
-        trusted_ips = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        trusted_ips = [row[0] for row in self.database.query("SELECT IP_Address FROM TrustedConnections")]
         return trusted_ips
 
-    def block_IP(self, ip):
+    def run_command(self, args, timeout=None):
         try:
-            subprocess.check_call(f"netsh advfirewall firewall add rule name=\"Block {ip}\" dir=in interface=any action=block remoteip={ip}", shell=True)
-        except subprocess.CalledProcessError as e:
-            self.logger.log(f"Error blocking IP {ip}: {e}")
+            subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            self.logger.log(f"Command timed out after {timeout}s: {' '.join(args)}")
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.logger.log(f"Command failed: {' '.join(args)} - {str(e)}")
+        return False
+
+    def rule_exists(self, name, timeout=None):
+        try:
+            return subprocess.run(['netsh', 'advfirewall', 'firewall', 'show', 'rule', f"name={name}"],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout).returncode == 0
+        except subprocess.TimeoutExpired:
+            # Unknown, so don't add a second rule under the same name
+            return True
+        except OSError:
+            return False
+
+    def block_IPs(self, ips, timeout=None):
+        # New addresses are appended to the last rule, only the rules that changed are rewritten. A rule
+        # that already exists is updated in place with 'set rule ... new remoteip=', so when the update
+        # fails or times out the old rule, and every address already in it, stays as it was.
+        blocked = [row[0] for row in self.database.query("SELECT IP_Address FROM BlockedConnections ORDER BY id")]
+        known = set(blocked)
+        addresses = blocked + [ip for ip in dict.fromkeys(ips) if ip not in known]
+        first = len(blocked) // BLOCK_RULE_SIZE * BLOCK_RULE_SIZE
+        for start in range(first, len(addresses), BLOCK_RULE_SIZE):
+            name = f"{BLOCK_RULE_NAME} {start // BLOCK_RULE_SIZE + 1}"
+            remote_ips = ','.join(addresses[start:start + BLOCK_RULE_SIZE])
+            add_rule = ['netsh', 'advfirewall', 'firewall', 'add', 'rule', f"name={name}", 'dir=in', 'interface=any',
+                        'action=block', f"remoteip={remote_ips}"]
+            if start < len(blocked):
+                updated = self.run_command(['netsh', 'advfirewall', 'firewall', 'set', 'rule', f"name={name}", 'new',
+                                            f"remoteip={remote_ips}"], timeout)
+                # A rule deleted by hand is added again, one that is still there is never replaced
+                if not updated and not self.rule_exists(name, timeout):
+                    updated = self.run_command(add_rule, timeout)
+            else:
+                updated = self.run_command(add_rule, timeout)
+            if not updated:
+                self.logger.log(f"Error blocking IPs: {remote_ips}")
+                return False
+        return True
+
+    def block_IP(self, ip, timeout=None):
+        return self.block_IPs([ip], timeout)
     
     def remove_executable(self, file_path):
         os.remove(file_path)
+        return True
         
     def delete_registry_autorun(self, hive, subkey, name):
+        # hive is the hive name ('HKLM', 'HKCU') used by the autoruns tables
+        if self.registry is None:
+            self.registry = WinRegistry()
         try:
-            with winreg.OpenKey(hive, subkey, 0, winreg.KEY_SET_VALUE) as key:
-                winreg.DeleteValue(key, name)
-                self.logger.log(f"Deleted registry autorun entry {name}")
-        except WindowsError as e:
+            self.registry.delete_value(hive, subkey, name)
+            self.logger.log(f"Deleted registry autorun entry {name}")
+            return True
+        except OSError as e:
             self.logger.log(f"Error deleting registry autorun entry {name} with error: {str(e)}")
+            return False
             
-    def remove_users(self, username):
-        try:
-            # Using 'net user' command to delete the Guest account
-            os.system(f"net user {username} /active:no")
+    def remove_users(self, username, timeout=None):
+        # Disables the account with 'net user'
+        if self.run_command(['net', 'user', username, '/active:no'], timeout):
             self.logger.log(f"User '{username}' has been disabled")
-        except Exception as e:
-            self.logger.log(f"Error deleting user '{username}' with error: {str(e)}")
+            return True
+        self.logger.log(f"Error disabling user '{username}'")
+        return False
+
+
+class FakeActions:
+    # Stands in for Actions in tests and dry runs: records every call and fails the targets listed in `failing`.
+    # Never runs a command, the firewall rules are answered from the addresses blocked so far.
+    def __init__(self, failing=(), delay=0):
+        self.calls = []
+        self.failing = set(failing)
+        self.delay = delay
+        self.blocked = {}
+
+    def record(self, name, target, *args):
+        if self.delay:
+            time.sleep(self.delay)
+        self.calls.append((name, target) + args)
+        return target not in self.failing
+
+    def rule_exists(self, name, timeout=None):
+        # Rules are named and filled the same way Actions.block_IPs does it
+        rules = -(-len(self.blocked) // BLOCK_RULE_SIZE)
+        return name in {f"{BLOCK_RULE_NAME} {number}" for number in range(1, rules + 1)}
+
+    def block_IPs(self, ips, timeout=None):
+        ips = list(ips)
+        self.calls.append(('block_IPs', tuple(ips)))
+        if self.failing.intersection(ips):
+            return False
+        self.blocked.update(dict.fromkeys(ips))
+        return True
+
+    def remove_executable(self, file_path):
+        return self.record('remove_executable', file_path)
+
+    def delete_registry_autorun(self, hive, subkey, name):
+        return self.record('delete_registry_autorun', name, hive, subkey)
+
+    def remove_users(self, username, timeout=None):
+        return self.record('remove_users', username)
+
+
+class NullActions(FakeActions):
+    # Default firewall provider off Windows: every action is skipped and nothing is kept, since a
+    # long-running scanner would otherwise grow `calls` forever
+    def record(self, name, target, *args):
+        return SKIPPED
+
+    def block_IPs(self, ips, timeout=None):
+        return SKIPPED
@@ -0,0 +1,139 @@
+import time
+from collections import namedtuple
+
+Alert = namedtuple('Alert', ['source', 'severity', 'title', 'target', 'detail'])
+Alert.__new__.__defaults__ = (None, None)
+
+SEVERITY_LEVELS = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
+
+INSERT_ALERT = '''
+    INSERT INTO Alerts (Timestamp, Source, Severity, SeverityLevel, Title, Target, Detail)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Discrepancy tables folded into Alerts the first time the table is created, so history isn't lost
+BACKFILL = [
+    ('executables', 'ExecutableDiscrepancies', "'Executable ' || ChangeType", 'FilePath', 'md5Hash'),
+    ('accounts', 'AccountDiscrepancies', "'Account ' || ChangeType", 'UserName', 'SID'),
+    ('autoruns', 'AutorunDiscrepancies', "'Autorun ' || ChangeType", "Hive || '\\' || Subkey || '\\' || Name", 'Value'),
+    ('events', 'Highest_Sev_Highest_Conf', 'RuleName', 'MachineName', 'Message'),
+]
+
+
+class AlertStore:
+    # Single place detectors append alerts to. Triggers keep the one-row AlertCounter in step with
+    # Alerts, so the menu's unseen count is a primary key lookup rather than a COUNT(*).
+    def __init__(self, database):
+        self.database = database
+
+    def setup_database(self):
+        with self.database.writer().transaction() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Alerts'")
+            created = cursor.fetchone() is None
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS Alerts (
+                               id INTEGER PRIMARY KEY,
+                               Timestamp TEXT NOT NULL,
+                               Source TEXT NOT NULL,
+                               Severity TEXT NOT NULL,
+                               SeverityLevel INTEGER NOT NULL,
+                               Title TEXT NOT NULL,
+                               Target TEXT,
+                               Detail TEXT
+                            )
+                        ''')
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS AlertCounter (
+                               id INTEGER PRIMARY KEY CHECK (id = 1),
+                               Unseen INTEGER NOT NULL,
+                               LastSeenId INTEGER NOT NULL
+                            )
+                        ''')
+            cursor.execute("INSERT OR IGNORE INTO AlertCounter (id, Unseen, LastSeenId) VALUES (1, 0, 0)")
+            cursor.execute('''
+                           CREATE TRIGGER IF NOT EXISTS trg_Alerts_insert AFTER INSERT ON Alerts
+                           BEGIN
+                               UPDATE AlertCounter SET Unseen = Unseen + 1 WHERE id = 1;
+                           END
+                        ''')
+            cursor.execute('''
+                           CREATE TRIGGER IF NOT EXISTS trg_Alerts_delete AFTER DELETE ON Alerts
+                           BEGIN
+                               UPDATE AlertCounter SET Unseen = Unseen - 1 WHERE id = 1 AND OLD.id > LastSeenId;
+                           END
+                        ''')
+            # ids are assigned in time order, so these indexes (which end in the rowid) also serve ORDER BY id
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_Alerts_Timestamp ON Alerts (Timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_Alerts_Severity ON Alerts (SeverityLevel)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_Alerts_Source ON Alerts (Source)")
+            if created:
+                self.backfill(cursor)
+
+    def backfill(self, cursor):
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        for source, table, title, target, detail in BACKFILL:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            if cursor.fetchone() is None:
+                continue
+            severity = 'high'
+            cursor.execute(f'''
+                           INSERT INTO Alerts (Timestamp, Source, Severity, SeverityLevel, Title, Target, Detail)
+                           SELECT ?, ?, ?, ?, COALESCE({title}, '{source}'), {target}, {detail} FROM {table} ORDER BY id
+            ''', (timestamp, source, severity, SEVERITY_LEVELS[severity]))
+        # Alerts that existed before the table did count as already seen
+        cursor.execute("UPDATE AlertCounter SET Unseen = 0, LastSeenId = (SELECT COALESCE(MAX(id), 0) FROM Alerts) WHERE id = 1")
+
+    def row(self, alert, timestamp):
+        severity = alert.severity if alert.severity in SEVERITY_LEVELS else 'high'
+        return (timestamp, alert.source, severity, SEVERITY_LEVELS[severity], alert.title, alert.target, alert.detail)
+
+    def add(self, source, severity, title, target=None, detail=None, writer=None):
+        self.add_many([Alert(source, severity, title, target, detail)], writer)
+
+    def add_many(self, alerts, writer=None):
+        # Pass the detector's BatchWriter to write the alerts in the same batch as its own rows
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        rows = [self.row(alert, timestamp) for alert in alerts]
+        if not rows:
+            return
+        if writer is not None:
+            writer.add_many(INSERT_ALERT, rows)
+            return
+        with self.database.writer() as writer:
+            writer.add_many(INSERT_ALERT, rows)
+
+    def unseen_count(self):
+        rows = self.database.query("SELECT Unseen FROM AlertCounter WHERE id = 1")
+        return rows[0][0] if rows else 0
+
+    def mark_seen(self, last_id=None):
+        # last_id is the newest alert that was shown, anything that arrived after it stays unseen
+        if last_id is None:
+            last_id = self.database.query("SELECT COALESCE(MAX(id), 0) FROM Alerts")[0][0]
+        self.database.execute('''
+            UPDATE AlertCounter
+            SET Unseen = Unseen - (SELECT COUNT(*) FROM Alerts WHERE id > AlertCounter.LastSeenId AND id <= ?), LastSeenId = ?
+            WHERE id = 1 AND LastSeenId < ?
+        ''', (last_id, last_id, last_id))
+
+    def recent(self, limit=50, min_severity=None, source=None, since=None, before_id=None):
+        # Newest first, before_id pages backwards from the last row of the previous page
+        conditions = []
+        params = []
+        if min_severity is not None:
+            conditions.append("SeverityLevel >= ?")
+            params.append(SEVERITY_LEVELS[min_severity])
+        if source is not None:
+            conditions.append("Source = ?")
+            params.append(source)
+        if since is not None:
+            conditions.append("Timestamp >= ?")
+            params.append(since)
+        if before_id is not None:
+            conditions.append("id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return self.database.query(f'''
+            SELECT id, Timestamp, Source, Severity, Title, Target, Detail FROM Alerts
+            {where} ORDER BY id DESC LIMIT ?
+        ''', params + [limit])
@@ -1,83 +1,78 @@
-import sqlite3
+from database import get_database
+from hashing import DIGEST_COLUMNS
 
 class Analysis:
-    def __init__(self, db_path='Valkrie.db'):
+    def __init__(self, db_path='GuardianAngel.db'):
         self.db_path = db_path
+        self.database = get_database(db_path)
 
-    def _connect_db(self):
-        return sqlite3.connect(self.db_path)
+    def find_executable_discrepancies(self, cursor=None, paths=None):
+        # paths limits the diff to those files, for the watcher's incremental scans
+        return self._find_discrepancies(cursor, 'BaselineExecutables', 'CurrentExecutables', ['FilePath'], ['md5Hash'],
+                                        ['FileName', 'FilePath'] + list(DIGEST_COLUMNS.values()), 'ExecutableDiscrepancies', paths)
 
-    def find_executable_discrepancies(self):
-        conn = self._connect_db()
-        cursor = conn.cursor()
+    def find_account_discrepancies(self, cursor=None):
+        return self._find_discrepancies(cursor, 'BaselineAccounts', 'CurrentAccounts', ['UserName'], ['SID', 'Flags', 'RID'],
+                                        ['SID', 'UserName', 'FullName', 'Flags', 'RID'], 'AccountDiscrepancies')
 
-        # Create the ExecutableDiscrepancies table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ExecutableDiscrepancies (
-                id INTEGER PRIMARY KEY,
-                FileName TEXT NOT NULL,
-                FilePath TEXT NOT NULL,
-                md5Hash TEXT NOT NULL,
-                Table TEXT NOT NULL
-            )
-        ''')
+    def _find_discrepancies(self, cursor, baseline_table, current_table, key_columns, compare_columns, columns, discrepancy_table,
+                            keys=None):
+        # Callers that already hold a write transaction pass their cursor in so the diff runs inside it
+        if cursor is not None:
+            return self._compare_tables(cursor, baseline_table, current_table, key_columns, compare_columns, columns, discrepancy_table, keys)
 
-        self._compare_tables(cursor, 'BaselineExecutables', 'CurrentExecutables', ['FileName', 'FilePath', 'md5Hash'], 'ExecutableDiscrepancies')
-        
-        conn.commit()
-        conn.close()
+        with self.database.writer().transaction() as cursor:
+            return self._compare_tables(cursor, baseline_table, current_table, key_columns, compare_columns, columns, discrepancy_table, keys)
 
-    def find_account_discrepancies(self):
-        conn = self._connect_db()
-        cursor = conn.cursor()
+    def diff_query(self, baseline_table, current_table, key_columns, compare_columns, columns, scope=None):
+        # Added and modified rows come from one LEFT JOIN of the current snapshot onto the baseline,
+        # removed rows from the reverse join. Both joins are served by the (key, compare) indexes.
+        join = ' AND '.join(f"b.{col} = c.{col}" for col in key_columns)
+        changed = ' OR '.join(f"b.{col} IS NOT c.{col}" for col in compare_columns) or '0'
+        key = key_columns[0]
+        # scope names a table of keys, only those rows are compared
+        current_scope = f"AND c.{key} IN (SELECT {key} FROM {scope})" if scope else ''
+        baseline_scope = f"AND b.{key} IN (SELECT {key} FROM {scope})" if scope else ''
+        return f'''
+            SELECT CASE WHEN b.{key} IS NULL THEN 'added' ELSE 'modified' END AS ChangeType,
+                   {', '.join(f"c.{col}" for col in columns)}
+            FROM {current_table} c LEFT JOIN {baseline_table} b ON {join}
+            WHERE (b.{key} IS NULL OR {changed}) {current_scope}
+            UNION ALL
+            SELECT 'removed', {', '.join(f"b.{col}" for col in columns)}
+            FROM {baseline_table} b LEFT JOIN {current_table} c ON {join}
+            WHERE c.{key} IS NULL {baseline_scope}
+        '''
 
-        # Create the AccountDiscrepancies table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS AccountDiscrepancies (
-                id INTEGER PRIMARY KEY,
-                UserName TEXT NOT NULL,
-                LastLogon TEXT,
-                Table TEXT NOT NULL
-            )
+    def _compare_tables(self, cursor, baseline_table, current_table, key_columns, compare_columns, columns, discrepancy_table,
+                        keys=None):
+        # Returns only the discrepancies that weren't already recorded, after recording them
+        columns_str = ', '.join(['ChangeType'] + columns)
+        scope = None
+        if keys is not None:
+            scope = 'temp.DiffScope'
+            cursor.execute('DROP TABLE IF EXISTS temp.DiffScope')
+            cursor.execute(f"CREATE TEMP TABLE DiffScope ({key_columns[0]} TEXT PRIMARY KEY)")
+            cursor.executemany("INSERT OR IGNORE INTO temp.DiffScope VALUES (?)", [(key,) for key in keys])
+        cursor.execute('DROP TABLE IF EXISTS temp.SnapshotDiff')
+        cursor.execute(f"CREATE TEMP TABLE SnapshotDiff AS {self.diff_query(baseline_table, current_table, key_columns, compare_columns, columns, scope)}")
+        cursor.execute(f'''
+            SELECT {columns_str} FROM temp.SnapshotDiff
+            EXCEPT
+            SELECT {columns_str} FROM {discrepancy_table}
         ''')
+        discrepancies = cursor.fetchall()
+        placeholders = ', '.join(['?'] * (len(columns) + 1))
+        cursor.executemany(f"INSERT INTO {discrepancy_table} ({columns_str}) VALUES ({placeholders})", discrepancies)
+        cursor.execute('DROP TABLE temp.SnapshotDiff')
+        if scope is not None:
+            cursor.execute('DROP TABLE temp.DiffScope')
+        return discrepancies
 
-        self._compare_tables(cursor, 'BaselineAccounts', 'CurrentAccounts', ['UserName', 'LastLogon'], 'AccountDiscrepancies')
-        
-        conn.commit()
-        conn.close()
-
-    def _compare_tables(self, cursor, table1, table2, columns, discrepancy_table):
-        # Find discrepancies in table1 not in table2
-        columns_str = ', '.join(columns)
-        placeholders = ', '.join(['?'] * len(columns))
-        query = f'''
-            INSERT INTO {discrepancy_table} ({columns_str}, Table)
-            SELECT {columns_str}, '{table1}'
-            FROM {table1}
-            WHERE NOT EXISTS (
-                SELECT 1 FROM {table2} WHERE
-                { ' AND '.join([f"{table1}.{col} = {table2}.{col}" for col in columns]) }
-            )
-        '''
-        cursor.execute(query)
-
-        # Find discrepancies in table2 not in table1
-        query = f'''
-            INSERT INTO {discrepancy_table} ({columns_str}, Table)
-            SELECT {columns_str}, '{table2}'
-            FROM {table2}
-            WHERE NOT EXISTS (
-                SELECT 1 FROM {table1} WHERE
-                { ' AND '.join([f"{table2}.{col} = {table1}.{col}" for col in columns]) }
-            )
-        '''
-        cursor.execute(query)
-        
-    def get_discrepancies():
-        analysis.find_executable_discrepancies()
-        analysis.find_account_discrepancies()
+    def get_discrepancies(self):
+        self.find_executable_discrepancies()
+        self.find_account_discrepancies()
 
 if __name__ == "__main__":
     analysis = Analysis()
     analysis.get_discrepancies()
-
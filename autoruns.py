@@ -0,0 +1,246 @@
+import os
+from collections import namedtuple
+from hashing import compute_md5
+
+# One persistence entry, (Hive, Subkey, Name, Value) is its identity in the Autoruns tables.
+# Registry entries use the hive name, startup folder files use 'FILE' and scheduled tasks 'TASK'.
+AutorunEntry = namedtuple('AutorunEntry', ['hive', 'subkey', 'name', 'value'])
+
+# kind 'values' reads every value under the key (or only `names`), kind 'subkeys' reads `names`
+# from each direct subkey, e.g. the ImagePath of every service. Only removable locations have their
+# values deleted on a change: each value of a Run-style key is a program of its own, whereas deleting
+# Winlogon Shell/Userinit or BootExecute would stop the machine booting or logging on.
+AutorunLocation = namedtuple('AutorunLocation', ['hive', 'subkey', 'kind', 'names', 'removable'])
+AutorunLocation.__new__.__defaults__ = (False,)
+
+AUTORUN_LOCATIONS = [
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows\CurrentVersion\Run', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows\CurrentVersion\RunOnce', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows\CurrentVersion\RunServices', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows\CurrentVersion\RunServicesOnce', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows\CurrentVersion\Policies\Explorer\Run', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\Run', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Wow6432Node\Microsoft\Windows\CurrentVersion\RunOnce', 'values', None, True),
+    AutorunLocation('HKCU', r'Software\Microsoft\Windows\CurrentVersion\Run', 'values', None, True),
+    AutorunLocation('HKCU', r'Software\Microsoft\Windows\CurrentVersion\RunOnce', 'values', None, True),
+    AutorunLocation('HKCU', r'Software\Microsoft\Windows\CurrentVersion\Policies\Explorer\Run', 'values', None, True),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Winlogon', 'values',
+                    ('Shell', 'Userinit', 'Taskman', 'AppSetup')),
+    AutorunLocation('HKCU', r'Software\Microsoft\Windows NT\CurrentVersion\Winlogon', 'values', ('Shell',)),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Windows', 'values',
+                    ('AppInit_DLLs', 'LoadAppInit_DLLs')),
+    AutorunLocation('HKCU', r'Software\Microsoft\Windows NT\CurrentVersion\Windows', 'values', ('Load', 'Run')),
+    AutorunLocation('HKLM', r'SYSTEM\CurrentControlSet\Control\Session Manager', 'values', ('BootExecute',)),
+    AutorunLocation('HKLM', r'SYSTEM\CurrentControlSet\Services', 'subkeys', ('ImagePath', 'ServiceDll')),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Image File Execution Options', 'subkeys',
+                    ('Debugger',)),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Winlogon\Notify', 'subkeys', ('DllName',)),
+    AutorunLocation('HKLM', r'SOFTWARE\Microsoft\Active Setup\Installed Components', 'subkeys', ('StubPath',)),
+]
+
+STARTUP_FOLDERS = [
+    r'%ProgramData%\Microsoft\Windows\Start Menu\Programs\StartUp',
+    r'%APPDATA%\Microsoft\Windows\Start Menu\Programs\Startup',
+]
+
+TASK_FOLDERS = [
+    r'%SystemRoot%\System32\Tasks',
+]
+
+TASK_NAMESPACE = '{http://schemas.microsoft.com/windows/2004/02/mit/task}'
+
+
+def format_value(value):
+    # Registry data comes back as str, int, bytes or a list for REG_MULTI_SZ, it's stored as text
+    if isinstance(value, (list, tuple)):
+        return '\n'.join(str(item) for item in value)
+    if isinstance(value, bytes):
+        return value.hex()
+    return '' if value is None else str(value)
+
+
+class RegistryBackend:
+    # Minimal registry interface the autoruns collector needs, hives are named 'HKLM'/'HKCU'
+    def values(self, hive, subkey):
+        raise NotImplementedError
+
+    def subkeys(self, hive, subkey):
+        raise NotImplementedError
+
+    def delete_value(self, hive, subkey, name):
+        raise NotImplementedError
+
+
+class WinRegistry(RegistryBackend):
+    def __init__(self):
+        import winreg
+        self.winreg = winreg
+        self.hives = {'HKLM': winreg.HKEY_LOCAL_MACHINE, 'HKCU': winreg.HKEY_CURRENT_USER}
+
+    def values(self, hive, subkey):
+        # Missing keys read as empty, permission errors propagate so the caller can log them
+        data = []
+        try:
+            with self.winreg.OpenKey(self.hives[hive], subkey) as key:
+                i = 0
+                while True:
+                    try:
+                        name, value, _ = self.winreg.EnumValue(key, i)
+                    except OSError:
+                        break
+                    data.append((name, value))
+                    i += 1
+        except FileNotFoundError:
+            pass
+        return data
+
+    def subkeys(self, hive, subkey):
+        names = []
+        try:
+            with self.winreg.OpenKey(self.hives[hive], subkey) as key:
+                i = 0
+                while True:
+                    try:
+                        names.append(self.winreg.EnumKey(key, i))
+                    except OSError:
+                        break
+                    i += 1
+        except FileNotFoundError:
+            pass
+        return names
+
+    def delete_value(self, hive, subkey, name):
+        with self.winreg.OpenKey(self.hives[hive], subkey, 0, self.winreg.KEY_SET_VALUE) as key:
+            self.winreg.DeleteValue(key, name)
+
+
+class FakeRegistry(RegistryBackend):
+    # In-memory registry for running the autoruns logic off Windows.
+    # keys maps (hive, subkey) to {name: value}, key names are matched case-insensitively like Windows.
+    def __init__(self, keys=None):
+        self.keys = {}
+        for (hive, subkey), values in (keys or {}).items():
+            self.set_values(hive, subkey, values)
+
+    @staticmethod
+    def normalise(hive, subkey):
+        return hive.upper(), subkey.strip('\\').lower()
+
+    def set_values(self, hive, subkey, values):
+        self.keys.setdefault(self.normalise(hive, subkey), {}).update(values)
+
+    def values(self, hive, subkey):
+        return list(self.keys.get(self.normalise(hive, subkey), {}).items())
+
+    def subkeys(self, hive, subkey):
+        hive, subkey = self.normalise(hive, subkey)
+        prefix = subkey + '\\'
+        names = set()
+        for key_hive, key in self.keys:
+            if key_hive == hive and key.startswith(prefix):
+                names.add(key[len(prefix):].split('\\', 1)[0])
+        return sorted(names)
+
+    def delete_value(self, hive, subkey, name):
+        try:
+            del self.keys[self.normalise(hive, subkey)][name]
+        except KeyError:
+            raise FileNotFoundError(f"{hive}\\{subkey}\\{name}")
+
+
+class AutorunCollector:
+    # Reads every persistence location into a set of AutorunEntry, so a baseline comparison is a set difference
+    def __init__(self, registry, locations=AUTORUN_LOCATIONS, startup_folders=STARTUP_FOLDERS, task_folders=TASK_FOLDERS,
+                 logger=None):
+        self.registry = registry
+        self.locations = list(locations)
+        self.startup_folders = [os.path.expandvars(folder) for folder in startup_folders]
+        self.task_folders = [os.path.expandvars(folder) for folder in task_folders]
+        self.logger = logger
+        # Values of Run-style keys can be deleted on their own, everything else is only reported
+        self.removable_keys = {(location.hive, location.subkey) for location in self.locations
+                               if location.kind == 'values' and location.removable}
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def is_removable(self, entry):
+        return (entry.hive, entry.subkey) in self.removable_keys
+
+    def collect(self):
+        entries = set()
+        for location in self.locations:
+            try:
+                entries.update(self.registry_entries(location))
+            except OSError as e:
+                self.log(f"Error reading autoruns from {location.hive}\\{location.subkey}: {str(e)}")
+        for folder in self.startup_folders:
+            entries.update(self.startup_entries(folder))
+        for folder in self.task_folders:
+            entries.update(self.task_entries(folder))
+        return entries
+
+    def registry_entries(self, location):
+        if location.kind == 'values':
+            for name, value in self.registry.values(location.hive, location.subkey):
+                if location.names is None or name in location.names:
+                    yield AutorunEntry(location.hive, location.subkey, name, format_value(value))
+            return
+
+        for child in self.registry.subkeys(location.hive, location.subkey):
+            subkey = f"{location.subkey}\\{child}"
+            try:
+                values = self.registry.values(location.hive, subkey)
+            except OSError:
+                continue
+            for name, value in values:
+                if name in location.names:
+                    yield AutorunEntry(location.hive, subkey, name, format_value(value))
+
+    def startup_entries(self, folder):
+        # Startup folder items are identified by content, so a replaced shortcut shows up as a change
+        try:
+            with os.scandir(folder) as entries:
+                files = [entry for entry in entries if entry.is_file(follow_symlinks=False)]
+        except OSError:
+            return
+        for entry in files:
+            if entry.name.lower() == 'desktop.ini':
+                continue
+            try:
+                yield AutorunEntry('FILE', folder, entry.name, compute_md5(entry.path))
+            except OSError as e:
+                self.log(f"Error reading startup item: {entry.path} - {str(e)}")
+
+    def task_entries(self, folder):
+        stack = [folder]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                yield AutorunEntry('TASK', os.path.relpath(directory, folder), entry.name, self.task_action(entry.path))
+
+    def task_action(self, path):
+        # The Exec actions are what matter for persistence, other task types fall back to the file hash
+        import xml.etree.ElementTree as ET
+        try:
+            root = ET.parse(path).getroot()
+        except (OSError, ET.ParseError):
+            try:
+                return compute_md5(path)
+            except OSError:
+                return ''
+        commands = []
+        for exec_element in root.iter(f"{TASK_NAMESPACE}Exec"):
+            command = exec_element.findtext(f"{TASK_NAMESPACE}Command") or ''
+            arguments = exec_element.findtext(f"{TASK_NAMESPACE}Arguments") or ''
+            commands.append(f"{command} {arguments}".strip())
+        return '\n'.join(commands) if commands else compute_md5(path)
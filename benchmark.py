@@ -0,0 +1,458 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from hashing import FileHasher, HashingPipeline, compute_md5
+from walker import EXECUTABLE_EXTENSIONS, ExecutableWalker
+from database import Database
+from connections import FakeConnectionSource, ProcNetSource
+from logger import Logger
+from accounts import Account, FakeAccountProvider
+from actions import FakeActions
+from autoruns import FakeRegistry
+from event_ingestion import FileEventSource
+from scanner import Scanner
+
+
+def build_synthetic_tree(root, file_count, min_size=4 * 1024, max_size=4 * 1024 * 1024, seed=1337):
+    # Creates file_count .exe files spread over nested directories with random sizes
+    rng = random.Random(seed)
+    paths = []
+    for i in range(file_count):
+        directory = os.path.join(root, f"dir{i % 32}", f"sub{i % 7}")
+        os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, f"file{i}.exe")
+        with open(file_path, 'wb') as file:
+            file.write(rng.randbytes(rng.randint(min_size, max_size)))
+        paths.append(file_path)
+    return paths
+
+
+def bench_walker(root, repeat=3):
+    walker = ExecutableWalker()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = sum(1 for _ in walker.walk(root))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return found, found / best
+
+
+def bench_hashing_workers(paths, worker_counts):
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    results = []
+    for workers in worker_counts:
+        pipeline = HashingPipeline(compute_md5, workers=workers)
+        start = time.perf_counter()
+        hashed = sum(1 for _ in pipeline.run((path,) for path in paths))
+        elapsed = time.perf_counter() - start
+        results.append((workers, hashed / elapsed, total_bytes / elapsed / (1024 * 1024)))
+    return results
+
+
+SIZE_BUCKETS = [4 * 1024, 256 * 1024, 8 * 1024 * 1024, 64 * 1024 * 1024]
+
+
+def bench_read_strategies(root, buffer_size, bucket_bytes=128 * 1024 * 1024):
+    # Hashes the same files with every read strategy, plus the old 64K file.read loop for reference
+    hasher = FileHasher(('md5',), buffer_size=buffer_size)
+    results = []
+    for size in SIZE_BUCKETS:
+        directory = os.path.join(root, f"bucket{size}")
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for i in range(max(1, min(2000, bucket_bytes // size))):
+            file_path = os.path.join(directory, f"file{i}.dll")
+            with open(file_path, 'wb') as file:
+                file.write(os.urandom(size))
+            paths.append(file_path)
+
+        strategies = [('read64k', compute_md5)]
+        strategies += [(strategy, lambda path, strategy=strategy: hasher.digest(path, strategy=strategy))
+                       for strategy in FileHasher.STRATEGIES]
+        for name, func in strategies:
+            start = time.perf_counter()
+            for path in paths:
+                func(path)
+            elapsed = time.perf_counter() - start
+            results.append((size, name, len(paths) * size / elapsed / (1024 * 1024)))
+    return results
+
+
+def bench_sqlite_writer(root, rows=20000):
+    # Old pattern (commit per row on a default connection) against the batched WAL writer
+    insert = 'INSERT INTO BaselineExecutables (FileName, FilePath, md5Hash) VALUES (?, ?, ?)'
+    schema = 'CREATE TABLE BaselineExecutables (id INTEGER PRIMARY KEY, FileName TEXT, FilePath TEXT, md5Hash TEXT)'
+    data = [(f"file{i}.exe", f"C:\\bench\\file{i}.exe", f"{i:032x}") for i in range(rows)]
+
+    per_row_rows = min(rows, 2000)
+    conn = sqlite3.connect(os.path.join(root, 'per_row.db'))
+    conn.execute(schema)
+    start = time.perf_counter()
+    for row in data[:per_row_rows]:
+        conn.execute(insert, row)
+        conn.commit()
+    per_row = per_row_rows / (time.perf_counter() - start)
+    conn.close()
+
+    database = Database(os.path.join(root, 'batched.db'))
+    database.execute(schema)
+    start = time.perf_counter()
+    with database.writer() as writer:
+        writer.add_many(insert, data)
+    batched = rows / (time.perf_counter() - start)
+    database.close()
+    return per_row, batched
+
+
+def bench_proc_net(root, sockets=100000):
+    # Writes a synthetic /proc/net/tcp with the given number of sockets and times parsing it
+    net = os.path.join(root, 'proc', 'net')
+    os.makedirs(net, exist_ok=True)
+    with open(os.path.join(net, 'tcp'), 'w') as file:
+        file.write("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n")
+        for i in range(sockets):
+            file.write(f"{i:4}: 0100007F:{i % 65535:04X} {i:08X}:01BB 01 00000000:00000000 00:00000000 00000000  1000        0 {100000 + i} 1\n")
+    source = ProcNetSource(root=os.path.join(root, 'proc'))
+    start = time.perf_counter()
+    parsed = sum(1 for _ in source.connections())
+    return parsed, parsed / (time.perf_counter() - start)
+
+
+def bench_logging(root, files=20000):
+    # The old four synchronous lines per hashed file against one file_hashed event through the queue
+    sync_logger = logging.getLogger('mc_hammer_bench_sync')
+    sync_logger.propagate = False
+    sync_logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(os.path.join(root, 'sync.log'))
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    sync_logger.addHandler(handler)
+    start = time.perf_counter()
+    for i in range(files):
+        sync_logger.info(f"File Name: file{i}.exe")
+        sync_logger.info(f"File Path: C:\\bench\\file{i}.exe")
+        sync_logger.info(f"MD5 Hash: {i:032x}")
+        sync_logger.info('-' * 50)
+    synchronous = (time.perf_counter() - start) / files
+    sync_logger.removeHandler(handler)
+    handler.close()
+
+    logger = Logger(os.path.join(root, 'queued.log'))
+    results = [('synchronous, 4 lines', synchronous)]
+    for label, level in (('queued, DEBUG off', logging.INFO), ('queued, DEBUG sampled', logging.DEBUG)):
+        logger.set_level(level)
+        start = time.perf_counter()
+        for i in range(files):
+            logger.event('file_hashed', logging.DEBUG, path=f"C:\\bench\\file{i}.exe", md5=f"{i:032x}")
+        results.append((label, (time.perf_counter() - start) / files))
+    logger.set_level(logging.INFO)
+    return results
+
+
+COLD_START = """
+import time
+start = time.perf_counter()
+import menu
+menu.Menu()
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def bench_cold_start(runs=11):
+    # Times 'import menu' plus Menu() in fresh interpreters and charges each module's import time to the
+    # repository module that first pulled it in, which is where the startup time actually goes
+    repo = os.path.dirname(os.path.abspath(__file__))
+    project = {name[:-3] for name in os.listdir(repo) if name.endswith('.py')}
+    workdir = tempfile.mkdtemp(prefix='mc_hammer_cold_')
+    totals = []
+    costs = {}
+    pulled = {}
+    try:
+        for run in range(runs):
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', COLD_START], cwd=workdir, capture_output=True,
+                                    text=True, check=True, env=dict(os.environ, PYTHONPATH=repo))
+            totals.append(float(result.stdout.split()[-1]))
+            # importtime prints children before their parent, read backwards the parents come first
+            stack = []
+            for line in reversed(result.stderr.splitlines()):
+                if not line.startswith('import time:') or 'self [us]' in line:
+                    continue
+                self_us, cumulative_us, name = line[len('import time:'):].split('|')
+                depth = (len(name) - len(name.lstrip())) // 2
+                name = name.strip()
+                del stack[depth:]
+                stack.append(name)
+                owner = next((module for module in reversed(stack) if module in project), 'interpreter')
+                costs.setdefault(owner, []).append(int(self_us) / 1000)
+                if name not in project and len(stack) > 1 and stack[-2] == owner:
+                    modules = pulled.setdefault(owner, {})
+                    modules[name] = modules.get(name, 0) + int(cumulative_us) / 1000 / runs
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    by_module = [(ms, owner, sorted(pulled.get(owner, {}).items(), key=lambda item: -item[1])[:3])
+                 for ms, owner in sorted(((sum(times) / runs, owner) for owner, times in costs.items()), reverse=True)]
+    return sorted(totals)[runs // 2], by_module
+
+
+# End-to-end runs: every Scanner stage against synthetic fixtures, one process per scale so each
+# gets its own peak RSS and database. Stage numbers come from the scanner's own metrics registry.
+END_TO_END_SCALES = [1000, 10000]
+OTHER_EXTENSIONS = ['.txt', '.dat', '.png', '.log', '.json']
+RUN_KEY = r'SOFTWARE\Microsoft\Windows\CurrentVersion\Run'
+LSASS_HIT = {'ObjectType': 'Process', 'ObjectName': r'\Device\HarddiskVolume2\Windows\System32\lsass.exe',
+             'AccessMask': '0x1010', 'SubjectUserName': 'mallory', 'ProcessName': r'C:\Users\mallory\dump.exe'}
+
+
+def build_fixture_tree(root, file_count, executable_ratio=0.3, median_size=64 * 1024, max_size=16 * 1024 * 1024, seed=1337):
+    # Log-normal sizes (mostly small files with a long tail), only executable_ratio of the files have
+    # an extension the walker picks up. Returns the executable paths.
+    rng = random.Random(seed)
+    executables = []
+    for i in range(file_count):
+        directory = os.path.join(root, f"dir{i % 64}", f"sub{i % 11}")
+        os.makedirs(directory, exist_ok=True)
+        is_executable = rng.random() < executable_ratio
+        extension = rng.choice(sorted(EXECUTABLE_EXTENSIONS) if is_executable else OTHER_EXTENSIONS)
+        file_path = os.path.join(directory, f"file{i}{extension}")
+        size = min(max_size, int(rng.lognormvariate(0, 1.5) * median_size))
+        with open(file_path, 'wb') as file:
+            file.write(rng.randbytes(size))
+        if is_executable:
+            executables.append(file_path)
+    return executables
+
+
+def fake_accounts(count, start=0):
+    return [Account(f"S-1-5-21-1000-{1000 + i}", f"user{i}", f"User {i}", 0x0200, 1000 + i) for i in range(start, start + count)]
+
+
+def fake_autoruns(count, start=0):
+    return {f"App{i}": f"C:\\Program Files\\App{i}\\app{i}.exe" for i in range(start, start + count)}
+
+
+def fake_connections(count, seed=1337):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        remote = '127.0.0.1' if i % 4 == 0 else f"{rng.randint(11, 200)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        records.append(('TCP', '10.0.0.5', 49152 + i % 16000, remote, 443, 'ESTABLISHED', 1000 + i % 500))
+    return records
+
+
+def write_event_log(path, count, first_record=1, hit_ratio=0.01, seed=1337):
+    # Security log export in the FileEventSource format, hit_ratio of the events match the LSASS rule
+    rng = random.Random(seed + first_record)
+    with open(path, 'a', encoding='utf-8') as file:
+        for record_id in range(first_record, first_record + count):
+            data = dict(LSASS_HIT) if rng.random() < hit_ratio else {
+                'ObjectType': 'File', 'ObjectName': f"C:\\Users\\user\\doc{record_id}.txt", 'AccessMask': '0x1',
+                'SubjectUserName': 'user', 'ProcessName': r'C:\Windows\explorer.exe'}
+            file.write(json.dumps({'TimeCreated': '2024-01-01T00:00:00', 'Id': 4663, 'RecordId': record_id, 'ProcessId': 4,
+                                   'MachineName': 'BENCH', 'Message': 'An attempt was made to access an object.',
+                                   'EventData': data}) + '\n')
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def stage_results(runs, prefix):
+    results = {}
+    for run in runs:
+        seconds = run['elapsed']
+        results[f"{prefix}.{run['name']}"] = {
+            'seconds': round(seconds, 6),
+            'items': run['items'],
+            'bytes': run['bytes'],
+            'rows': run['rows'],
+            'errors': run['errors'],
+            'items_per_sec': round(run['items'] / seconds, 1) if seconds else None,
+            'mb_per_sec': round(run['bytes'] / seconds / (1024 * 1024), 2) if seconds and run['bytes'] else None,
+        }
+    return results
+
+
+def run_end_to_end(workdir, file_count, seed=1337):
+    # Baseline, then a 1% change set, then the current scans, the diff and a continuous cycle
+    os.chdir(workdir)
+    rng = random.Random(seed)
+    tree = os.path.join(workdir, 'tree')
+    executables = build_fixture_tree(tree, file_count, seed=seed)
+    scale = max(10, file_count // 100)
+    accounts = FakeAccountProvider(fake_accounts(scale))
+    registry = FakeRegistry({('HKLM', RUN_KEY): fake_autoruns(scale)})
+    events_path = os.path.join(workdir, 'events.jsonl')
+    write_event_log(events_path, file_count)
+    scanner = Scanner('GuardianAngel.db', registry=registry, account_provider=accounts, actions=FakeActions(),
+                      connection_source=FakeConnectionSource(fake_connections(scale * 10, seed)),
+                      event_source=FileEventSource(events_path), watch=False, metrics_path=None)
+    metrics = scanner.metrics
+
+    scanner.Baseline_Scan(tree)
+    results = stage_results(metrics.last_runs(kind='stage'), 'baseline')
+    seen = len(metrics.last_runs(kind='stage'))
+
+    changed = max(1, len(executables) // 100)
+    for file_path in rng.sample(executables, changed * 2)[:changed]:
+        with open(file_path, 'ab') as file:
+            file.write(b'changed')
+    for file_path in rng.sample(executables, changed):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    for i in range(changed):
+        with open(os.path.join(tree, f"new{i}.exe"), 'wb') as file:
+            file.write(rng.randbytes(4096))
+    accounts.set_accounts(fake_accounts(scale) + fake_accounts(max(1, scale // 100), start=scale))
+    registry.set_values('HKLM', RUN_KEY, fake_autoruns(max(1, scale // 100), start=scale))
+    write_event_log(events_path, max(1, file_count // 10), first_record=file_count + 1)
+
+    with metrics.stage('executables'):
+        scanner.CurrentExecutables_Scan(tree)
+    with metrics.stage('executables_unchanged'):
+        scanner.CurrentExecutables_Scan(tree)
+    with metrics.stage('executable_diff'):
+        scanner.analysis.find_executable_discrepancies()
+    scanner.Continuous_Scan()
+    scanner.responses.join()
+    results.update(stage_results(metrics.last_runs(kind='stage')[seen:], 'current'))
+    scanner.responses.stop()
+    return {'files': file_count, 'executables': len(executables), 'peak_rss_mb': peak_rss_mb(), 'stages': results}
+
+
+def bench_end_to_end(scales, keep=False):
+    results = []
+    for file_count in scales:
+        workdir = tempfile.mkdtemp(prefix=f"mc_hammer_e2e_{file_count}_")
+        try:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--end-to-end-scale', str(file_count),
+                                     '--workdir', workdir], check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        finally:
+            if not keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(), 'scales': results}
+
+
+def compare_results(baseline, current, threshold=1.25, min_seconds=0.05):
+    # Returns (scale, stage, old seconds, new seconds) for every stage that got slower than threshold x
+    old = {(scale['files'], name): stage['seconds'] for scale in baseline['scales'] for name, stage in scale['stages'].items()}
+    regressions = []
+    for scale in current['scales']:
+        for name, stage in scale['stages'].items():
+            before = old.get((scale['files'], name))
+            if before is not None and max(before, stage['seconds']) >= min_seconds and stage['seconds'] > before * threshold:
+                regressions.append((scale['files'], name, before, stage['seconds']))
+    return regressions
+
+
+def print_end_to_end(results):
+    for scale in results['scales']:
+        rss = f"{scale['peak_rss_mb']:.1f} MB" if scale['peak_rss_mb'] is not None else "n/a"
+        print(f"{scale['files']} files ({scale['executables']} executables), peak RSS {rss}")
+        print(f"{'stage':<34} {'seconds':>10} {'items':>8} {'items/sec':>12} {'MB/sec':>8} {'rows':>8}")
+        for name, stage in scale['stages'].items():
+            print(f"{name:<34} {stage['seconds']:>10.4f} {stage['items']:>8} {stage['items_per_sec'] or 0:>12.1f} "
+                  f"{stage['mb_per_sec'] or 0:>8.1f} {stage['rows']:>8}")
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MC-Hammer scanner benchmarks")
+    parser.add_argument('--files', type=int, default=500)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--buffer-size', type=int, default=1024 * 1024)
+    parser.add_argument('--skip-strategies', action='store_true', help="Skip the read strategy micro-benchmark")
+    parser.add_argument('--keep', action='store_true', help="Keep the synthetic tree after the run")
+    parser.add_argument('--end-to-end', action='store_true', help="Run every scan stage against synthetic fixtures instead")
+    parser.add_argument('--scales', type=int, nargs='+', default=END_TO_END_SCALES, help="File counts for --end-to-end")
+    parser.add_argument('--output', help="Write the --end-to-end results to this JSON file")
+    parser.add_argument('--baseline', help="Compare the --end-to-end results against an earlier JSON file")
+    parser.add_argument('--threshold', type=float, default=1.25, help="Slowdown factor reported as a regression")
+    parser.add_argument('--cold-start', action='store_true', help="Time 'import menu' plus Menu() and break it down by module")
+    parser.add_argument('--end-to-end-scale', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.end_to_end_scale is not None:
+        # Child process for one scale, the result is the last line of stdout
+        print(json.dumps(run_end_to_end(args.workdir, args.end_to_end_scale)))
+        return
+
+    if args.cold_start:
+        median, by_module = bench_cold_start()
+        print(f"Cold start: {median:.1f} ms median for import menu and Menu()")
+        print(f"{'module':>16} {'ms':>8}  (own import plus the modules it pulled in first)")
+        for ms, owner, heaviest in by_module:
+            if ms >= 0.5:
+                print(f"{owner:>16} {ms:>8.1f}  {', '.join(f'{name} {module_ms:.1f}' for name, module_ms in heaviest)}")
+        return
+
+    if args.end_to_end:
+        results = bench_end_to_end(args.scales, args.keep)
+        print_end_to_end(results)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+        if args.baseline:
+            with open(args.baseline) as file:
+                regressions = compare_results(json.load(file), results, args.threshold)
+            for files, name, before, after in regressions:
+                print(f"REGRESSION {files} files {name}: {before:.4f}s -> {after:.4f}s")
+            if regressions:
+                sys.exit(1)
+        return
+
+    root = tempfile.mkdtemp(prefix='mc_hammer_bench_')
+    try:
+        paths = build_synthetic_tree(root, args.files)
+
+        found, entries_per_sec = bench_walker(root)
+        print(f"Walker: {found} executables, {entries_per_sec:.1f} entries/sec")
+        print()
+
+        print("Hashing pipeline")
+        print(f"{'workers':>8} {'files/sec':>12} {'MB/sec':>10}")
+        for workers, files_per_sec, mb_per_sec in bench_hashing_workers(paths, args.workers):
+            print(f"{workers:>8} {files_per_sec:>12.1f} {mb_per_sec:>10.1f}")
+
+        per_row, batched = bench_sqlite_writer(root)
+        print()
+        print(f"SQLite inserts: {per_row:.0f} rows/sec committing per row, {batched:.0f} rows/sec batched")
+
+        parsed, sockets_per_sec = bench_proc_net(root)
+        print(f"/proc/net parsing: {parsed} sockets, {sockets_per_sec:.0f} sockets/sec")
+
+        print()
+        print("Logging per hashed file")
+        for label, seconds in bench_logging(root):
+            print(f"{label:>22} {seconds * 1e6:>8.2f} us")
+
+        if not args.skip_strategies:
+            print()
+            print("Read strategies (MD5)")
+            print(f"{'file size':>12} {'strategy':>10} {'MB/sec':>10}")
+            for size, name, mb_per_sec in bench_read_strategies(root, args.buffer_size):
+                print(f"{size:>12} {name:>10} {mb_per_sec:>10.1f}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
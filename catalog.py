@@ -0,0 +1,183 @@
+import heapq
+import mmap
+import os
+import struct
+from database import Database
+from hashing import DIGEST_COLUMNS
+
+# File layout: a 32 byte header (magic, digest name, record count) followed by the raw digests,
+# sorted and unique, all the same width. Lookups binary-search the mmap'd records, so a catalog of
+# millions of hashes costs page cache rather than process memory.
+MAGIC = b'MCHCAT01'
+HEADER = struct.Struct('<8s16sQ')
+DIGEST_SIZES = {'md5': 16, 'sha256': 32, 'blake2b': 64}
+
+
+class CatalogError(Exception):
+    pass
+
+
+class HashCatalog:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise CatalogError(f"{path} is not a hash catalog")
+            magic, digest, self.count = HEADER.unpack(header)
+            self.digest = digest.rstrip(b'\0').decode('ascii', errors='replace')
+            if magic != MAGIC or self.digest not in DIGEST_SIZES:
+                raise CatalogError(f"{path} is not a hash catalog")
+            self.size = DIGEST_SIZES[self.digest]
+            if os.fstat(file.fileno()).st_size != HEADER.size + self.count * self.size:
+                raise CatalogError(f"{path} is truncated")
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, hex_digest):
+        try:
+            key = bytes.fromhex(hex_digest)
+        except (TypeError, ValueError):
+            return False
+        if len(key) != self.size or not self.count:
+            return False
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * self.size
+            record = self.mm[offset:offset + self.size]
+            if record < key:
+                low = middle + 1
+            elif record > key:
+                high = middle
+            else:
+                return True
+        return False
+
+    def contains(self, digests):
+        # digests is {name: hex}, as the FileHasher returns them
+        return digests.get(self.digest) in self
+
+    def __iter__(self):
+        for i in range(self.count):
+            offset = HEADER.size + i * self.size
+            yield self.mm[offset:offset + self.size]
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+
+def write_catalog(path, digest, records):
+    # records must be sorted raw digests, duplicates are dropped. Written next to the target and
+    # renamed over it, so a scan never opens a half-written catalog.
+    size = DIGEST_SIZES[digest]
+    temp_path = f"{path}.tmp"
+    count = 0
+    with open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, digest.encode('ascii'), 0))
+        previous = None
+        for record in records:
+            if len(record) != size:
+                raise CatalogError(f"Expected {size} byte {digest} digests, got {len(record)} bytes")
+            if record == previous:
+                continue
+            if previous is not None and record < previous:
+                raise CatalogError("Catalog records must be sorted")
+            file.write(record)
+            previous = record
+            count += 1
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, digest.encode('ascii'), count))
+    try:
+        os.replace(temp_path, path)
+    except PermissionError:
+        # Windows refuses while a scan has the old catalog mapped, scans only hold it while they run
+        os.remove(temp_path)
+        raise CatalogError(f"{path} is in use by a running scan, try again") from None
+    return count
+
+
+def build_catalog(database_path, path, digest='sha256', table='BaselineExecutables', batch_size=10000):
+    # Hex digests sort in the same order as their bytes, so SQLite does the sorting and the rows are
+    # streamed straight into the file
+    column = DIGEST_COLUMNS[digest]
+    database = Database(database_path)
+
+    def records():
+        with database.reader() as connection:
+            cursor = connection.execute(f'''
+                SELECT DISTINCT lower({column}) FROM {table} WHERE {column} IS NOT NULL ORDER BY 1
+            ''')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for (hex_digest,) in rows:
+                    yield bytes.fromhex(hex_digest)
+
+    try:
+        return write_catalog(path, digest, records())
+    finally:
+        database.close()
+
+
+def merge_catalogs(paths, path):
+    # Streams a k-way merge, so catalogs from several golden images combine without loading any of them
+    catalogs = [HashCatalog(source) for source in paths]
+    try:
+        digests = {catalog.digest for catalog in catalogs}
+        if len(digests) != 1:
+            raise CatalogError(f"Can't merge catalogs of different digests: {', '.join(sorted(digests))}")
+        return write_catalog(path, digests.pop(), heapq.merge(*catalogs))
+    finally:
+        for catalog in catalogs:
+            catalog.close()
+
+
+def import_catalog(source, path):
+    # Validates a catalog built on another host before it replaces the local one
+    catalog = HashCatalog(source)
+    try:
+        return write_catalog(path, catalog.digest, iter(catalog))
+    finally:
+        catalog.close()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build and manage the known-good hash catalog")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="Build a catalog from a golden host's baseline")
+    build.add_argument('--database', default='GuardianAngel.db')
+    build.add_argument('--digest', default='sha256', choices=sorted(DIGEST_SIZES))
+    build.add_argument('output')
+    imported = commands.add_parser('import', help="Install a catalog built on another host")
+    imported.add_argument('source')
+    imported.add_argument('--output', default='known_good.cat')
+    merge = commands.add_parser('merge', help="Combine several catalogs into one")
+    merge.add_argument('output')
+    merge.add_argument('sources', nargs='+')
+    lookup = commands.add_parser('lookup', help="Check hashes against a catalog")
+    lookup.add_argument('--catalog', default='known_good.cat')
+    lookup.add_argument('hashes', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print(f"{build_catalog(args.database, args.output, args.digest)} hashes written to {args.output}")
+    elif args.command == 'import':
+        print(f"{import_catalog(args.source, args.output)} hashes imported to {args.output}")
+    elif args.command == 'merge':
+        print(f"{merge_catalogs(args.sources, args.output)} hashes written to {args.output}")
+    else:
+        catalog = HashCatalog(args.catalog)
+        for hex_digest in args.hashes:
+            print(f"{hex_digest} {'known-good' if hex_digest.lower() in catalog else 'unknown'}")
+
+
+if __name__ == "__main__":
+    main()
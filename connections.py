@@ -0,0 +1,155 @@
+import json
+import os
+import socket
+import struct
+import subprocess
+from collections import namedtuple
+
+Connection = namedtuple('Connection', ['protocol', 'local_ip', 'local_port', 'remote_ip', 'remote_port', 'state', 'pid'])
+
+# Socket states as numbered in include/net/tcp_states.h
+TCP_STATES = {
+    1: 'ESTABLISHED', 2: 'SYN_SENT', 3: 'SYN_RECV', 4: 'FIN_WAIT1', 5: 'FIN_WAIT2', 6: 'TIME_WAIT',
+    7: 'CLOSE', 8: 'CLOSE_WAIT', 9: 'LAST_ACK', 10: 'LISTEN', 11: 'CLOSING', 12: 'NEW_SYN_RECV',
+}
+
+
+class ConnectionSource:
+    # Backends yield Connection records, Scanner doesn't care where they come from
+    def connections(self):
+        raise NotImplementedError
+
+
+class ProcNetSource(ConnectionSource):
+    # Reads the kernel socket tables directly from /proc/net on Linux
+    TABLES = (('tcp', 'TCP', socket.AF_INET), ('tcp6', 'TCP', socket.AF_INET6),
+              ('udp', 'UDP', socket.AF_INET), ('udp6', 'UDP', socket.AF_INET6))
+
+    def __init__(self, root='/proc', resolve_pids=False):
+        self.root = root
+        self.resolve_pids = resolve_pids
+
+    @staticmethod
+    def available(root='/proc'):
+        return os.path.exists(os.path.join(root, 'net', 'tcp'))
+
+    @staticmethod
+    def decode_address(value, family):
+        # Addresses are written as host-order 32-bit words in hex, e.g. 0100007F:0035 for 127.0.0.1:53
+        address, port = value.split(b':')
+        raw = bytes.fromhex(address.decode('ascii'))
+        if family == socket.AF_INET:
+            packed = raw[::-1]
+        else:
+            packed = b''.join(struct.pack('>I', word) for word in struct.unpack('<4I', raw))
+        return socket.inet_ntop(family, packed), int(port, 16)
+
+    def socket_pids(self):
+        # Maps socket inodes to the owning PID by reading /proc/<pid>/fd, only done when asked for
+        pids = {}
+        for entry in os.scandir(self.root):
+            if not entry.name.isdigit():
+                continue
+            try:
+                for fd in os.scandir(os.path.join(entry.path, 'fd')):
+                    target = os.readlink(fd.path)
+                    if target.startswith('socket:['):
+                        pids[target[8:-1]] = int(entry.name)
+            except OSError:
+                continue
+        return pids
+
+    def connections(self):
+        pids = self.socket_pids() if self.resolve_pids else {}
+        for table, protocol, family in self.TABLES:
+            try:
+                with open(os.path.join(self.root, 'net', table), 'rb') as file:
+                    data = file.read()
+            except OSError:
+                continue
+            # Skip the header line, fields are whitespace separated
+            for line in data.split(b'\n')[1:]:
+                fields = line.split()
+                if len(fields) < 10:
+                    continue
+                try:
+                    local_ip, local_port = self.decode_address(fields[1], family)
+                    remote_ip, remote_port = self.decode_address(fields[2], family)
+                    state = TCP_STATES.get(int(fields[3], 16), 'UNKNOWN') if protocol == 'TCP' else None
+                except (ValueError, struct.error):
+                    continue
+                yield Connection(protocol, local_ip, local_port, remote_ip, remote_port, state,
+                                 pids.get(fields[9].decode('ascii')))
+
+
+class PsutilSource(ConnectionSource):
+    def __init__(self):
+        import psutil
+        self.psutil = psutil
+
+    def connections(self):
+        for conn in self.psutil.net_connections(kind='inet'):
+            protocol = 'TCP' if conn.type == socket.SOCK_STREAM else 'UDP'
+            remote_ip, remote_port = conn.raddr if conn.raddr else ('*', 0)
+            state = conn.status if protocol == 'TCP' else None
+            yield Connection(protocol, conn.laddr[0], conn.laddr[1], remote_ip, remote_port, state, conn.pid)
+
+
+class NetstatSource(ConnectionSource):
+    # Fallback for hosts without psutil, parses `netstat -ano` (Windows column layout)
+    def __init__(self, command=('netstat', '-ano'), logger=None):
+        self.command = list(command)
+        self.logger = logger
+
+    @staticmethod
+    def split_endpoint(value):
+        ip, port = value.rsplit(':', 1)
+        return ip.strip('[]'), int(port) if port != '*' else 0
+
+    def parse(self, output):
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) < 4 or parts[0] not in ('TCP', 'UDP'):
+                continue
+            try:
+                local_ip, local_port = self.split_endpoint(parts[1])
+                remote_ip, remote_port = self.split_endpoint(parts[2])
+                if parts[0] == 'TCP':
+                    state, pid = parts[3], parts[4] if len(parts) > 4 else None
+                else:
+                    state, pid = None, parts[3]
+                pid = int(pid) if pid is not None else None
+            except ValueError:
+                if self.logger is not None:
+                    self.logger.log(f"Error unpacking IP and port from line: {line}")
+                continue
+            yield Connection(parts[0], local_ip, local_port, remote_ip, remote_port, state, pid)
+
+    def connections(self):
+        output = subprocess.check_output(self.command).decode('utf-8', errors='replace')
+        return self.parse(output)
+
+
+class FakeConnectionSource(ConnectionSource):
+    # Replays connections from a list of records or a JSON lines fixture, for tests and benchmarks
+    def __init__(self, records=None, fixture_path=None):
+        self.records = list(records or [])
+        self.fixture_path = fixture_path
+
+    def connections(self):
+        for record in self.records:
+            yield Connection(*record) if not isinstance(record, dict) else Connection(**record)
+        if self.fixture_path is not None:
+            with open(self.fixture_path) as file:
+                for line in file:
+                    if line.strip():
+                        yield Connection(**json.loads(line))
+
+
+def default_connection_source(logger=None):
+    if ProcNetSource.available():
+        return ProcNetSource()
+    try:
+        return PsutilSource()
+    except ImportError:
+        return NetstatSource(logger=logger)
@@ -0,0 +1,234 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA busy_timeout=5000',
+)
+
+# The table an INSERT, UPDATE or DELETE writes to
+WRITE_TARGET = re.compile(r'^\s*(?:INSERT|REPLACE|UPDATE|DELETE)\b(?:\s+OR\s+\w+)?(?:\s+INTO|\s+FROM)?\s+([\w.]+)', re.IGNORECASE)
+
+READER_PRAGMAS = (
+    'PRAGMA query_only=ON',
+    'PRAGMA cache_size=-16384',
+    'PRAGMA busy_timeout=5000',
+)
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(database_path, **kwargs):
+    # Every component shares one Database per file instead of reconnecting per call
+    with _databases_lock:
+        database = _databases.get(database_path)
+        if database is None:
+            database = Database(database_path, **kwargs)
+            _databases[database_path] = database
+        return database
+
+
+class Database:
+    # Thread-safe connection manager: a single writer connection serialised by a lock, plus a small
+    # pool of read-only connections for the menu and analysis queries. WAL mode lets the readers
+    # run while a scan is writing. Each connection keeps its own prepared statement cache.
+    def __init__(self, database_path, flush_size=1000, flush_interval=1.0, readers=4, cached_statements=256):
+        self.database_path = database_path
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_readers = max(1, readers)
+        self.cached_statements = cached_statements
+        self.lock = threading.RLock()
+        self._connection = None
+        self._idle_readers = queue.Queue()
+        self._readers = []
+        self._setup_done = set()
+
+    def _connect(self, read_only=False):
+        if read_only:
+            # urllib.request costs tens of milliseconds to import, pathname2url is all that's needed from it
+            if os.name == 'nt':
+                from nturl2path import pathname2url
+            else:
+                from urllib.parse import quote as pathname2url
+            uri = f"file:{pathname2url(os.path.abspath(self.database_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=self.cached_statements)
+            pragmas = READER_PRAGMAS
+        else:
+            # Autocommit mode, transactions are opened explicitly by BatchWriter
+            conn = sqlite3.connect(self.database_path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+            pragmas = PRAGMAS
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            with self.lock:
+                if self._connection is None:
+                    self._connection = self._connect()
+        return self._connection
+
+    def run_once(self, name, func):
+        # Schema setup runs once per database file no matter how many components ask for it
+        with self.lock:
+            if name not in self._setup_done:
+                func()
+                self._setup_done.add(name)
+
+    def migrate(self, version, steps):
+        # One-time schema setup: steps ((name, func), all idempotent) only run when the file's
+        # user_version is behind, so a normal start costs a single PRAGMA read
+        with self.lock:
+            if self.connection.execute('PRAGMA user_version').fetchone()[0] >= version:
+                self._setup_done.update(name for name, _ in steps)
+                return False
+            for name, func in steps:
+                self.run_once(name, func)
+            self.connection.execute(f'PRAGMA user_version = {int(version)}')
+            return True
+
+    def execute(self, sql, params=()):
+        # Runs a single statement on the writer connection
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    @contextmanager
+    def reader(self):
+        # Borrows a read-only connection, opening a new one only while the pool is below its limit
+        try:
+            conn = self._idle_readers.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self.lock:
+                # Make sure the file and schema exist before opening it read-only
+                self.connection
+                if len(self._readers) < self.max_readers:
+                    conn = self._connect(read_only=True)
+                    self._readers.append(conn)
+            if conn is None:
+                conn = self._idle_readers.get()
+        try:
+            yield conn
+        finally:
+            self._idle_readers.put(conn)
+
+    def query(self, sql, params=()):
+        with self.reader() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def writer(self, flush_size=None, flush_interval=None):
+        return BatchWriter(self,
+                           self.flush_size if flush_size is None else flush_size,
+                           self.flush_interval if flush_interval is None else flush_interval)
+
+    def close(self):
+        with self.lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self._idle_readers = queue.Queue()
+
+
+class RowCountingCursor(sqlite3.Cursor):
+    # Adds up the rows changed by statements that write to the database file. Scratch work on temp
+    # tables (the diff scope and results) isn't written anywhere, so it isn't counted.
+    rows = 0
+
+    def execute(self, sql, parameters=()):
+        super().execute(sql, parameters)
+        self._count(sql)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        super().executemany(sql, seq_of_parameters)
+        self._count(sql)
+        return self
+
+    def _count(self, sql):
+        target = WRITE_TARGET.match(sql)
+        if self.rowcount > 0 and target is not None and not target.group(1).lower().startswith('temp.'):
+            self.rows += self.rowcount
+
+
+class BatchWriter:
+    # Buffers rows and writes them with executemany inside one explicit transaction, either once
+    # flush_size rows are pending or flush_interval seconds after the last flush.
+    # Statements are replayed in the order they were added, so a DELETE queued before an INSERT stays before it.
+    def __init__(self, database, flush_size=1000, flush_interval=1.0):
+        self.database = database
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.pending_rows = 0
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+    def add(self, sql, params=()):
+        self.add_many(sql, [params])
+
+    def add_many(self, sql, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        if self.pending and self.pending[-1][0] == sql:
+            self.pending[-1][1].extend(rows)
+        else:
+            self.pending.append((sql, rows))
+        self.pending_rows += len(rows)
+        if self.pending_rows >= self.flush_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    @contextmanager
+    def transaction(self):
+        # Flushes anything buffered and yields a cursor inside a single transaction
+        with self.database.lock:
+            conn = self.database.connection
+            cursor = conn.cursor(RowCountingCursor)
+            cursor.execute('BEGIN')
+            try:
+                self._write_pending(cursor)
+                yield cursor
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+            # Rows written are credited to the scan stage running on this thread
+            metrics.count('rows', cursor.rows)
+
+    def flush(self):
+        if not self.pending:
+            self.last_flush = time.monotonic()
+            return
+        with self.transaction():
+            pass
+
+    def _write_pending(self, cursor):
+        for sql, rows in self.pending:
+            cursor.executemany(sql, rows)
+        self.rows_written += self.pending_rows
+        self.pending = []
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
@@ -0,0 +1,89 @@
+import os
+from hashing import DIGEST_COLUMNS
+
+DIGEST_NAMES = tuple(DIGEST_COLUMNS)
+
+
+def is_under(path, root):
+    # Case-insensitive on Windows, like the paths themselves
+    path, root = os.path.normcase(path), os.path.normcase(root)
+    return path == root or path.startswith(root if root.endswith(os.sep) else root + os.sep)
+
+
+class FileIndex:
+    # Keeps the last known (size, mtime, file id, digests) for every executable a scan has seen,
+    # so a rescan only needs to hash files that are new or have changed since the previous pass.
+    # With a root only the entries under it are loaded, so a pass over one root never takes the
+    # files of another root sharing the scope for deleted.
+    def __init__(self, scope, root=None):
+        self.scope = scope
+        self.root = root
+        self.entries = {}
+        self.seen = set()
+        self.changed = {}
+        self.removed = set()
+
+    def load(self, database):
+        columns = ', '.join(DIGEST_COLUMNS[name] for name in DIGEST_NAMES)
+        rows = database.query(f'''
+                       SELECT FilePath, Size, MTime, FileId, {columns} FROM FileIndex WHERE Scope = ?
+        ''', (self.scope,))
+        self.entries = {
+            row[0]: (row[1], row[2], row[3], {name: value for name, value in zip(DIGEST_NAMES, row[4:]) if value is not None})
+            for row in rows if self.root is None or is_under(row[0], self.root)
+        }
+        self.seen = set()
+        self.changed = {}
+        self.removed = set()
+
+    def lookup(self, file_path, stat):
+        # Returns the cached digests if the file looks untouched, otherwise None
+        self.seen.add(file_path)
+        entry = self.entries.get(file_path)
+        if entry is None:
+            return None
+        size, mtime, file_id, digests = entry
+        if size == stat.st_size and mtime == stat.st_mtime_ns and file_id == stat.st_ino:
+            return digests
+        return None
+
+    def previous(self, file_path):
+        # Digests from the last pass regardless of whether the metadata still matches
+        entry = self.entries.get(file_path)
+        return entry[3] if entry is not None else None
+
+    def seed(self, other):
+        # Starts an empty index from another scope's entries, they're written to this scope on save
+        self.entries = dict(other.entries)
+        self.changed.update(other.entries)
+
+    def update(self, file_path, stat, digests):
+        self.changed[file_path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino, digests)
+
+    def remove(self, file_path):
+        # For passes that only look at some paths (the watcher's), which can't use deleted()
+        self.changed.pop(file_path, None)
+        self.removed.add(file_path)
+
+    def deleted(self):
+        return [path for path in self.entries if path not in self.seen]
+
+    def save(self, writer):
+        deleted = self.deleted() + [path for path in self.removed if path not in self.seen]
+        columns = ', '.join(DIGEST_COLUMNS[name] for name in DIGEST_NAMES)
+        placeholders = ', '.join(['?'] * len(DIGEST_NAMES))
+        writer.add_many(f'''
+                           INSERT OR REPLACE INTO FileIndex (Scope, FilePath, Size, MTime, FileId, {columns})
+                           VALUES (?, ?, ?, ?, ?, {placeholders})
+        ''', [
+            (self.scope, path, size, mtime, file_id) + tuple(digests.get(name) for name in DIGEST_NAMES)
+            for path, (size, mtime, file_id, digests) in self.changed.items()
+        ])
+        writer.add_many('''
+                           DELETE FROM FileIndex WHERE Scope = ? AND FilePath = ?
+        ''', [(self.scope, path) for path in deleted])
+        self.entries.update(self.changed)
+        for path in deleted:
+            self.entries.pop(path, None)
+        self.changed = {}
+        self.removed = set()
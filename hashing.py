@@ -0,0 +1,196 @@
+import hashlib
+import mmap
+import os
+import queue
+import threading
+import zlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Database column for each supported digest
+DIGEST_COLUMNS = {
+    'md5': 'md5Hash',
+    'sha256': 'sha256Hash',
+    'blake2b': 'blake2Hash',
+    'fast': 'fastHash',
+}
+
+CRYPTO_DIGESTS = ('md5', 'sha256', 'blake2b')
+
+
+class Crc32Hash:
+    # Stand-in for xxhash when it isn't installed, zlib.crc32 is also a C loop and much cheaper than MD5
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value:08x}"
+
+
+def new_hasher(name):
+    if name == 'fast':
+        return xxhash.xxh3_64() if xxhash is not None else Crc32Hash()
+    return hashlib.new(name)
+
+
+def compute_md5(file_path):
+    hasher = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        buf = file.read(65536)  # read 64K chunks
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = file.read(65536)
+    return hasher.hexdigest()
+
+
+class FileHasher:
+    # Computes every configured digest in a single read of the file. The read strategy adapts to
+    # the file size: tiny files are read in one call, medium ones are read into a per-thread
+    # preallocated buffer so no bytes object is allocated per chunk, and large ones are memory-mapped.
+    # With two_tier set, a file that has a previous result is first checked with the fast hash only,
+    # and the crypto digests are recomputed only if the content actually changed.
+    STRATEGIES = ('read', 'readinto', 'mmap')
+
+    def __init__(self, digests=('md5', 'sha256'), buffer_size=1024 * 1024, two_tier=False,
+                 small_file_size=64 * 1024, mmap_file_size=32 * 1024 * 1024):
+        for name in digests:
+            if name not in DIGEST_COLUMNS:
+                raise ValueError(f"Unsupported digest: {name}")
+        self.digests = tuple(digests)
+        if two_tier and 'fast' not in self.digests:
+            self.digests += ('fast',)
+        self.buffer_size = buffer_size
+        self.two_tier = two_tier
+        self.small_file_size = small_file_size
+        self.mmap_file_size = mmap_file_size
+        self.local = threading.local()
+
+    def _buffer(self):
+        buf = getattr(self.local, 'buffer', None)
+        if buf is None:
+            buf = bytearray(self.buffer_size)
+            self.local.buffer = buf
+        return buf
+
+    def read_strategy(self, size):
+        if size <= self.small_file_size:
+            return 'read'
+        if size >= self.mmap_file_size:
+            return 'mmap'
+        return 'readinto'
+
+    def digest(self, file_path, names=None, strategy=None):
+        names = names or self.digests
+        hashers = [new_hasher(name) for name in names]
+        with open(file_path, 'rb', buffering=0) as file:
+            size = os.fstat(file.fileno()).st_size
+            strategy = strategy or self.read_strategy(size)
+            if size == 0:
+                pass
+            elif strategy == 'read':
+                data = file.read()
+                for hasher in hashers:
+                    hasher.update(data)
+            elif strategy == 'mmap':
+                # Every hasher is fed the same slice before moving on, so a file bigger than the page
+                # cache is still read from disk once rather than once per digest
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                    for offset in range(0, size, self.buffer_size):
+                        with view[offset:offset + self.buffer_size] as chunk:
+                            for hasher in hashers:
+                                hasher.update(chunk)
+            elif strategy == 'readinto':
+                buf = self._buffer()
+                view = memoryview(buf)
+                while True:
+                    n = file.readinto(buf)
+                    if not n:
+                        break
+                    chunk = view[:n]
+                    for hasher in hashers:
+                        hasher.update(chunk)
+            else:
+                raise ValueError(f"Unknown read strategy: {strategy}")
+        return {name: hasher.hexdigest() for name, hasher in zip(names, hashers)}
+
+    def hash_file(self, file_path, previous=None):
+        # previous is the digest dict stored for this path on an earlier pass, if any
+        if self.two_tier and previous and previous.get('fast'):
+            fast = self.digest(file_path, ('fast',))
+            if fast['fast'] == previous['fast'] and all(previous.get(name) for name in self.digests):
+                return dict(previous)
+        return self.digest(file_path)
+
+
+class HashingPipeline:
+    # Splits a scan into a walker thread (producer), a bounded pool of hashing threads and the
+    # calling thread, which consumes the results so a single connection does all SQLite writes.
+    # hashlib releases the GIL while digesting large buffers, so threads scale with cores and disk queue depth.
+    _DONE = object()
+
+    def __init__(self, hash_func=compute_md5, workers=4, queue_size=1024):
+        self.hash_func = hash_func
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+
+    def run(self, items, hash_func=None):
+        # items yields tuples whose first element is the file path to hash.
+        # Yields (item, file_hash, error) in completion order.
+        hash_func = hash_func or self.hash_func
+        work_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        producer_errors = []
+
+        def producer():
+            try:
+                for item in items:
+                    if stop.is_set():
+                        break
+                    work_queue.put(item)
+            except Exception as e:
+                producer_errors.append(e)
+            finally:
+                for _ in range(self.workers):
+                    work_queue.put(self._DONE)
+
+        def worker():
+            while True:
+                item = work_queue.get()
+                if item is self._DONE:
+                    result_queue.put(self._DONE)
+                    return
+                if stop.is_set():
+                    continue
+                try:
+                    result_queue.put((item, hash_func(item[0]), None))
+                except Exception as e:
+                    result_queue.put((item, None, e))
+
+        threads = [threading.Thread(target=producer, daemon=True)]
+        threads += [threading.Thread(target=worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        finished = 0
+        try:
+            while finished < self.workers:
+                result = result_queue.get()
+                if result is self._DONE:
+                    finished += 1
+                    continue
+                yield result
+            if producer_errors:
+                raise producer_errors[0]
+        finally:
+            # If the consumer stops early, drain the queues so no thread stays blocked on put()
+            stop.set()
+            while finished < self.workers:
+                if result_queue.get() is self._DONE:
+                    finished += 1
@@ -1,10 +1,126 @@
+import atexit
+import json
 import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOGGER_NAME = 'mc_hammer'
+
+# High-volume events are logged at DEBUG and, when DEBUG is on, only 1 in N is written
+DEFAULT_SAMPLING = {
+    'file_hashed': 100,
+}
+
+_listener = None
+_handler = None
+_listener_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, the event's fields sit next to the standard ones
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'event': getattr(record, 'event', 'message'),
+            'thread': record.threadName,
+        }
+        if record.msg:
+            entry['message'] = record.getMessage()
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    # Never blocks the caller: when the listener falls behind, records are dropped and counted
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The record is formatted on the listener thread, so only the message args are resolved here
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure(log_file='mc_hammer.log', level=logging.INFO, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000):
+    # Sets up the shared background writer once per process, later calls return the existing one
+    global _listener, _handler
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(maxsize=queue_size)
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.setLevel(level)
+        logger.propagate = False
+        _handler = DroppingQueueHandler(log_queue)
+        logger.addHandler(_handler)
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+        return _listener
+
+
+def dropped_records():
+    # Records dropped because the writer fell behind, since the process started
+    return _handler.dropped if _handler is not None else 0
+
+
+def shutdown():
+    # Flushes whatever is still queued and notes how many records were dropped, called at exit
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            dropped = dropped_records()
+            if dropped:
+                record = logging.makeLogRecord({'name': LOGGER_NAME, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                                                'msg': '', 'event': 'log_records_dropped', 'fields': {'dropped': dropped}})
+                # Blocking put, the listener is still draining the queue
+                _listener.queue.put(record)
+            _listener.stop()
+            _listener = None
+
 
 class Logger:
-    def __init__(self, log_file='mc_hammer.log'):
-        logging.basicConfig(filename=log_file, 
-                            level=logging.INFO, 
-                            format='%(asctime)s - %(levelname)s - %(message)s')
+    # Scans log through here. log() keeps the old message interface, event() writes a named record
+    # with fields, and the file is written by a QueueListener thread so callers only pay for a put.
+    def __init__(self, log_file='mc_hammer.log', level=logging.INFO, sampling=None):
+        configure(log_file, level)
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.sampling = dict(DEFAULT_SAMPLING, **(sampling or {}))
+        self.seen = {}
+
+    def log(self, message: str, level=logging.INFO, /, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, extra={'event': 'message', 'fields': fields})
+
+    def event(self, name, level=logging.INFO, /, **fields):
+        # Level check first, so a disabled DEBUG event costs one comparison on the hot path.
+        # name and level are positional-only, so any keyword (name= included) is a field
+        if not self.logger.isEnabledFor(level):
+            return
+        every = self.sampling.get(name)
+        if every:
+            seen = self.seen.get(name, 0)
+            self.seen[name] = seen + 1
+            if seen % every:
+                return
+            fields['sampled'] = every
+        self.logger.log(level, '', extra={'event': name, 'fields': fields})
 
-    def log(self, message: str):
-        logging.info(message)
+    def set_level(self, level):
+        self.logger.setLevel(level)
@@ -3,19 +3,19 @@ import time
 import sqlite3
 import sys
 import sched
-from concurrent.futures import ThreadPoolExecutor
 from menu import Menu
 from scanner import Scanner
-from actions import Actions
 from logger import Logger
 
 class Main:
     def __init__(self):
-        self.menu = Menu()
         self.database_path = "GuardianAngel.db"
         self.s = sched.scheduler(time.time, time.sleep)
         self.scanner = Scanner(self.database_path)
-        self.actions = Actions()
+        # The menu reuses this scanner so the schema setup and connections aren't duplicated
+        self.menu = Menu(self.scanner)
+        # The scanner's response backend, it's only imported and constructed once something is blocked or removed
+        self.actions = self.scanner.actions
         self.logger = Logger()
     
         
@@ -24,7 +24,6 @@ class Main:
 ## TODO: Add behavioral analytics from SnapAttack 
 ## TODO: Add actions to actions.py based on detections from SnapAttack analytics 
 ## TODO: Find a way to include an AI agent, LLM, or ML into the program with deep learning and a neural network.  If not possible at this time then we should focus on ML and training the model against current detections with the automated responses. 
-## TODO: Create an 'Alerts' table that combines all of the information from the other discrepancies tables into a single table for ease of use and viewing.
 ## TODO: Add threading module to run the entire try block of run concurrently
 
     def run(self):
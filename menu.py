@@ -1,15 +1,53 @@
 from scanner import Scanner
-import threading
+from table_browser import TableBrowser, QueryTimeout
+from logger import shutdown as shutdown_logging
+import itertools
+import sqlite3
+import time
 class Menu:
 
-    def __init__(self):
-        self.alert_count = 0  # This can be modified based on actual counts in the future
+    def __init__(self, scanner=None):
 # add functionality for each menu option based on the rest of the functions in mc-hammer. this should look more similar to the main.py file in mc-hammer with the functions being called after each menu selection.
         self.db_path = "GuardianAngel.db"
-        self.scanner = Scanner(self.db_path)
+        self.scanner = scanner or Scanner(self.db_path)
+        self.browser = TableBrowser(self.scanner.database)
+
+    @property
+    def alert_count(self):
+        # Maintained by triggers on the Alerts table, this is a single-row read
+        return self.scanner.alerts.unseen_count()
+
+    def format_seconds(self, seconds):
+        if seconds is None:
+            return "-"
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours:02}:{minutes:02}:{seconds:02}"
+
+    def display_scan_status(self):
+        # Start time and elapsed time of running scans, time until the next run of each scan type
+        status = self.scanner.scan_status()
+        if not status:
+            return
+        print(f"{'Scan':<12} {'State':<8} {'Started':<10} {'Elapsed':<10} {'Next in':<10} {'Last took':<10}")
+        for job in status:
+            started = time.strftime('%H:%M:%S', time.localtime(job['started_at'])) if job['running'] else "-"
+            state = "running" if job['running'] else "idle"
+            print(f"{job['name']:<12} {state:<8} {started:<10} {self.format_seconds(job['elapsed']):<10} "
+                  f"{self.format_seconds(job['next_run_in']):<10} {self.format_seconds(job['last_duration']):<10}")
+        # Progress of the stages running right now, from the same metrics that go to ScanRuns
+        running = [run for run in self.scanner.metrics.running() if run['kind'] == 'stage']
+        if running:
+            print(f"{'Stage':<20} {'Elapsed':<10} {'Items':>10} {'MB':>10} {'Rows':>10} {'Errors':>7}")
+            for run in running:
+                print(f"{run['name']:<20} {self.format_seconds(run['elapsed']):<10} {run['items']:>10} "
+                      f"{run['bytes'] / (1024 * 1024):>10.1f} {run['rows']:>10} {run['errors']:>7}")
+        print("---------------------------------------------")
+
     def display_menu_options(self):
         print("MC-Hammer Incident Detection and Response Tool")
         print("---------------------------------------------")
+        self.display_scan_status()
         print("1. Start Scan")
         print("2. View Tables")
         print("3. Add/Remove Trusted Connections")
@@ -35,29 +73,119 @@ class Menu:
         else:
             print("Invalid choice.")
 
+    def print_rows(self, columns, rows, width=24):
+        # Cells are cut to `width` so wide paths and messages don't wrap the table
+        def cell(value):
+            text = '' if value is None else str(value)
+            return text if len(text) <= width else text[:width - 3] + '...'
+        print(' '.join(f"{cell(column):<{width}}" for column in columns))
+        for row in rows:
+            print(' '.join(f"{cell(value):<{width}}" for value in row))
+        if not rows:
+            print("(no rows)")
+
+    def print_query(self, sql, page_size=20):
+        # Rows come off the cursor one page at a time, nothing past the current page is held
+        rows = self.browser.stream(sql)
+        try:
+            columns = next(rows)
+            while True:
+                page = list(itertools.islice(rows, page_size))
+                self.print_rows(columns, page)
+                if len(page) < page_size or input("More? (y/n): ").lower() != "y":
+                    break
+        finally:
+            rows.close()
+
+    def browse_table(self, table, page_size=20):
+        print(f"\n{table}: head [n], tail [n], next, top <column> [n], unique <column>, "
+              f"find <column> <value>, sql <query>, back")
+        last_rowid = None
+        last_value = None
+        mode = None
+        while True:
+            command = input(f"{table}> ").strip()
+            name, _, rest = command.partition(' ')
+            args = rest.split()
+            try:
+                if name == "back" or not command:
+                    break
+                elif name == "head":
+                    columns, rows, last_rowid = self.browser.page(table, limit=int(args[0]) if args else page_size)
+                    mode = 'page'
+                    self.print_rows(columns, rows)
+                elif name == "tail":
+                    self.print_rows(*self.browser.tail(table, int(args[0]) if args else page_size))
+                elif name == "next" and mode == 'page':
+                    columns, rows, last_rowid = self.browser.page(table, after=last_rowid, limit=page_size)
+                    self.print_rows(columns, rows)
+                elif name == "next" and mode == 'unique':
+                    columns, rows = self.browser.unique(table, column, after=last_value, limit=page_size)
+                    last_value = rows[-1][0] if rows else last_value
+                    self.print_rows(columns, rows)
+                elif name == "top" and args:
+                    self.print_rows(*self.browser.top(table, args[0], int(args[1]) if len(args) > 1 else 10))
+                elif name == "unique" and args:
+                    column = args[0]
+                    columns, rows = self.browser.unique(table, column, limit=page_size)
+                    last_value = rows[-1][0] if rows else None
+                    mode = 'unique'
+                    self.print_rows(columns, rows)
+                elif name == "find" and len(args) > 1:
+                    column, _, value = rest.partition(' ')
+                    self.print_rows(*self.browser.find(table, column, value.strip(), limit=page_size))
+                elif name == "sql" and rest:
+                    self.print_query(rest)
+                else:
+                    print("Unknown command.")
+            except (ValueError, QueryTimeout, sqlite3.Error) as e:
+                print(f"Error: {e}")
+
     def view_tables(self):
-        print("\n1. BaselineExecutables")
-        print("2. Baseline Accounts")
-        print("3. BaselineAutoRuns")
-        print("4. Discrepancies")
-        print("5. Current Connections")
-        print("6. Trusted Accounts")
-        choice = input("Which table would you like to see? (Enter number): ")
-
-        if choice == "6":
-            # This is a hardcoded example. In a real application, you'd retrieve this data from a database.
-            print("\nid     IPAddress\n1      127.0.0.1")
+        tables = self.browser.tables()
+        print()
+        for number, table in enumerate(tables, 1):
+            print(f"{number}. {table}")
+        choice = input("Which table would you like to see? (Enter number or name): ").strip()
+        if choice.isdigit() and 1 <= int(choice) <= len(tables):
+            self.browse_table(tables[int(choice) - 1])
+        elif choice in tables:
+            self.browse_table(choice)
         else:
-            # Placeholder for the other table views. Implement as needed.
-            print(f"Showing data for table option {choice}...")
+            print("Invalid choice.")
+
+    def view_alerts(self, limit=50):
+        alerts = self.scanner.alerts.recent(limit)
+        if not alerts:
+            print("\nNo alerts.")
+        else:
+            print(f"\n{'id':<6} {'Time':<20} {'Source':<12} {'Severity':<9} {'Title':<30} Target")
+            for alert_id, timestamp, source, severity, title, target, detail in alerts:
+                print(f"{alert_id:<6} {timestamp:<20} {source:<12} {severity:<9} {title:<30} {target or ''}")
+            # Viewing the alerts resets the counter
+            self.scanner.alerts.mark_seen(alerts[0][0])
 
     def run_scans_with_threads(self):
-        scan_thread = threading.Thread(target=self.scanner.run_scans)
-        scan_thread.start()
-        scan_thread.join()
-        print("\nScan completed!")
+        # Scans run on the scanner's background scheduler so the menu stays responsive
+        if self.scanner.scheduler.is_running():
+            print("\nScans are already running.")
+            return
+        self.scanner.start_scans()
+        print("\nScans started!")
         
+    def shutdown(self):
+        # Stops the scans, carries out the responses already queued, writes the final metrics and
+        # flushes the log before the process goes away
+        self.scanner.stop_scans()
+        shutdown_logging()
+
     def run(self):
+        try:
+            self.menu_loop()
+        finally:
+            self.shutdown()
+
+    def menu_loop(self):
         while True:
             choice = self.display_menu_options()
 
@@ -67,6 +195,8 @@ class Menu:
                 self.view_tables()
             elif choice == "3":
                 self.trusted_connection_option()
+            elif choice == "4":
+                self.view_alerts()
             elif choice == "5":
                 print("Exiting program...")
                 break
@@ -0,0 +1,241 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Counters every stage run reports, the rest of a run's counts go into the Counts column as JSON
+RUN_COUNTS = ('items', 'bytes', 'rows', 'errors')
+
+_current = threading.local()
+
+
+def current_run():
+    # Innermost stage running on this thread, or None
+    stack = getattr(_current, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def count(key, amount=1):
+    # Attributes the amount to whatever stage is running on this thread, a no-op outside of one
+    run = current_run()
+    if run is not None:
+        run.count(key, amount)
+
+
+class StageRun:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.monotonic()
+        self.duration = None
+        self.status = 'running'
+        self.counts = dict.fromkeys(RUN_COUNTS, 0)
+        self.lock = threading.Lock()
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + amount
+
+    @property
+    def elapsed(self):
+        return self.duration if self.duration is not None else time.monotonic() - self.start
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        return {'kind': self.kind, 'name': self.name, 'status': self.status, 'started_at': self.started_at,
+                'elapsed': self.elapsed, **counts}
+
+
+class Metrics:
+    # In-process registry for scan stages and response actions. Stages are timed with stage(), code
+    # running inside one reports through count() without being handed the run. Finished runs are
+    # folded into the counters, kept in a short history for the menu and written to ScanRuns.
+    def __init__(self, database=None, history=200, export_path=None, export_interval=5.0):
+        self.database = database
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.last_export = None
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+        self.active = set()
+        self.recent = deque(maxlen=history)
+        # Called before each export to refresh values owned elsewhere, e.g. the logger's drop count
+        self.collectors = []
+
+    def setup_database(self):
+        with self.database.writer().transaction() as cursor:
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS ScanRuns (
+                               id INTEGER PRIMARY KEY,
+                               Kind TEXT NOT NULL,
+                               Name TEXT NOT NULL,
+                               StartedAt TEXT NOT NULL,
+                               Duration REAL,
+                               Status TEXT NOT NULL,
+                               Items INTEGER,
+                               Bytes INTEGER,
+                               RowsWritten INTEGER,
+                               Errors INTEGER,
+                               Counts TEXT
+                            )
+                        ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_ScanRuns_Name ON ScanRuns (Kind, Name, id)")
+
+    def count(self, key, amount=1):
+        count(key, amount)
+
+    def inc(self, metric, amount=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, metric, value, **labels):
+        with self.lock:
+            self.gauges[(metric, tuple(sorted(labels.items())))] = value
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def observe(self, metric, seconds, **labels):
+        # Count, sum and max, enough for rates and averages without keeping every sample
+        key = (metric, tuple(sorted(labels.items())))
+        with self.lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def stage(self, name, kind='stage'):
+        run = StageRun(kind, name)
+        stack = getattr(_current, 'stack', None)
+        if stack is None:
+            stack = _current.stack = []
+        stack.append(run)
+        with self.lock:
+            self.active.add(run)
+        try:
+            yield run
+        except BaseException:
+            run.status = 'error'
+            run.count('errors')
+            raise
+        else:
+            # The caller may have set a status of its own, e.g. a stage that caught its own failure
+            if run.status == 'running':
+                run.status = 'ok'
+        finally:
+            stack.pop()
+            run.duration = time.monotonic() - run.start
+            with self.lock:
+                self.active.discard(run)
+            self.finish(run)
+            if not stack:
+                self.export()
+
+    def record(self, kind, name, duration, status, **counts):
+        # For work timed elsewhere, such as a response action the queue has already timed
+        run = StageRun(kind, name)
+        run.started_at -= duration
+        run.duration = duration
+        run.status = status
+        for key, amount in counts.items():
+            run.count(key, amount)
+        self.finish(run)
+        self.export()
+
+    def finish(self, run):
+        labels = {'kind': run.kind, 'name': run.name}
+        self.observe('duration_seconds', run.duration, **labels)
+        self.inc('runs_total', 1, status=run.status, **labels)
+        for key, amount in run.counts.items():
+            if amount:
+                self.inc(f"{key}_total", amount, **labels)
+        with self.lock:
+            self.recent.append(run)
+        if self.database is not None:
+            extra = {key: amount for key, amount in run.counts.items() if key not in RUN_COUNTS}
+            with self.database.writer() as writer:
+                writer.add('''
+                           INSERT INTO ScanRuns (Kind, Name, StartedAt, Duration, Status, Items, Bytes, RowsWritten, Errors, Counts)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (run.kind, run.name, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run.started_at)), run.duration,
+                      run.status) + tuple(run.counts[key] for key in RUN_COUNTS) + (json.dumps(extra) if extra else None,))
+
+    def running(self):
+        # Live view of the stages in progress, with their counts so far
+        with self.lock:
+            runs = list(self.active)
+        return sorted((run.snapshot() for run in runs), key=lambda run: run['started_at'])
+
+    def last_runs(self, kind=None, name=None):
+        with self.lock:
+            runs = list(self.recent)
+        return [run.snapshot() for run in runs if (kind is None or run.kind == kind) and (name is None or run.name == name)]
+
+    def history(self, name, kind='stage', limit=20):
+        # Past runs from ScanRuns, newest first, so trends survive restarts
+        return self.database.query('''
+            SELECT StartedAt, Duration, Status, Items, Bytes, RowsWritten, Errors FROM ScanRuns
+            WHERE Kind = ? AND Name = ? ORDER BY id DESC LIMIT ?
+        ''', (kind, name, limit))
+
+    def prometheus_text(self, prefix='mchammer'):
+        def series(name, labels, value):
+            label_text = ','.join(f'{key}="{escape_label(label)}"' for key, label in labels)
+            return f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}"
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            timings = sorted(self.timings.items())
+        lines = []
+        typed = set()
+
+        def type_line(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        for kind, items in (('counter', counters), ('gauge', gauges)):
+            for (name, labels), value in items:
+                type_line(name, kind)
+                lines.append(series(name, labels, value))
+        for (name, labels), (samples, total, longest) in timings:
+            type_line(name, 'summary')
+            lines.append(series(f"{name}_count", labels, samples))
+            lines.append(series(f"{name}_sum", labels, f"{total:.6f}"))
+        for (name, labels), (samples, total, longest) in timings:
+            type_line(f"{name}_max", 'gauge')
+            lines.append(series(f"{name}_max", labels, f"{longest:.6f}"))
+        return '\n'.join(lines) + '\n'
+
+    def export(self, force=False):
+        # Rewrites the Prometheus file when a top-level run finishes, at most once per export_interval
+        if self.export_path is None:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if not force and self.last_export is not None and now - self.last_export < self.export_interval:
+                return
+            self.last_export = now
+        for collector in self.collectors:
+            collector()
+        self.write_prometheus(self.export_path)
+
+    def write_prometheus(self, path):
+        # Written to a temporary file and renamed, so a collector never reads half a file
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_path, path)
@@ -0,0 +1,135 @@
+import threading
+import time
+from contextlib import nullcontext
+
+
+class StageResult:
+    def __init__(self, name):
+        self.name = name
+        self.status = 'pending'
+        self.started_at = None
+        self.duration = None
+        self.error = None
+        self.result = None
+
+    def __repr__(self):
+        return f"StageResult({self.name!r}, {self.status!r}, duration={self.duration})"
+
+
+class CycleResult:
+    def __init__(self, stages):
+        self.stages = {name: StageResult(name) for name in stages}
+        self.started_at = time.time()
+        self.duration = None
+
+    @property
+    def ok(self):
+        return all(stage.status == 'ok' for stage in self.stages.values())
+
+    def summary(self):
+        return ', '.join(f"{stage.name}={stage.status}" +
+                         (f" ({stage.duration:.1f}s)" if stage.duration is not None else '')
+                         for stage in self.stages.values())
+
+
+class ScanOrchestrator:
+    # Runs independent scan stages at the same time on a thread pool, so a cycle takes roughly as long
+    # as its slowest stage. Stages that pass their timeout are reported and abandoned (threads can't be
+    # killed), and cancel() stops stages that haven't started yet. An abandoned stage is tracked until it
+    # does finish, a later cycle skips that stage rather than starting a second copy next to it.
+    def __init__(self, logger=None, metrics=None):
+        self.logger = logger
+        self.metrics = metrics
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+        self.active = {}
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def resume(self):
+        # Cycles run concurrently from the scheduler's jobs, so one starting doesn't undo a cancel()
+        self.cancel_event.clear()
+
+    def run(self, stages, max_workers=None):
+        # stages is a list of (name, func, timeout) where timeout may be None
+        cycle = CycleResult([name for name, _, _ in stages])
+        start = time.monotonic()
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        executor = ThreadPoolExecutor(max_workers=max_workers or len(stages), thread_name_prefix='ScanStage')
+        futures = {}
+        deadlines = {}
+        try:
+            for name, func, timeout in stages:
+                with self.lock:
+                    previous = self.active.get(name)
+                    if previous is not None and not previous.done():
+                        cycle.stages[name].status = 'skipped'
+                        self.log(f"Skipping scan stage '{name}', an earlier run is still going")
+                        continue
+                    future = executor.submit(self._run_stage, cycle.stages[name], func)
+                    self.active[name] = future
+                futures[future] = name
+                if timeout is not None:
+                    deadlines[name] = start + timeout
+
+            pending = set(futures)
+            while pending:
+                now = time.monotonic()
+                if self.cancel_event.is_set():
+                    for future in pending:
+                        if future.cancel():
+                            cycle.stages[futures[future]].status = 'cancelled'
+                    pending = {future for future in pending if not future.cancelled()}
+
+                # Stages past their deadline are abandoned
+                for future in list(pending):
+                    name = futures[future]
+                    if name in deadlines and now >= deadlines[name] and not future.done():
+                        stage = cycle.stages[name]
+                        stage.status = 'timeout'
+                        stage.duration = now - start
+                        self.log(f"Scan stage '{name}' timed out")
+                        future.cancel()
+                        pending.discard(future)
+                if not pending:
+                    break
+
+                upcoming = [deadlines[futures[future]] for future in pending if futures[future] in deadlines]
+                timeout = max(0, min(upcoming) - time.monotonic()) if upcoming else None
+                # Wake up at least every second so cancel() is noticed
+                timeout = 1.0 if timeout is None else min(timeout, 1.0)
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        cycle.duration = time.monotonic() - start
+        return cycle
+
+    def _run_stage(self, stage, func):
+        if self.cancel_event.is_set():
+            stage.status = 'cancelled'
+            return
+        stage.status = 'running'
+        stage.started_at = time.time()
+        start = time.monotonic()
+        with self.metrics.stage(stage.name) if self.metrics is not None else nullcontext() as run:
+            try:
+                stage.result = func()
+                status = 'ok'
+            except Exception as e:
+                stage.error = str(e)
+                status = 'failed'
+                self.log(f"Scan stage '{stage.name}' failed: {stage.error}")
+                if run is not None:
+                    run.status = status
+                    run.count('errors')
+        # A stage that already timed out keeps that status
+        if stage.status == 'running':
+            stage.status = status
+            stage.duration = time.monotonic() - start
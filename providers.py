@@ -0,0 +1,91 @@
+import importlib
+import sys
+import threading
+
+# Platform backends by kind. Entries are 'module:attribute' strings, so a backend's module (and the
+# win32/winreg/psutil imports inside it) is only imported when a scan first uses that backend.
+# 'windows' is the default on Windows, 'fake' the stand-in everywhere else.
+PROVIDERS = {
+    'registry': {
+        'windows': 'autoruns:WinRegistry',
+        'fake': 'autoruns:FakeRegistry',
+    },
+    'accounts': {
+        'windows': 'accounts:Win32NetAccountProvider',
+        'fake': 'accounts:FakeAccountProvider',
+    },
+    'firewall': {
+        'windows': 'actions:Actions',
+        'fake': 'actions:NullActions',
+    },
+    'connections': {
+        'windows': 'connections:default_connection_source',
+        'fake': 'connections:default_connection_source',
+    },
+    'events': {
+        'windows': 'event_ingestion:WinEventSource',
+        'fake': 'event_ingestion:FakeEventSource',
+    },
+}
+
+# Third-party backends register under this entry point group as '<kind>.<name> = module:attribute'
+ENTRY_POINT_GROUP = 'mc_hammer.providers'
+
+
+def default_backend():
+    return 'windows' if sys.platform == 'win32' else 'fake'
+
+
+def plugin_providers(kind):
+    # Only consulted for names that aren't built in, so normal startup never scans the installed packages
+    from importlib.metadata import entry_points
+    prefix = f"{kind}."
+    return {entry.name[len(prefix):]: entry.value for entry in entry_points(group=ENTRY_POINT_GROUP)
+            if entry.name.startswith(prefix)}
+
+
+def resolve(kind, name=None):
+    name = name or default_backend()
+    target = PROVIDERS.get(kind, {}).get(name) or plugin_providers(kind).get(name)
+    if target is None:
+        raise ValueError(f"No '{name}' provider for {kind}")
+    module_name, _, attribute = target.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def create(kind, name=None, **kwargs):
+    # Backends of one kind don't share a constructor, each is given the keyword arguments it accepts
+    import inspect
+    factory = resolve(kind, name)
+    parameters = inspect.signature(factory).parameters
+    if not any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+        kwargs = {key: value for key, value in kwargs.items() if key in parameters}
+    return factory(**kwargs)
+
+
+class LazyProvider:
+    # Stands in for a backend until the first attribute access, which imports and constructs it
+    def __init__(self, kind, name=None, **kwargs):
+        self._kind = kind
+        self._name = name
+        self._kwargs = kwargs
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def instance(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = create(self._kind, self._name, **self._kwargs)
+        return self._instance
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self.instance, attribute)
+
+    def __repr__(self):
+        return f"LazyProvider({self._kind!r}, {self._name!r}, loaded={self.loaded})"
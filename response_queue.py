@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+# action is one of ACTIONS, target identifies what it acts on (and is the dedupe key together with the
+# action), args are the extra arguments for the Actions method
+Intent = namedtuple('Intent', ['action', 'target', 'args'])
+
+ACTIONS = ('block_ip', 'disable_user', 'remove_executable', 'delete_autorun')
+
+
+class RateLimiter:
+    # Token bucket: `rate` actions per second on average with bursts of up to `burst`
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def acquire(self, stopping=None):
+        while True:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            wait = (1 - self.tokens) / self.rate
+            if stopping is not None:
+                if stopping.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class ResponseQueue:
+    # Scans submit response intents and return immediately. A single worker thread dedupes them,
+    # coalesces IP blocks into one firewall update per batch, applies the rate limit and records
+    # every outcome in ActionLog. With dry_run nothing is executed, intents are only logged.
+    def __init__(self, database, actions, logger=None, trusted_networks=None, dry_run=False, rate_limit=2.0, burst=10,
+                 timeout=30, batch_window=0.5, metrics=None):
+        self.database = database
+        self.metrics = metrics
+        self.actions = actions
+        self.logger = logger
+        self.trusted_networks = trusted_networks
+        self.dry_run = dry_run
+        self.limiter = RateLimiter(rate_limit, burst)
+        self.timeout = timeout
+        self.batch_window = batch_window
+        self.queue = deque()
+        self.pending = set()
+        self.active = 0
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def setup_database(self):
+        self.database.execute('''
+                              CREATE TABLE IF NOT EXISTS ActionLog (
+                                  id INTEGER PRIMARY KEY,
+                                  Timestamp TEXT NOT NULL,
+                                  Action TEXT NOT NULL,
+                                  Target TEXT NOT NULL,
+                                  Status TEXT NOT NULL,
+                                  Duration REAL,
+                                  Detail TEXT
+                              )
+        ''')
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def submit(self, action, target, *args):
+        # Returns False when the same intent is already waiting or running
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown response action '{action}'")
+        key = (action, target)
+        with self.condition:
+            if key in self.pending:
+                return False
+            self.pending.add(key)
+            self.queue.append(Intent(action, target, args))
+            self.condition.notify()
+            self.report_depth()
+        self.start()
+        return True
+
+    def report_depth(self):
+        # Called with the condition held
+        if self.metrics is not None:
+            self.metrics.set_gauge('queue_depth', len(self.queue), queue='responses')
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._loop, name='ResponseQueue', daemon=True)
+            self.thread.start()
+
+    def stop(self, wait=False):
+        self.stopping.set()
+        with self.condition:
+            self.condition.notify_all()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def join(self, timeout=None):
+        # Waits until every submitted intent has been handled
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.queue or self.active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def _loop(self):
+        while not self.stopping.is_set():
+            with self.condition:
+                while not self.queue and not self.stopping.is_set():
+                    self.condition.wait()
+                if self.stopping.is_set():
+                    return
+            # Give the scan that produced the first intent a moment to submit the rest of its batch
+            self.stopping.wait(self.batch_window)
+            with self.condition:
+                batch = list(self.queue)
+                self.queue.clear()
+                self.active = len(batch)
+                self.report_depth()
+            try:
+                self.process(batch)
+            finally:
+                with self.condition:
+                    self.active = 0
+                    self.condition.notify_all()
+
+    def process(self, batch):
+        blocks = [intent for intent in batch if intent.action == 'block_ip']
+        if blocks:
+            self.run_blocks(blocks)
+        for intent in batch:
+            if intent.action != 'block_ip':
+                self.run(intent)
+
+    def run_blocks(self, intents):
+        if self.trusted_networks is not None:
+            skipped = [intent for intent in intents if self.trusted_networks.is_blocked(intent.target)]
+            if skipped:
+                self.finish(skipped, 'skipped', 0, 'already blocked')
+                intents = [intent for intent in intents if not self.trusted_networks.is_blocked(intent.target)]
+        if not intents:
+            return
+        if self.dry_run:
+            self.finish(intents, 'dry-run', 0)
+            return
+        # All addresses in the batch go into one firewall update, which counts once against the rate limit
+        self.block(intents)
+
+    def block(self, intents):
+        if not self.limiter.acquire(self.stopping):
+            return
+        start = time.monotonic()
+        status, detail = self.call(self.actions.block_IPs, [intent.target for intent in intents], timeout=self.timeout)
+        if status == 'failed' and len(intents) > 1:
+            # One bad address fails the whole update, so split the batch to find it
+            middle = len(intents) // 2
+            self.block(intents[:middle])
+            self.block(intents[middle:])
+            return
+        if status == 'ok' and self.trusted_networks is not None:
+            for intent in intents:
+                self.trusted_networks.mark_blocked(intent.target)
+        self.finish(intents, status, time.monotonic() - start, detail)
+
+    def run(self, intent):
+        if self.dry_run:
+            self.finish([intent], 'dry-run', 0)
+            return
+        if not self.limiter.acquire(self.stopping):
+            return
+        start = time.monotonic()
+        if intent.action == 'disable_user':
+            status, detail = self.call(self.actions.remove_users, intent.target, timeout=self.timeout)
+        elif intent.action == 'remove_executable':
+            status, detail = self.call(self.actions.remove_executable, intent.target)
+        else:
+            status, detail = self.call(self.actions.delete_registry_autorun, *intent.args)
+        self.finish([intent], status, time.monotonic() - start, detail)
+
+    def call(self, func, *args, **kwargs):
+        # Backends return True or False, or 'skipped' when they can't act on this platform. A skipped
+        # block is logged as such and the address isn't marked blocked.
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            return 'failed', str(e)
+        if result == 'skipped':
+            return 'skipped', 'not supported by this actions backend'
+        return ('failed', None) if result is False else ('ok', None)
+
+    def finish(self, intents, status, duration, detail=None):
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        with self.database.writer() as writer:
+            writer.add_many('''
+                               INSERT INTO ActionLog (Timestamp, Action, Target, Status, Duration, Detail)
+                               VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(timestamp, intent.action, intent.target, status, duration, detail) for intent in intents])
+        if self.logger is not None:
+            for intent in intents:
+                self.logger.event('response', logging.WARNING if status == 'failed' else logging.INFO,
+                                  action=intent.action, target=intent.target, status=status, detail=detail)
+        if self.metrics is not None:
+            # A coalesced block is one firewall update, so it's one action run covering every address
+            self.metrics.record('action', intents[0].action, duration, status, items=len(intents),
+                                errors=len(intents) if status == 'failed' else 0)
+        with self.condition:
+            for intent in intents:
+                self.pending.discard((intent.action, intent.target))
@@ -0,0 +1,129 @@
+import json
+import re
+
+MESSAGE_FIELD = re.compile(r'^[ \t]*([A-Za-z][A-Za-z ]*?):[ \t]*(.*?)[ \t]*\r?$', re.MULTILINE)
+
+MODIFIERS = ('equals', 'contains', 'startswith', 'endswith', 're')
+
+
+def event_fields(event):
+    # EventData comes from the event XML, older exports only have the rendered message to go on
+    data = event.get('EventData')
+    if data:
+        return data
+    return {name.replace(' ', ''): value for name, value in MESSAGE_FIELD.findall(event.get('Message') or '')}
+
+
+def load_rules(path):
+    # Rules are plain data, .yml/.yaml files need PyYAML, anything else is read as JSON
+    with open(path, encoding='utf-8') as file:
+        if path.endswith(('.yml', '.yaml')):
+            import yaml
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def parse_int(value):
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    return int(value, 16) if value.lower().startswith('0x') else int(value)
+
+
+class FieldMatcher:
+    # One compiled test for a field: integer values become a set lookup, string alternatives are
+    # merged into a single case-insensitive regex
+    def __init__(self, key, values):
+        field, _, modifier = key.partition('|')
+        self.field = field
+        modifier = modifier or 'equals'
+        if modifier not in MODIFIERS:
+            raise ValueError(f"Unsupported modifier '{modifier}' on field {field}")
+        values = values if isinstance(values, list) else [values]
+
+        if all(isinstance(value, int) for value in values) and modifier == 'equals':
+            self.numbers = frozenset(values)
+            self.pattern = None
+            return
+
+        self.numbers = None
+        if modifier == 're':
+            alternatives = '|'.join(f"(?:{value})" for value in values)
+            self.pattern = re.compile(alternatives, re.IGNORECASE)
+            return
+        alternatives = '|'.join(re.escape(str(value)) for value in values)
+        template = {
+            'equals': r'\A(?:{})\Z',
+            'contains': r'(?:{})',
+            'startswith': r'\A(?:{})',
+            'endswith': r'(?:{})\Z',
+        }[modifier]
+        self.pattern = re.compile(template.format(alternatives), re.IGNORECASE)
+
+    def matches(self, fields, numbers):
+        value = fields.get(self.field)
+        if value is None:
+            return False
+        if self.numbers is not None:
+            # Parsed integers are cached per event so each field is converted once
+            if self.field not in numbers:
+                try:
+                    numbers[self.field] = parse_int(value)
+                except ValueError:
+                    numbers[self.field] = None
+            return numbers[self.field] in self.numbers
+        return self.pattern.search(str(value)) is not None
+
+
+class Rule:
+    # Sigma-like rule: every field in selection must match and no filter block may match.
+    # Each filter block is itself an AND of fields.
+    def __init__(self, definition):
+        self.name = definition['name']
+        self.severity = definition.get('severity', 'high')
+        self.event_ids = frozenset(int(event_id) for event_id in definition.get('event_ids', []))
+        self.selection = [FieldMatcher(key, values) for key, values in definition.get('selection', {}).items()]
+        filters = definition.get('filter', [])
+        filters = filters if isinstance(filters, list) else [filters]
+        self.filters = [[FieldMatcher(key, values) for key, values in block.items()] for block in filters]
+
+    def matches(self, fields, numbers):
+        if not all(matcher.matches(fields, numbers) for matcher in self.selection):
+            return False
+        return not any(all(matcher.matches(fields, numbers) for matcher in block) for block in self.filters)
+
+
+class RuleEngine:
+    # Evaluates every rule against each event in a single pass, rules are bucketed by event ID
+    # so an event is only tested against the rules that can apply to it
+    def __init__(self, definitions):
+        self.rules = [Rule(definition) for definition in definitions]
+        self.by_event_id = {}
+        self.any_event = []
+        for rule in self.rules:
+            if rule.event_ids:
+                for event_id in rule.event_ids:
+                    self.by_event_id.setdefault(event_id, []).append(rule)
+            else:
+                self.any_event.append(rule)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(load_rules(path))
+
+    @property
+    def event_ids(self):
+        # Empty means at least one rule wants every event
+        return () if self.any_event else tuple(sorted(self.by_event_id))
+
+    def evaluate(self, event):
+        try:
+            event_id = int(event.get('Id', 0))
+        except (TypeError, ValueError):
+            event_id = 0
+        candidates = self.by_event_id.get(event_id, []) + self.any_event
+        if not candidates:
+            return []
+        fields = event_fields(event)
+        numbers = {}
+        return [rule for rule in candidates if rule.matches(fields, numbers)]
@@ -1,48 +1,149 @@
+import logging
 import os
-import hashlib
 import sqlite3
-import win32net
-import win32netcon
-import winreg
-import datetime
+import stat as stat_module
 import subprocess
-import sched
-import time
-from logger import Logger
-from actions import Actions
+import threading
+from contextlib import contextmanager
+from logger import Logger, dropped_records
+from analysis import Analysis
+from database import get_database
+from file_index import FileIndex
+from hashing import DIGEST_COLUMNS, FileHasher, HashingPipeline, compute_md5
+from walker import ExecutableWalker, has_executable_extension
+from trusted_networks import TrustedNetworkIndex, parse_ip
+from scheduler import ScanScheduler
+from orchestrator import ScanOrchestrator
+from metrics import Metrics
+from watcher import ChangeQueue, default_file_watcher
+from response_queue import ResponseQueue
+from alerts import Alert, AlertStore
+from autoruns import AutorunCollector, AutorunEntry
+from accounts import UF_ACCOUNTDISABLE, Account, account_key, comparable, diff_accounts
+from Highest_Highest import Highest_Highest
+from providers import LazyProvider
+from catalog import CatalogError, HashCatalog
+
+# Per-stage timeouts in seconds for the orchestrated scan cycles, None waits for the stage to finish
+STAGE_TIMEOUTS = {
+    'executables': None,
+    'users': 600,
+    'autoruns': 600,
+    'connections': 300,
+    'events': 600,
+}
+
+SCAN_ROOT = "C:\\"
+
+# Bump whenever a setup_database below changes, databases at an older user_version rerun the schema setup
+SCHEMA_VERSION = 3
+
+# Interval, jitter and max runtime in seconds for each scan type
+SCAN_SCHEDULE = {
+    'files': (7200, 300, 7200),
+    # With the watcher running the full file pass is only a safety net for missed events
+    'files_watched': (43200, 1800, 7200),
+    'users': (900, 60, 600),
+    'autoruns': (900, 60, 600),
+    'connections': (900, 30, 300),
+    'events': (900, 60, 600),
+}
 
 class Scanner:
 
-    def __init__(self, database_path):
+    def __init__(self, database_path, hash_workers=4, include_paths=None, exclude_paths=('*\\Windows\\WinSxS',),
+                 digests=('md5', 'sha256'), two_tier_hashing=False, hash_buffer_size=1024 * 1024,
+                 flush_size=1000, flush_interval=1.0, connection_source=None, schedule=None,
+                 stage_timeouts=None, watch=True, watch_paths=None, watch_debounce=2.0, file_watcher=None,
+                 registry=None, account_provider=None, actions=None, dry_run=False, metrics_path='mc_hammer.prom',
+                 event_source=None, backends=None, catalog_path='known_good.cat', build_baseline=True):
         database_path = "GuardianAngel.db"
         self.database_path = database_path
+        # Shared connection manager, rows are written in batches through BatchWriter and reads use the read-only pool
+        self.database = get_database(self.database_path, flush_size=flush_size, flush_interval=flush_interval)
         self.logger = Logger()
-        self.actions = Actions()
-        self.setup_database()
-        self.s = sched.scheduler(time.time, time.sleep)
+        # Timings and counts for every stage and response action, also written to ScanRuns and the Prometheus file
+        self.metrics = Metrics(self.database, export_path=metrics_path)
+        self.metrics.add_collector(lambda: self.metrics.set_gauge('log_records_dropped', dropped_records()))
+        # Platform backends are imported and constructed the first time a scan uses them. backends picks
+        # one by name per kind (see providers.PROVIDERS), otherwise Windows gets the real ones and other
+        # platforms the stand-ins.
+        self.backends = dict(backends or {})
+        self.registry = registry or LazyProvider('registry', self.backends.get('registry'))
+        self.autorun_collector = AutorunCollector(self.registry, logger=self.logger)
+        self.account_provider = account_provider or LazyProvider('accounts', self.backends.get('accounts'), logger=self.logger)
+        # In-memory copies of the account snapshots, so a scan only touches the rows that changed
+        self.accounts_baseline = None
+        self.current_accounts = None
+        self.actions = actions or LazyProvider('firewall', self.backends.get('firewall'), registry=self.registry)
+        self.analysis = Analysis(self.database_path)
+        self.trusted_networks = TrustedNetworkIndex(self.database, self.logger)
+        # Scans only enqueue responses, the queue's worker runs them off the scan threads
+        self.responses = ResponseQueue(self.database, self.actions, self.logger, self.trusted_networks, dry_run=dry_run,
+                                       metrics=self.metrics)
+        self.connection_source = connection_source or LazyProvider('connections', self.backends.get('connections'),
+                                                                   logger=self.logger)
+        self.walker = ExecutableWalker(include=include_paths, exclude=exclude_paths, on_error=self.log_walk_error)
+        # md5Hash stays the primary identity column, so MD5 is always computed
+        self.file_hasher = FileHasher(('md5',) + tuple(d for d in digests if d != 'md5'), two_tier=two_tier_hashing,
+                                      buffer_size=hash_buffer_size)
+        self.hashing_pipeline = HashingPipeline(self.file_hasher.hash_file, workers=hash_workers)
+        # Every detector reports through the alert store
+        self.alerts = AlertStore(self.database)
+        self.highest_highest = Highest_Highest(self.database_path, event_source=event_source, alerts=self.alerts,
+                                               backend=self.backends.get('events'))
+        self.database.migrate(SCHEMA_VERSION, [
+            ('scanner', self.setup_database),
+            ('trusted_networks', self.trusted_networks.setup_database),
+            ('metrics', self.metrics.setup_database),
+            ('highest_highest', self.highest_highest.setup_database),
+            ('responses', self.responses.setup_database),
+            ('alerts', self.alerts.setup_database),
+        ])
+        self.schedule = dict(SCAN_SCHEDULE, **(schedule or {}))
+        self.scheduler = ScanScheduler(self.logger, metrics=self.metrics)
+        self.stage_timeouts = dict(STAGE_TIMEOUTS, **(stage_timeouts or {}))
+        self.orchestrator = ScanOrchestrator(self.logger, metrics=self.metrics)
+        self.watch = watch
+        self.watch_paths = list(watch_paths or [SCAN_ROOT])
+        self.change_queue = ChangeQueue(debounce=watch_debounce)
+        self.file_watcher = file_watcher
+        self.change_thread = None
+        # The files job and the watcher's scans both write CurrentExecutables and the current FileIndex,
+        # they take turns. Watcher batches that arrive during a full pass wait in the change queue.
+        self.files_lock = threading.Lock()
+        # Known-good hashes imported from a golden host, see catalog.py. With build_baseline off the files
+        # job never records a baseline, it classifies every hashed file against the catalog instead.
+        self.catalog_path = catalog_path
+        self.catalog_signature = None
+        self.build_baseline = build_baseline
 
     def setup_database(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
+        with self.database.writer().transaction() as cursor:
             cursor.execute('''
                            CREATE TABLE IF NOT EXISTS BaselineExecutables (
                                id INTEGER PRIMARY KEY,
                                FileName TEXT NOT NULL,
                                FilePath TEXT NOT NULL,
-                               md5Hash TEXT NOT NULL
+                               md5Hash TEXT NOT NULL,
+                               sha256Hash TEXT,
+                               blake2Hash TEXT,
+                               fastHash TEXT
                             )
                         ''')
-            conn.commit()
 
             cursor.execute('''
                             CREATE TABLE IF NOT EXISTS ExecutableDiscrepancies (
                                 id INTEGER PRIMARY KEY,
+                                ChangeType TEXT,
                                 FileName TEXT NOT NULL,
                                 FilePath TEXT NOT NULL,
-                                md5Hash TEXT
+                                md5Hash TEXT,
+                                sha256Hash TEXT,
+                                blake2Hash TEXT,
+                                fastHash TEXT
                             )
                         ''')
-            conn.commit()
             
             cursor.execute('''
                             CREATE TABLE IF NOT EXISTS BaselineAccounts (
@@ -51,25 +152,36 @@ class Scanner:
                                 AccountCreationDate TEXT
                             )
                         ''')
-            conn.commit()
             
             cursor.execute('''
                             CREATE TABLE IF NOT EXISTS AccountDiscrepancies (
                                 id INTEGER PRIMARY KEY,
+                                ChangeType TEXT,
                                 UserName TEXT NOT NULL,
                                 AccountCreationDate TEXT
                             )
                         ''')
-            conn.commit()
 
             cursor.execute('''
                            CREATE TABLE IF NOT EXISTS autoruns (
                                id INTEGER PRIMARY KEY,
+                               Hive TEXT,
+                               Subkey TEXT,
                                name TEXT NOT NULL,
                                value Text NOT NULL
                             )
                         ''')
-            conn.commit()
+
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS AutorunDiscrepancies (
+                               id INTEGER PRIMARY KEY,
+                               ChangeType TEXT,
+                               Hive TEXT,
+                               Subkey TEXT,
+                               Name TEXT NOT NULL,
+                               Value TEXT NOT NULL
+                            )
+                        ''')
             
             cursor.execute('''
                            CREATE TABLE IF NOT EXISTS CurrentConnections (
@@ -77,10 +189,12 @@ class Scanner:
                                local_ip TEXT NOT NULL,
                                local_port INTEGER NOT NULL,
                                remote_ip TEXT NOT NULL,
-                               remote_port INTEGER NOT NULL
+                               remote_port INTEGER NOT NULL,
+                               protocol TEXT,
+                               state TEXT,
+                               pid INTEGER
                             )
                         ''')
-            conn.commit()
             
             cursor.execute('''
                            CREATE TABLE IF NOT EXISTS TrustedConnections (
@@ -88,7 +202,6 @@ class Scanner:
                                IP_Address TEXT NOT NULL
                             )
                         ''')
-            conn.commit()
             
             cursor.execute ('''
                             CREATE TABLE IF NOT EXISTS BlockedConnections (
@@ -96,350 +209,652 @@ class Scanner:
                                 IP_Address TEXT NOT NULL
                             )
                         ''')
-            conn.commit()
+
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS FileIndex (
+                               Scope TEXT NOT NULL,
+                               FilePath TEXT NOT NULL,
+                               Size INTEGER NOT NULL,
+                               MTime INTEGER NOT NULL,
+                               FileId INTEGER NOT NULL,
+                               md5Hash TEXT NOT NULL,
+                               sha256Hash TEXT,
+                               blake2Hash TEXT,
+                               fastHash TEXT,
+                               PRIMARY KEY (Scope, FilePath)
+                            )
+                        ''')
+
+            # Snapshot of the most recent current scans, diffed against the baseline tables by Analysis
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS CurrentExecutables (
+                               id INTEGER PRIMARY KEY,
+                               FileName TEXT NOT NULL,
+                               FilePath TEXT NOT NULL,
+                               md5Hash TEXT NOT NULL,
+                               sha256Hash TEXT,
+                               blake2Hash TEXT,
+                               fastHash TEXT
+                            )
+                        ''')
+
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS CurrentAccounts (
+                               id INTEGER PRIMARY KEY,
+                               UserName TEXT NOT NULL,
+                               AccountCreationDate TEXT
+                            )
+                        ''')
+
+            # Databases created before the extra digests were stored need the new columns added
+            for table in ('BaselineExecutables', 'ExecutableDiscrepancies', 'FileIndex'):
+                self.add_missing_columns(cursor, table, [(column, 'TEXT') for column in DIGEST_COLUMNS.values()])
+            for table in ('ExecutableDiscrepancies', 'AccountDiscrepancies'):
+                self.add_missing_columns(cursor, table, [('ChangeType', 'TEXT')])
+            self.add_missing_columns(cursor, 'CurrentConnections', [('protocol', 'TEXT'), ('state', 'TEXT'), ('pid', 'INTEGER')])
+            self.add_missing_columns(cursor, 'autoruns', [('Hive', 'TEXT'), ('Subkey', 'TEXT')])
+            for table in ('BaselineAccounts', 'CurrentAccounts', 'AccountDiscrepancies'):
+                self.add_missing_columns(cursor, table, [('SID', 'TEXT'), ('FullName', 'TEXT'), ('Flags', 'INTEGER'), ('RID', 'INTEGER')])
+            # Older baseline runs appended duplicates, drop them before the unique key goes on
+            cursor.execute('''
+                           DELETE FROM autoruns WHERE id NOT IN (
+                               SELECT MIN(id) FROM autoruns GROUP BY Hive, Subkey, name, value
+                           )
+            ''')
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_autoruns_entry ON autoruns (Hive, Subkey, name, value)")
+            cursor.execute('''
+                           CREATE UNIQUE INDEX IF NOT EXISTS idx_AutorunDiscrepancies_entry
+                           ON AutorunDiscrepancies (ChangeType, Hive, Subkey, Name, Value)
+            ''')
+
+            # Covering indexes for the snapshot diffs and the per-path updates
+            for table in ('BaselineExecutables', 'CurrentExecutables', 'ExecutableDiscrepancies'):
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_FilePath_md5Hash ON {table} (FilePath, md5Hash)")
+            # One row per path, so scans replace rows with a single INSERT OR REPLACE. Older databases
+            # may hold duplicates, only the newest row for each path is kept.
+            for table in ('BaselineExecutables', 'CurrentExecutables'):
+                cursor.execute(f"DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY FilePath)")
+                cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_FilePath ON {table} (FilePath)")
+            for table in ('BaselineAccounts', 'CurrentAccounts', 'AccountDiscrepancies'):
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_UserName ON {table} (UserName)")
+
+    def add_missing_columns(self, cursor, table, columns):
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for column, column_type in columns:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
             
     def compute_md5(self, file_path):
-        hasher = hashlib.md5()
-        with open(file_path, 'rb') as file:
-            buf = file.read(65536)  # read 64K chunks
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = file.read(65536)
-        return hasher.hexdigest()
+        return compute_md5(file_path)
     
     def is_executable(self, file_path):
-        _, ext = os.path.splitext(file_path)
-        return os.path.isfile(file_path) and ext.lower() in ['.exe', '.bat', '.cmd', '.msi', '.ps1', 'py', '.vbs', '.dll']
+        return has_executable_extension(os.path.basename(file_path)) and os.path.isfile(file_path)
+
+    def log_walk_error(self, path, error):
+        self.logger.event('file_error', logging.WARNING, path=path, error=str(error))
+
+    def changed_executables(self, start_dir, file_index):
+        # Yields (file_path, file, stat) for every executable that needs hashing.
+        # The stat comes from the cached DirEntry data, so unchanged files cost no extra syscalls.
+        for entry in self.walker.walk(start_dir):
+            try:
+                # Unchanged files were already handled on a previous pass, so skip hashing them again
+                stat = entry.stat(follow_symlinks=False)
+                if file_index.lookup(entry.path, stat) is not None:
+                    continue
+                yield (entry.path, entry.name, stat)
+
+            except OSError as e:
+                self.log_walk_error(entry.path, e)
+
+    def hash_executable(self, file_index):
+        # Hands the previous digests to the hasher so two-tier mode can skip the crypto digests
+        return lambda file_path: self.file_hasher.hash_file(file_path, file_index.previous(file_path))
+
+    def digest_values(self, digests):
+        return tuple(digests.get(name) for name in DIGEST_COLUMNS)
+
+    def write_executable(self, writer, table, row):
+        # FilePath is unique, so one statement replaces the old row and the writer batches them as they come
+        writer.add(f'''
+                           INSERT OR REPLACE INTO {table} (FileName, FilePath, md5Hash, sha256Hash, blake2Hash, fastHash)
+                           VALUES (?, ?, ?, ?, ?, ?)
+        ''', row)
+
+    def seed_current_index(self, writer, file_index, baseline):
+        # The first current pass under a root starts from the baseline's stat data, so files unchanged
+        # since the baseline aren't hashed again. Their baseline rows stand in for the current ones.
+        file_index.seed(baseline)
+        writer.add_many('''
+                           INSERT OR REPLACE INTO CurrentExecutables (FileName, FilePath, md5Hash, sha256Hash, blake2Hash, fastHash)
+                           SELECT FileName, FilePath, md5Hash, sha256Hash, blake2Hash, fastHash FROM BaselineExecutables
+                           WHERE FilePath = ?
+        ''', [(path,) for path in baseline.entries])
 
     def BaselineExecutables_Scan(self, start_dir):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            commit_counter = 0
-
-            for root, dirs, files in os.walk(start_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        # Check if the file is an executable according to the is_executable function
-                        if not self.is_executable(file_path):
-                            continue
-                        file_hash = self.compute_md5(file_path)
-                        self.logger.log(f"File Name: {file}")
-                        self.logger.log(f"File Path: {file_path}")
-                        self.logger.log(f"MD5 Hash: {file_hash}")
-                        self.logger.log('-' * 50)
-                        
-                        cursor.execute('''
-                                       INSERT INTO BaselineExecutables (FileName, FilePath, md5Hash)
-                                       VALUES (?, ?, ?)
-                        ''', (file, file_path, file_hash))
-                        commit_counter += 1
-
-                        # Commit every 100 files for more consistent saving.
-                        if commit_counter >= 100:
-                            conn.commit()
-                            commit_counter = 0
-
-                    except Exception as e:
-                        self.logger.log(f"Error processing file: {file_path} - {str(e)}")
-
-            # Final commit for any remaining files
-            conn.commit()
+        file_index = FileIndex('baseline', start_dir)
+        file_index.load(self.database)
+
+        with self.database.writer() as writer:
+            # Hashing runs on the pipeline's worker threads, this thread is the only database writer
+            for (file_path, file, stat), digests, error in self.hashing_pipeline.run(self.changed_executables(start_dir, file_index),
+                                                                                      self.hash_executable(file_index)):
+                if error is not None:
+                    self.log_walk_error(file_path, error)
+                    self.metrics.count('errors')
+                    continue
+
+                self.metrics.count('items')
+                self.metrics.count('bytes', stat.st_size)
+                file_index.update(file_path, stat, digests)
+                self.logger.event('file_hashed', logging.DEBUG, path=file_path, md5=digests['md5'])
+                self.write_executable(writer, 'BaselineExecutables', (file, file_path) + self.digest_values(digests))
+
+            # Files that disappeared since the last pass are dropped from the baseline
+            for file_path in file_index.deleted():
+                self.logger.event('file_deleted', path=file_path)
+            writer.add_many('DELETE FROM BaselineExecutables WHERE FilePath = ?', [(path,) for path in file_index.deleted()])
+            file_index.save(writer)
+
+    def load_catalog(self):
+        # Returns a newly opened catalog, or None. Problems are logged once per version of the file.
+        try:
+            stat = os.stat(self.catalog_path) if self.catalog_path else None
+        except OSError:
+            stat = None
+        signature = (stat.st_mtime_ns, stat.st_size) if stat is not None else None
+        changed = signature != self.catalog_signature
+        self.catalog_signature = signature
+        if signature is None:
+            return None
+        try:
+            catalog = HashCatalog(self.catalog_path)
+        except (OSError, CatalogError) as e:
+            if changed:
+                self.logger.log(f"Error loading known-good catalog: {str(e)}")
+            return None
+        if catalog.digest not in self.file_hasher.digests:
+            # Every lookup would miss and every file would be reported unknown
+            catalog.close()
+            if changed:
+                self.logger.log(f"Known-good catalog holds {catalog.digest} hashes but the scanner computes "
+                                f"{', '.join(self.file_hasher.digests)}, not using it")
+            return None
+        if changed:
+            self.logger.log(f"Loaded known-good catalog: {len(catalog)} {catalog.digest} hashes")
+        return catalog
+
+    @contextmanager
+    def open_catalog(self):
+        # Mapped for one scan and closed after it. Windows won't replace a file that's mapped, so holding
+        # it between scans would make every import fail.
+        catalog = self.load_catalog()
+        try:
+            yield catalog
+        finally:
+            if catalog is not None:
+                catalog.close()
+
+    def classify(self, catalog, digests, unknown, row):
+        # O(log n) lookup per hashed file, anything not in the catalog is kept for the unknown check
+        if catalog is None:
+            return
+        if catalog.contains(digests):
+            self.metrics.count('known_good')
+        else:
+            unknown.append(row)
 
     def CurrentExecutables_Scan(self, start_dir):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            commit_counter = 0
-
-            # Clears the existing database for new entries 
-            for root, dirs, files in os.walk(start_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        if not self.is_executable(file_path):
-                            continue
-                        file_hash = self.compute_md5(file_path)
-                        self.logger.log(f"File Name: {file}")
-                        self.logger.log(f"File Path: {file_path}")
-                        self.logger.log(f"MD5 Hash: {file_hash}")
-                        self.logger.log('-' * 50)
-                        
-                        cursor.execute('''
-                                       SELECT * FROM ExecutableDiscrepancies WHERE FileName = ? AND FilePath = ? and md5Hash = ? 
-                        ''', (file, file_path, file_hash))
-                        
-                        if cursor.fetchone() is None:
-                            cursor.execute('''
-                                           INSERT INTO ExecutableDiscrepancies (FileName, FilePath, md5Hash)
-                                           VALUES (?, ?, ?)
-                            ''', (file, file_path, file_hash))
-                            
-                            self.actions.remove_executable(file_path)
-                            
-                            commit_counter += 1
-
-                        # Commit every 100 files for more consistent saving.
-                        if commit_counter >= 100:
-                            conn.commit()
-                            commit_counter = 0
-
-                    except Exception as e:
-                        self.logger.log(f"Error processing file: {file_path} - {str(e)}")
-
-            # Final commit for any remaining files
-            conn.commit()
+        file_index = FileIndex('current', start_dir)
+        file_index.load(self.database)
+        baseline_index = FileIndex('baseline', start_dir)
+        baseline_index.load(self.database)
+        with self.open_catalog() as catalog:
+            unknown = []
+
+            with self.database.writer() as writer:
+                if not file_index.entries:
+                    self.seed_current_index(writer, file_index, baseline_index)
+                # Keep the CurrentExecutables snapshot up to date, only changed files are rewritten
+                for (file_path, file, stat), digests, error in self.hashing_pipeline.run(self.changed_executables(start_dir, file_index),
+                                                                                          self.hash_executable(file_index)):
+                    if error is not None:
+                        self.log_walk_error(file_path, error)
+                        self.metrics.count('errors')
+                        continue
+
+                    self.metrics.count('items')
+                    self.metrics.count('bytes', stat.st_size)
+                    file_index.update(file_path, stat, digests)
+                    self.logger.event('file_hashed', logging.DEBUG, path=file_path, md5=digests['md5'])
+                    row = (file, file_path) + self.digest_values(digests)
+                    self.write_executable(writer, 'CurrentExecutables', row)
+                    self.classify(catalog, digests, unknown, row)
+
+                for file_path in file_index.deleted():
+                    self.logger.event('file_deleted', path=file_path)
+                writer.add_many('DELETE FROM CurrentExecutables WHERE FilePath = ?', [(path,) for path in file_index.deleted()])
+                file_index.save(writer)
+
+                with writer.transaction() as cursor:
+                    # Without a baseline every file would look new, so don't act on the diff. The catalog
+                    # still classifies the files hashed in this pass.
+                    cursor.execute("SELECT 1 FROM BaselineExecutables LIMIT 1")
+                    if cursor.fetchone() is None:
+                        if catalog is None:
+                            self.logger.log("No baseline executables recorded, skipping executable discrepancy check")
+                            return
+                        unknown = self.record_unknown_executables(cursor, unknown)
+                        discrepancies = []
+                    else:
+                        unknown = []
+                        # Only files under this root are compared, other roots' files aren't missing from it
+                        paths = set(file_index.entries).union(baseline_index.entries)
+                        discrepancies = self.analysis.find_executable_discrepancies(cursor, paths=paths)
+
+            self.handle_unknown_executables(unknown)
+            self.handle_executable_discrepancies(discrepancies, catalog)
+
+    def record_unknown_executables(self, cursor, rows):
+        # Returns the rows not already recorded as unknown, after recording them. The rows go through a
+        # temp table so both steps are one set-based statement instead of a lookup per file.
+        columns = 'FileName, FilePath, md5Hash, sha256Hash, blake2Hash, fastHash'
+        new_rows = f'''
+            SELECT 'unknown', {columns} FROM temp.UnknownExecutables AS u
+            WHERE NOT EXISTS (SELECT 1 FROM ExecutableDiscrepancies AS d
+                              WHERE d.FilePath = u.FilePath AND d.md5Hash = u.md5Hash AND d.ChangeType = 'unknown')
+        '''
+        cursor.execute('DROP TABLE IF EXISTS temp.UnknownExecutables')
+        cursor.execute(f"CREATE TEMP TABLE UnknownExecutables ({columns})")
+        cursor.executemany("INSERT INTO temp.UnknownExecutables VALUES (?, ?, ?, ?, ?, ?)", rows)
+        new = cursor.execute(new_rows).fetchall()
+        cursor.execute(f"INSERT INTO ExecutableDiscrepancies (ChangeType, {columns}) {new_rows}")
+        cursor.execute('DROP TABLE temp.UnknownExecutables')
+        return new
+
+    def handle_unknown_executables(self, unknown):
+        # Not being in the catalog isn't proof of anything, so unknown files are reported but never removed
+        self.alerts.add_many([Alert('executables', 'medium', "Executable unknown", row[2], row[3]) for row in unknown])
+        for row in unknown:
+            self.logger.event('executable_unknown', logging.WARNING, path=row[2], md5=row[3])
+
+    def handle_executable_discrepancies(self, discrepancies, catalog=None):
+        # Discrepancies arrive here only the first time they're recorded. Added or modified files whose
+        # new hash is known-good (a vendor update, say) are reported at low severity and left alone.
+        # Rows carry every DIGEST_COLUMNS value, so the catalog is checked with whichever digest it holds
+        known = {file_path for change_type, file, file_path, *hashes in discrepancies
+                 if catalog is not None and change_type != 'removed' and catalog.contains(dict(zip(DIGEST_COLUMNS, hashes)))}
+        self.alerts.add_many([Alert('executables', 'low' if file_path in known else 'medium' if change_type == 'removed' else 'high',
+                                    f"Executable {change_type}" + (" (known-good)" if file_path in known else ''), file_path, file_hash)
+                              for change_type, file, file_path, file_hash, *_ in discrepancies])
+        for change_type, file, file_path, file_hash, *_ in discrepancies:
+            self.logger.event('executable_changed', logging.WARNING, change=change_type, path=file_path, md5=file_hash,
+                              known_good=file_path in known)
+            if change_type == 'removed' or file_path in known:
+                continue
+            self.responses.submit('remove_executable', file_path)
+
+    def ChangedExecutables_Scan(self, changes):
+        # Hashes only the paths the watcher reported and diffs just those against the baseline. Their
+        # FileIndex entries are updated too, so the next full pass doesn't hash them again.
+        file_index = FileIndex('current')
+        present = []
+        deleted = []
+        for file_path in changes:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                stat = None
+            if stat is not None and stat_module.S_ISREG(stat.st_mode):
+                present.append((file_path, os.path.basename(file_path), stat))
+            else:
+                deleted.append((file_path,))
+                file_index.remove(file_path)
+        with self.open_catalog() as catalog:
+            unknown = []
+
+            with self.database.writer() as writer:
+                for (file_path, file, stat), digests, error in self.hashing_pipeline.run(present):
+                    if error is not None:
+                        self.log_walk_error(file_path, error)
+                        self.metrics.count('errors')
+                        continue
+                    self.metrics.count('items')
+                    self.metrics.count('bytes', stat.st_size)
+                    file_index.update(file_path, stat, digests)
+                    row = (file, file_path) + self.digest_values(digests)
+                    self.write_executable(writer, 'CurrentExecutables', row)
+                    self.classify(catalog, digests, unknown, row)
+                writer.add_many('DELETE FROM CurrentExecutables WHERE FilePath = ?', deleted)
+                file_index.save(writer)
+
+                with writer.transaction() as cursor:
+                    cursor.execute("SELECT 1 FROM BaselineExecutables LIMIT 1")
+                    if cursor.fetchone() is None:
+                        if catalog is None:
+                            return
+                        unknown = self.record_unknown_executables(cursor, unknown)
+                        discrepancies = []
+                    else:
+                        unknown = []
+                        discrepancies = self.analysis.find_executable_discrepancies(cursor, paths=list(changes))
+
+            self.handle_unknown_executables(unknown)
+            self.handle_executable_discrepancies(discrepancies, catalog)
             
     def get_users(self):
-        users = []
-        level = 3  # Using level 3 to get detailed information about the user
-        resume = 0
-        while True:
-            (user_list, total, resume) = win32net.NetUserEnum(None, level, win32netcon.FILTER_NORMAL_ACCOUNT, resume, win32netcon.MAX_PREFERRED_LENGTH)
-            users.extend(user_list)
-            if not resume:
-                break
-        return users
+        return self.account_provider.accounts()
+
+    def disable_guest(self, accounts):
+        # The Guest account is disabled whenever it is found enabled
+        for account in accounts:
+            if account.username.lower() == 'guest' and not (account.flags or 0) & UF_ACCOUNTDISABLE:
+                self.responses.submit('disable_user', account.username)
     
     def connection_handler(self):
-        self.get_current_connections()
-        
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            
-        cursor.execute("SELECT local_ip, remote_ip FROM CurrentConnections")
-        current_connections = [ip for row in cursor.fetchall() for ip in row]
-        trusted_IP = self.actions.fetch_trusted_IPs()
+        connections = self.get_current_connections()
+        current_connections = {ip for conn in connections for ip in (conn.local_ip, conn.remote_ip)}
+        self.trusted_networks.refresh()
         for ip in current_connections:
-            if ip not in trusted_IP:
+            address = parse_ip(ip)
+            if address is None or address.is_unspecified:
+                continue
+            ip = str(address)
+            # Already-blocked addresses are skipped so netsh never runs twice for the same IP
+            if self.trusted_networks.is_trusted(address) or self.trusted_networks.is_blocked(ip):
+                continue
+            # The response queue coalesces the blocks and records them in BlockedConnections
+            if self.responses.submit('block_ip', ip):
                 self.logger.log(f"Blocking IP {ip}")
-                self.actions.block_IP(ip)
+                self.alerts.add('connections', 'high', "Untrusted connection", ip)
 
-    def BaselineUsers_Scan(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
+    def load_accounts_baseline(self):
+        if self.accounts_baseline is None:
+            rows = self.database.query("SELECT SID, UserName, FullName, Flags, RID FROM BaselineAccounts")
+            self.accounts_baseline = {account_key(account): account for account in map(Account._make, rows)}
+        return self.accounts_baseline
 
-            for user in self.get_users():
-                username = user['name']
-                
-                # If the Guest account is detected, delete it
-                if username == "guest" or username == "Guest":
-                    self.actions.remove_users(username)
-                    
-                # Extracting account creation approximation date
-                password_age = user.get('password_age', None)
-                if password_age is not None:
-                    creation_date = (datetime.datetime.now() - datetime.timedelta(seconds=password_age)).strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    creation_date = None
-                
-                self.logger.log(f"Username: {username}")
-                self.logger.log(f"Account Creation Approximation Date: {creation_date}")
-                self.logger.log('-' * 50)
-                
-                
-                cursor.execute('''
-                    INSERT INTO BaselineAccounts (UserName, AccountCreationDate)
-                    VALUES (?, ?)
-                ''', (username, creation_date))
-                
-            conn.commit()
+    def write_accounts(self, cursor, table, accounts, previous=None):
+        # Without the previous snapshot the table is replaced, otherwise only changed accounts are rewritten
+        if previous is None:
+            cursor.execute(f"DELETE FROM {table}")
+            stale, fresh = (), list(accounts.values())
+        else:
+            stale = [account for key, account in previous.items() if accounts.get(key) != account]
+            fresh = [account for key, account in accounts.items() if previous.get(key) != account]
+        cursor.executemany(f"DELETE FROM {table} WHERE UserName = ? AND SID IS ?", [(account.username, account.sid) for account in stale])
+        cursor.executemany(f"INSERT INTO {table} (SID, UserName, FullName, Flags, RID) VALUES (?, ?, ?, ?, ?)", fresh)
+
+    def BaselineUsers_Scan(self):
+        snapshot = self.account_provider.snapshot()
+        self.metrics.count('items', len(snapshot))
+        self.disable_guest(snapshot.values())
+        with self.database.writer().transaction() as cursor:
+            self.write_accounts(cursor, 'BaselineAccounts', snapshot)
+        self.accounts_baseline = snapshot
+        self.logger.log(f"Baseline accounts: {len(snapshot)} recorded")
 
     def CurrentUsers_Scan(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
+        baseline = self.load_accounts_baseline()
+        current = self.account_provider.snapshot()
+        self.metrics.count('items', len(current))
+        self.disable_guest(current.values())
+        changes = diff_accounts(baseline, current) if baseline else []
 
-            # Clear existing records from CurrentAccounts table
-            cursor.execute("SELECT UserName FROM BaselineAccounts")
-            baseline_users = [row[0] for row in cursor.fetchall()]
-            
-            for user in self.get_users():
-                username = user['name']
-                
-                # If the Guest account is detected, delete it
-                if username == "guest" or username == "Guest":
-                    self.actions.remove_users(username)
-                    
-                # Extracting account creation approximation date
-                password_age = user.get('password_age', None)
-                if password_age is not None:
-                    creation_date = (datetime.datetime.now() - datetime.timedelta(seconds=password_age)).strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    creation_date = None
-            
-                self.logger.log(f"Username: {username}")
-                self.logger.log(f"Account Creation Approximation Date: {creation_date}")
-                self.logger.log('-' * 50)
-                
-                if username not in baseline_users:
-                    self.actions.remove_users(username)
-                    self.logger.log(f"User '{username}' has been disabled")
-                    continue
+        with self.database.writer().transaction() as cursor:
+            self.write_accounts(cursor, 'CurrentAccounts', current, self.current_accounts)
+            # Only discrepancies that aren't already recorded are written, found with one EXCEPT
+            columns = 'ChangeType, SID, UserName, FullName, Flags, RID'
+            cursor.execute('DROP TABLE IF EXISTS temp.AccountChanges')
+            cursor.execute(f"CREATE TEMP TABLE AccountChanges ({columns})")
+            cursor.executemany("INSERT INTO temp.AccountChanges VALUES (?, ?, ?, ?, ?, ?)",
+                               [(change_type,) + comparable(account) for change_type, account in changes])
+            cursor.execute(f"SELECT {columns} FROM temp.AccountChanges EXCEPT SELECT {columns} FROM AccountDiscrepancies")
+            rows = cursor.fetchall()
+            cursor.executemany(f"INSERT INTO AccountDiscrepancies ({columns}) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            cursor.execute('DROP TABLE temp.AccountChanges')
+        self.current_accounts = current
+        self.alerts.add_many([Alert('accounts', 'high' if row[0] == 'added' else 'medium', f"Account {row[0]}", row[2], row[1])
+                              for row in rows])
 
-                cursor.execute('''
-                               SELECT * FROM BaselineAccounts WHERE username = ? AND AccountCreationDate = ?
-                ''', (username, creation_date))
-                
-                if cursor.fetchone() is None:
-                    cursor.execute('''
-                                   INSERT INTO AccountDiscrepancies (UserName, AccountCreationDate)
-                                   VALUES (?, ?)
-                    ''', (username, creation_date))
-            
-            conn.commit()
+        for change_type, account in changes:
+            self.logger.event('account_changed', logging.WARNING, change=change_type, user=account.username, sid=account.sid)
+            if change_type == 'added' and not (account.flags or 0) & UF_ACCOUNTDISABLE:
+                self.responses.submit('disable_user', account.username)
             
-    def fetch_registry_keys(self, hive, subkey):
-        data = []
-        try:
-            with winreg.OpenKey(hive, subkey) as key:
-                i = 0
-                while True:
-                    try:
-                        name, value, _ = winreg.EnumValue(key, i)
-                        data.append((name, value))
-                        i += 1
-                    except WindowsError:
-                        break
-        except FileNotFoundError:
-            print(f"{subkey} not found.")
-        except PermissionError:
-            print(f"Permission denied accessing {subkey}. Ensure script is run with administrative permissions.")
-        return data
-    
+    def load_autoruns_baseline(self):
+        # Loaded once per cycle into a set so the comparison is a single set difference
+        return {AutorunEntry(*row) for row in self.database.query("SELECT Hive, Subkey, name, value FROM autoruns")}
+
     def fetch_registry_autoruns(self):
-        autorun_locations = [
-        (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\\Microsoft\Windows\\CurrentVersion\\Run"),
-        (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\\Microsoft\Windows\\CurrentVersion\\RunOnce"),
-        (winreg.HKEY_CURRENT_USER, r"Software\\Microsoft\Windows\\CurrentVersion\\Run"),
-        (winreg.HKEY_CURRENT_USER, r"Software\\Microsoft\Windows\\CurrentVersion\\RunOnce"),
-        ]
-        
-        all_data = []
-        for hive, subkey in autorun_locations:
-            data = self.fetch_registry_keys(hive, subkey)
-            all_data.extend(data)
-        
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            for name, value in all_data:
-                cursor.execute('''
-                               INSERT INTO autoruns (name, value)
-                               VALUES (?, ?)
-                ''', (name, value))
-                conn.commit()
+        current = self.autorun_collector.collect()
+        self.metrics.count('items', len(current))
+        baseline = self.load_autoruns_baseline()
+        with self.database.writer().transaction() as cursor:
+            # The baseline mirrors the machine, only the entries that changed are written
+            cursor.executemany("DELETE FROM autoruns WHERE Hive IS ? AND Subkey IS ? AND name = ? AND value = ?", baseline - current)
+            cursor.executemany("INSERT OR IGNORE INTO autoruns (Hive, Subkey, name, value) VALUES (?, ?, ?, ?)", current - baseline)
+        self.logger.log(f"Baseline autoruns: {len(current)} entries, {len(current - baseline)} added, {len(baseline - current)} removed")
+
+    def upgrade_legacy_autoruns(self, baseline, current):
+        # Rows recorded before Hive and Subkey were stored have both NULL. They match current entries on
+        # name and value and are rewritten with the location, so approved Run values don't show up as added.
+        legacy = {(entry.name, entry.value): entry for entry in baseline if entry.hive is None}
+        if not legacy:
+            return baseline
+        matched = {entry for entry in current - baseline if (entry.name, entry.value) in legacy}
+        stale = {legacy[(entry.name, entry.value)] for entry in matched}
+        with self.database.writer().transaction() as cursor:
+            cursor.executemany("INSERT OR IGNORE INTO autoruns (Hive, Subkey, name, value) VALUES (?, ?, ?, ?)", matched)
+            cursor.executemany("DELETE FROM autoruns WHERE Hive IS NULL AND Subkey IS NULL AND name = ? AND value = ?",
+                               [(entry.name, entry.value) for entry in stale])
+        self.logger.log(f"Upgraded {len(stale)} autorun baseline entries recorded without a hive and subkey")
+        return (baseline - stale) | matched
 
-    # UPDATE THIS TO ADD THE ACTION INSTEAD OF THE CODE TO DELETE THE REGISTRY ENTRY
     def continuous_registry_autoruns(self):
-        autorun_locations = [
-        (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\\Microsoft\Windows\\CurrentVersion\\Run"),
-        (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\\Microsoft\Windows\\CurrentVersion\\RunOnce"),
-        (winreg.HKEY_CURRENT_USER, r"Software\\Microsoft\Windows\\CurrentVersion\\Run"),
-        (winreg.HKEY_CURRENT_USER, r"Software\\Microsoft\Windows\\CurrentVersion\\RunOnce"),
-        ]
-        
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-            for hive,subkey in autorun_locations:
-                data = self.fetch_registry_keys(hive, subkey)
-            
-                for name, value in data:
-                    cursor.execute('SELECT * FROM autoruns WHERE name = ? AND value = ?', (name, value))
-                    if not cursor.fetchone():
-                        self.actions.delete_registry_autorun(hive, subkey, name)
+        baseline = self.load_autoruns_baseline()
+        if not baseline:
+            self.logger.log("No baseline autoruns recorded, skipping autorun discrepancy check")
+            return
+        current = self.autorun_collector.collect()
+        self.metrics.count('items', len(current))
+        baseline = self.upgrade_legacy_autoruns(baseline, current)
+        added = current - baseline
+        removed = baseline - current
+
+        new = []
+        with self.database.writer().transaction() as cursor:
+            for row in [('added',) + entry for entry in added] + [('removed',) + entry for entry in removed]:
+                cursor.execute('''
+                               INSERT OR IGNORE INTO AutorunDiscrepancies (ChangeType, Hive, Subkey, Name, Value)
+                               VALUES (?, ?, ?, ?, ?)
+                ''', row)
+                # Only discrepancies seen for the first time raise an alert
+                if cursor.rowcount:
+                    new.append(row)
+        self.alerts.add_many([Alert('autoruns', 'high' if change_type == 'added' else 'medium', f"Autorun {change_type}",
+                                    f"{hive}\\{subkey}\\{name}", value) for change_type, hive, subkey, name, value in new])
+
+        for entry in removed:
+            self.logger.event('autorun_changed', logging.WARNING, change='removed', **entry._asdict())
+        for entry in added:
+            self.logger.event('autorun_changed', logging.WARNING, change='added', **entry._asdict())
+            if self.autorun_collector.is_removable(entry):
+                self.responses.submit('delete_autorun', f"{entry.hive}\\{entry.subkey}\\{entry.name}", entry.hive, entry.subkey, entry.name)
         
     def get_current_connections(self):
-        with sqlite3.connect(self.database_path) as conn:
-            cursor = conn.cursor()
-        result = subprocess.check_output("netstat -n").decode('utf-8').split('\n')
-        connections = []
-        
-        for line in result:
-            parts = line.split()
-            print(parts)
-            
-            # Ensuring that  the line has enough parts to be a valid connection
-            if len(parts) < 3 or not (parts[0] == 'TCP' or parts[0] == 'UDP'):
-                continue
-            try:
-                # Extracting local IP and port
-                local_ip, local_port_str = parts[1].rsplit(':', 1)
-                local_port = int(local_port_str) # Converting port to an integer
-                
-                # Extracting remote IP and port
-                remote_ip, remote_port_str = parts[2].rsplit(':', 1)
-                remote_port = int(remote_port_str)
-            except ValueError:
-                self.logger.log(f"Error unpacking IP and port from line: {line}")
-                # Adding tuple (local_ip, local_port, remote_ip, remote_port) to connections list
-            connections.append((local_ip, local_port, remote_ip, remote_port))
-            cursor.execute('''
-                            INSERT INTO CurrentConnections (local_ip, local_port, remote_ip, remote_port)
-                            VALUES (?, ?, ?, ?)
-            ''', (local_ip, local_port, remote_ip, remote_port))
-            conn.commit()
+        try:
+            connections = list(self.connection_source.connections())
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.logger.log(f"Error enumerating connections: {str(e)}")
+            self.metrics.count('errors')
+            return []
+        self.metrics.count('items', len(connections))
+
+        # CurrentConnections holds the latest snapshot only
+        with self.database.writer().transaction() as cursor:
+            cursor.execute("DELETE FROM CurrentConnections")
+            cursor.executemany('''
+                            INSERT INTO CurrentConnections (protocol, local_ip, local_port, remote_ip, remote_port, state, pid)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', connections)
                 
         return connections
     
     def add_initial_trusted_connections(self):
         try:
-            with sqlite3.connect(self.database_path) as conn:
-                cursor = conn.cursor()
-            cursor.execute("INSERT INTO TrustedConnections (IP_Address) VALUES ('127.0.0.1')")
-            
-            conn.commit()
+            self.database.execute('''
+                                  INSERT INTO TrustedConnections (IP_Address)
+                                  SELECT '127.0.0.1' WHERE NOT EXISTS (SELECT 1 FROM TrustedConnections WHERE IP_Address = '127.0.0.1')
+            ''')
             
         except sqlite3.Error as e:
             self.logger.log(f"Error adding initial trusted connection: {str(e)}")
           
+    def log_cycle(self, label, cycle):
+        self.logger.log(f"{label} complete in {cycle.duration:.1f}s: {cycle.summary()}")
+
     def Baseline_Scan(self, start_dir):
-        self.logger.log("Starting baseline Executables scan...")
-        self.BaselineExecutables_Scan(start_dir)
-        self.logger.log("Baseline Executables scan complete.")
-        
-        self.logger.log("Starting baseline Users scan...")
-        self.BaselineUsers_Scan()
-        self.logger.log("Baseline Users scan complete.")
-        
-        self.logger.log("Starting baseline Autoruns scan...")
-        self.fetch_registry_autoruns()
-        self.logger.log("Baseline Autoruns scan complete.")
+        # The executables, users and autoruns baselines don't depend on each other, so they run concurrently
+        self.logger.log("Starting baseline scan...")
+        cycle = self.orchestrator.run([
+            ('executables', lambda: self.BaselineExecutables_Scan(start_dir), self.stage_timeouts['executables']),
+            ('users', self.BaselineUsers_Scan, self.stage_timeouts['users']),
+            ('autoruns', self.fetch_registry_autoruns, self.stage_timeouts['autoruns']),
+        ])
+        self.log_cycle("Baseline scan", cycle)
+        return cycle
     
+    def users_scan(self):
+        # Each baseline is taken by its own scan the first time its table is empty, so a baseline stage
+        # that failed or timed out is retried on the next run
+        if not self.database.query("SELECT 1 FROM BaselineAccounts LIMIT 1"):
+            self.BaselineUsers_Scan()
+        else:
+            self.CurrentUsers_Scan()
+
+    def autoruns_scan(self):
+        if not self.database.query("SELECT 1 FROM autoruns LIMIT 1"):
+            self.fetch_registry_autoruns()
+        else:
+            self.continuous_registry_autoruns()
+
     def ExecutablesScan (self, start_dir):
         self.logger.log("Starting current Executables scan...")
         self.CurrentExecutables_Scan(start_dir)
         self.logger.log("Current Executables scan complete.")
         
     def Continuous_Scan(self):
-        self.logger.log("Starting current Users scan...")
-        self.CurrentUsers_Scan()
-        self.logger.log("Current Users scan complete.")
-        
-        self.logger.log("Starting current Autoruns scan...")
-        self.continuous_registry_autoruns()
-        self.logger.log("Current Autoruns scan complete.")
+        # Connections no longer wait behind the user and autorun scans
+        self.logger.log("Starting continuous scan...")
+        cycle = self.orchestrator.run([
+            ('connections', self.connection_handler, self.stage_timeouts['connections']),
+            ('users', self.users_scan, self.stage_timeouts['users']),
+            ('autoruns', self.autoruns_scan, self.stage_timeouts['autoruns']),
+            ('events', self.highest_highest.run_detections, self.stage_timeouts['events']),
+        ])
+        self.log_cycle("Continuous scan", cycle)
+        return cycle
         
+    def scheduled_stage(self, name, func):
+        # Each scan type is its own scheduled job, run as a one-stage cycle so its STAGE_TIMEOUTS entry
+        # applies and a run abandoned at the timeout isn't started again next to itself
+        def job():
+            stage = self.orchestrator.run([(name, func, self.stage_timeouts[name])]).stages[name]
+            if stage.status in ('failed', 'timeout'):
+                # Shows up as the job's last error in the menu timers
+                raise RuntimeError(stage.error or f"timed out after {self.stage_timeouts[name]}s")
+            return stage.result
+        return job
+
     def baseline_scan(self):
-        start_directory = "C:\\"
-        self.Baseline_Scan(start_directory)
-        
-    def scheduled_file_scan(self):
-        self.baseline_scan()
-        self.s.enter(7200, 1, self.scheduled_file_scan, ())
+        self.Baseline_Scan(SCAN_ROOT)
+
+    def files_scan(self):
+        # The baseline is built once, on the first run. After that the scheduled pass compares the disk
+        # against it, so anything the watcher missed is reported instead of folded into a new baseline.
+        # Without build_baseline it's always the current pass, checked against the catalog. The users
+        # and autoruns baselines are taken by their own scans.
+        roots = self.watch_paths if self.watch else [SCAN_ROOT]
+        with self.files_lock, self.metrics.stage('executables'):
+            if self.build_baseline and not self.database.query("SELECT 1 FROM BaselineExecutables LIMIT 1"):
+                for root in roots:
+                    self.BaselineExecutables_Scan(root)
+                return
+            for root in roots:
+                self.ExecutablesScan(root)
         
-    def scheduled_scan(self):
-        self.connection_handler()
-        self.Continuous_Scan()
-        self.s.enter(900, 1, self.scheduled_scan, ())
+    def start_scans(self):
+        # Schedules every scan type on the background scheduler and returns straight away
+        if self.scheduler.is_running():
+            return
+        self.add_initial_trusted_connections()
+        # The users and autoruns scans take their own baseline on the first run, so none of the jobs
+        # waits for another
+        jobs = {
+            'files': self.files_scan,
+            'users': self.scheduled_stage('users', self.users_scan),
+            'autoruns': self.scheduled_stage('autoruns', self.autoruns_scan),
+            'connections': self.scheduled_stage('connections', self.connection_handler),
+            'events': self.scheduled_stage('events', self.highest_highest.run_detections),
+        }
+        self.orchestrator.resume()
+        for name, func in jobs.items():
+            interval, jitter, max_runtime = self.schedule['files_watched' if name == 'files' and self.watch else name]
+            self.scheduler.add_job(name, func, interval, jitter, max_runtime)
+        self.scheduler.start()
+        if self.watch:
+            self.start_watching()
+
+    def start_watching(self):
+        # Event-driven mode: the watcher feeds the debounced change queue and one thread drains it
+        if self.change_thread is not None and self.change_thread.is_alive():
+            return
+        if self.file_watcher is None:
+            self.file_watcher = default_file_watcher(self.watch_paths, self.change_queue, self.walker, self.logger)
+        self.change_queue.closed = False
+        self.file_watcher.start()
+        self.change_thread = threading.Thread(target=self.process_changes, name='ChangeQueue', daemon=True)
+        self.change_thread.start()
+
+    def stop_watching(self):
+        if self.file_watcher is not None:
+            self.file_watcher.stop(wait=False)
+        self.change_queue.close()
+
+    def process_changes(self):
+        while not self.change_queue.closed:
+            changes = self.change_queue.get_batch(timeout=1.0)
+            self.metrics.set_gauge('queue_depth', len(self.change_queue), queue='changes')
+            try:
+                with self.files_lock:
+                    if self.change_queue.take_rescan():
+                        # Events were lost, fall back to a full pass over the watched roots
+                        for root in self.watch_paths:
+                            self.ExecutablesScan(root)
+                    if changes:
+                        self.logger.log(f"Scanning {len(changes)} changed executables")
+                        with self.metrics.stage('changed_executables'):
+                            self.ChangedExecutables_Scan(changes)
+            except Exception as e:
+                self.logger.log(f"Error scanning changed executables: {str(e)}")
+
+    def stop_scans(self, drain_timeout=30):
+        self.scheduler.stop()
+        self.orchestrator.cancel()
+        self.stop_watching()
+        # Responses already queued are carried out before the worker stops
+        self.responses.join(timeout=drain_timeout)
+        self.responses.stop(wait=True)
+        self.metrics.export(force=True)
+
+    def scan_status(self):
+        return self.scheduler.status()
         
     def run_scans(self):
-        self.add_initial_trusted_connections()
-        self.baseline_scan()
-        self.connection_handler()
-        self.Continuous_Scan()
-        self.scheduled_scan()
-        self.scheduled_file_scan()
-        self.s.enter(7200, 1, self.scheduled_file_scan, ()) # Schedule the file scan to happen every 2 hours
-        self.s.enter(900, 1, self.scheduled_scan, ())
-        self.s.run()
+        self.start_scans()
+        self.scheduler.join()
 
 
 
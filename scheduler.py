@@ -0,0 +1,139 @@
+import random
+import threading
+import time
+from contextlib import nullcontext
+
+
+class ScheduledJob:
+    def __init__(self, name, func, interval, jitter=0, max_runtime=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.max_runtime = max_runtime
+        self.next_run = None
+        self.running = False
+        self.started_at = None
+        self.last_start = None
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+        self.skipped = 0
+        self.overran = False
+
+    def schedule_next(self, now):
+        self.next_run = now + self.interval + random.uniform(0, self.jitter)
+
+
+class ScanScheduler:
+    # Runs each scan type on its own interval from a background thread. A job that is still running
+    # when it comes due again is skipped rather than stacked, and jobs that exceed max_runtime are reported.
+    def __init__(self, logger=None, clock=time.time, metrics=None):
+        self.logger = logger
+        self.metrics = metrics
+        self.clock = clock
+        self.jobs = {}
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopping = False
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def add_job(self, name, func, interval, jitter=0, max_runtime=None, delay=0):
+        job = ScheduledJob(name, func, interval, jitter, max_runtime)
+        with self.condition:
+            job.next_run = self.clock() + delay
+            self.jobs[name] = job
+            self.condition.notify()
+        return job
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopping = False
+            self.thread = threading.Thread(target=self._loop, name='ScanScheduler', daemon=True)
+            self.thread.start()
+
+    def stop(self, wait=False):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def run_now(self, name):
+        with self.condition:
+            self.jobs[name].next_run = self.clock()
+            self.condition.notify()
+
+    def status(self):
+        # Snapshot for the menu timers
+        now = self.clock()
+        with self.condition:
+            return [{
+                'name': job.name,
+                'running': job.running,
+                'started_at': job.started_at,
+                'elapsed': now - job.started_at if job.running else None,
+                'next_run': job.next_run,
+                'next_run_in': max(0, job.next_run - now) if job.next_run is not None else None,
+                'last_start': job.last_start,
+                'last_duration': job.last_duration,
+                'last_error': job.last_error,
+                'runs': job.runs,
+                'skipped': job.skipped,
+            } for job in self.jobs.values()]
+
+    def _loop(self):
+        with self.condition:
+            while not self.stopping:
+                now = self.clock()
+                for job in self.jobs.values():
+                    if job.running and job.max_runtime is not None and not job.overran and now - job.started_at > job.max_runtime:
+                        job.overran = True
+                        self.log(f"Scan '{job.name}' has exceeded its max runtime of {job.max_runtime}s")
+                    if job.next_run > now:
+                        continue
+                    job.schedule_next(now)
+                    if job.running:
+                        # Coalesce: the run in progress covers this slot
+                        job.skipped += 1
+                        self.log(f"Skipping scan '{job.name}', previous run still in progress")
+                        continue
+                    job.running = True
+                    job.overran = False
+                    job.started_at = now
+                    threading.Thread(target=self._run_job, args=(job,), name=f"Scan-{job.name}", daemon=True).start()
+
+                next_run = min((job.next_run for job in self.jobs.values()), default=now + 60)
+                self.condition.wait(timeout=max(0.05, min(next_run - self.clock(), 60)))
+
+    def _run_job(self, job):
+        start = self.clock()
+        error = None
+        with self.metrics.stage(job.name, kind='job') if self.metrics is not None else nullcontext() as run:
+            try:
+                job.func()
+            except Exception as e:
+                error = str(e)
+                self.log(f"Scan '{job.name}' failed: {error}")
+                if run is not None:
+                    run.status = 'failed'
+                    run.count('errors')
+        with self.condition:
+            job.running = False
+            job.last_start = start
+            job.last_duration = self.clock() - start
+            job.last_error = error
+            job.runs += 1
+            self.condition.notify()
@@ -0,0 +1,115 @@
+import sqlite3
+import time
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class TableBrowser:
+    # Query layer behind the menu's table views. Pages are keyset-paginated on rowid, so the
+    # thousandth page costs the same as the first, and results are streamed with fetchmany on a
+    # read-only connection. Identifiers are checked against the schema before use in SQL.
+    def __init__(self, database, batch_size=500, time_limit=5.0):
+        self.database = database
+        self.batch_size = batch_size
+        self.time_limit = time_limit
+
+    def tables(self):
+        return [row[0] for row in self.database.query(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+
+    def columns(self, table):
+        self.check_table(table)
+        return [row[1] for row in self.database.query(f'PRAGMA table_info("{table}")')]
+
+    def check_table(self, table):
+        if table not in self.tables():
+            raise ValueError(f"Unknown table '{table}'")
+
+    def check_column(self, table, column):
+        if column not in self.columns(table):
+            raise ValueError(f"Unknown column '{column}' in {table}")
+
+    def page(self, table, after=None, limit=20, descending=False):
+        # Returns (columns, rows, last_rowid), pass last_rowid back as `after` for the next page
+        self.check_table(table)
+        comparison = '<' if descending else '>'
+        order = 'DESC' if descending else 'ASC'
+        where = f"WHERE rowid {comparison} ?" if after is not None else ''
+        params = (after, limit) if after is not None else (limit,)
+        columns = ['rowid'] + self.columns(table)
+        rows = self.database.query(f'SELECT rowid, * FROM "{table}" {where} ORDER BY rowid {order} LIMIT ?', params)
+        return columns, rows, rows[-1][0] if rows else after
+
+    def head(self, table, limit=10):
+        return self.page(table, limit=limit)[:2]
+
+    def tail(self, table, limit=10):
+        columns, rows, _ = self.page(table, limit=limit, descending=True)
+        return columns, rows[::-1]
+
+    def ensure_index(self, table, column):
+        # top/unique/find group or filter on the column, with an index that's a scan of the index
+        # instead of a sort of the whole table. Built once, the first time the column is queried.
+        self.check_column(table, column)
+        self.database.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_{column}" ON "{table}" ("{column}")')
+
+    def top(self, table, column, limit=10):
+        self.ensure_index(table, column)
+        return [column, 'count'], self.database.query(f'''
+            SELECT "{column}", COUNT(*) FROM "{table}" GROUP BY "{column}" ORDER BY 2 DESC LIMIT ?
+        ''', (limit,))
+
+    def unique(self, table, column, after=None, limit=50):
+        # Distinct values in order, keyset-paginated on the value itself
+        self.ensure_index(table, column)
+        if after is None:
+            rows = self.database.query(f'SELECT DISTINCT "{column}" FROM "{table}" ORDER BY 1 LIMIT ?', (limit,))
+        else:
+            rows = self.database.query(f'SELECT DISTINCT "{column}" FROM "{table}" WHERE "{column}" > ? ORDER BY 1 LIMIT ?',
+                                       (after, limit))
+        return [column], rows
+
+    def find(self, table, column, value, after=None, limit=20):
+        self.ensure_index(table, column)
+        where = f'"{column}" = ?' + (" AND rowid > ?" if after is not None else '')
+        params = (value, after, limit) if after is not None else (value, limit)
+        rows = self.database.query(f'SELECT rowid, * FROM "{table}" WHERE {where} ORDER BY rowid LIMIT ?', params)
+        return ['rowid'] + self.columns(table), rows
+
+    def stream(self, sql, params=(), max_rows=None, time_limit=None):
+        # Ad-hoc SQL on a read-only connection. Yields the column names first, then rows fetched in
+        # batches. The progress handler aborts the statement once the time spent inside SQLite passes
+        # the limit, time the caller spends between batches doesn't count.
+        time_limit = self.time_limit if time_limit is None else time_limit
+        clock = {'spent': 0.0, 'started': time.monotonic()}
+
+        def over_limit():
+            return clock['spent'] + time.monotonic() - clock['started'] > time_limit
+
+        with self.database.reader() as connection:
+            connection.set_progress_handler(over_limit, 10000)
+            cursor = None
+            try:
+                cursor = connection.execute(sql, params)
+                clock['spent'] += time.monotonic() - clock['started']
+                yield [description[0] for description in cursor.description or []]
+                count = 0
+                while max_rows is None or count < max_rows:
+                    size = self.batch_size if max_rows is None else min(self.batch_size, max_rows - count)
+                    clock['started'] = time.monotonic()
+                    rows = cursor.fetchmany(size)
+                    clock['spent'] += time.monotonic() - clock['started']
+                    if not rows:
+                        break
+                    count += len(rows)
+                    yield from rows
+            except sqlite3.OperationalError as e:
+                if 'interrupted' in str(e):
+                    raise QueryTimeout(f"Query exceeded the {time_limit}s time limit") from e
+                raise
+            finally:
+                if cursor is not None:
+                    cursor.close()
+                connection.set_progress_handler(None, 0)
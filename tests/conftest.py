@@ -0,0 +1,30 @@
+import os
+import sys
+import pytest
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+@pytest.fixture
+def make_scanner(tmp_path, monkeypatch):
+    # Scanner keeps GuardianAngel.db in the working directory, each test gets a fresh one
+    monkeypatch.chdir(tmp_path)
+    database._databases.clear()
+    scanners = []
+
+    def make(**kwargs):
+        import scanner
+        kwargs.setdefault('watch', False)
+        kwargs.setdefault('metrics_path', None)
+        instance = scanner.Scanner('GuardianAngel.db', **kwargs)
+        scanners.append(instance)
+        return instance
+
+    yield make
+    for instance in scanners:
+        instance.responses.stop(wait=True)
+        instance.database.close()
+    database._databases.clear()
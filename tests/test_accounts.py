@@ -0,0 +1,82 @@
+from accounts import UF_ACCOUNTDISABLE, UF_LOCKOUT, Account, FakeAccountProvider, diff_accounts
+from actions import FakeActions
+
+UF_NORMAL_ACCOUNT = 0x0200
+
+
+def snapshot(*accounts):
+    return FakeAccountProvider(accounts).snapshot()
+
+
+def test_accounts_are_matched_on_sid():
+    baseline = snapshot(Account('S-1-5-21-1-1001', 'alice', 'Alice', UF_NORMAL_ACCOUNT, 1001))
+    renamed = snapshot(Account('S-1-5-21-1-1001', 'alice.admin', 'Alice', UF_NORMAL_ACCOUNT, 1001))
+    assert diff_accounts(baseline, renamed) == [('modified', renamed['S-1-5-21-1-1001'])]
+
+
+def test_baseline_rows_without_sid_are_matched_on_username():
+    baseline = {'alice': Account(None, 'alice', None, None, None)}
+    current = snapshot(Account('S-1-5-21-1-1001', 'alice', 'Alice', UF_NORMAL_ACCOUNT, 1001))
+    assert diff_accounts(baseline, current) == []
+
+
+def test_added_removed_and_modified():
+    baseline = snapshot(Account('S-1', 'alice', 'Alice', UF_NORMAL_ACCOUNT, 1001), Account('S-2', 'bob', None, UF_NORMAL_ACCOUNT, 1002))
+    current = snapshot(Account('S-1', 'alice', 'Alice Admin', UF_NORMAL_ACCOUNT, 1001), Account('S-3', 'mallory', None, UF_NORMAL_ACCOUNT, 1003))
+    assert sorted(diff_accounts(baseline, current)) == sorted([
+        ('modified', current['S-1']),
+        ('added', current['S-3']),
+        ('removed', baseline['S-2']),
+    ])
+
+
+def test_lockout_and_disable_bits_are_not_changes():
+    baseline = snapshot({'sid': 'S-1', 'name': 'alice', 'flags': UF_NORMAL_ACCOUNT, 'user_id': 1001})
+    current = snapshot({'sid': 'S-1', 'name': 'alice', 'flags': UF_NORMAL_ACCOUNT | UF_LOCKOUT | UF_ACCOUNTDISABLE, 'user_id': 1001})
+    assert diff_accounts(baseline, current) == []
+
+
+def test_own_disables_are_not_reported_again(make_scanner):
+    guest = Account('S-1-5-21-1-501', 'Guest', None, UF_NORMAL_ACCOUNT, 501)
+    admin = Account('S-1-5-21-1-500', 'Administrator', None, UF_NORMAL_ACCOUNT, 500)
+    provider = FakeAccountProvider([admin, guest])
+    actions = FakeActions()
+    scanner = make_scanner(account_provider=provider, actions=actions)
+    scanner.BaselineUsers_Scan()
+
+    added = Account('S-1-5-21-1-1005', 'backdoor', None, UF_NORMAL_ACCOUNT, 1005)
+    provider.set_accounts([admin, guest, added])
+    scanner.CurrentUsers_Scan()
+    assert scanner.responses.join(timeout=10)
+    assert sorted(call[1] for call in actions.calls if call[0] == 'remove_users') == ['Guest', 'backdoor']
+
+    # Both accounts now come back disabled, which is the scans' own doing
+    disabled = [account._replace(flags=account.flags | UF_ACCOUNTDISABLE) for account in (guest, added)]
+    provider.set_accounts([admin] + disabled)
+    for _ in range(2):
+        scanner.CurrentUsers_Scan()
+    assert scanner.responses.join(timeout=10)
+    assert len(actions.calls) == 2
+    assert scanner.database.query("SELECT ChangeType, UserName FROM AccountDiscrepancies") == [('added', 'backdoor')]
+    assert [row[0] for row in scanner.database.query("SELECT Title FROM Alerts WHERE Source = 'accounts'")] == ['Account added']
+
+
+def test_reenabling_a_disabled_account_is_a_change():
+    baseline = snapshot(Account('S-1-5-21-1-500', 'Administrator', None, UF_NORMAL_ACCOUNT | UF_ACCOUNTDISABLE, 500))
+    current = snapshot(Account('S-1-5-21-1-500', 'Administrator', None, UF_NORMAL_ACCOUNT, 500))
+    assert diff_accounts(baseline, current) == [('modified', current['S-1-5-21-1-500'])]
+    assert diff_accounts(current, baseline) == []
+
+
+def test_reenabled_account_is_reported_once(make_scanner):
+    admin = Account('S-1-5-21-1-500', 'Administrator', None, UF_NORMAL_ACCOUNT | UF_ACCOUNTDISABLE, 500)
+    provider = FakeAccountProvider([admin])
+    scanner = make_scanner(account_provider=provider, actions=FakeActions())
+    scanner.BaselineUsers_Scan()
+
+    provider.set_accounts([admin._replace(flags=UF_NORMAL_ACCOUNT)])
+    for _ in range(2):
+        scanner.CurrentUsers_Scan()
+    assert scanner.database.query("SELECT ChangeType, UserName, Flags FROM AccountDiscrepancies") == [
+        ('modified', 'Administrator', UF_NORMAL_ACCOUNT)]
+    assert [row[0] for row in scanner.database.query("SELECT Title FROM Alerts WHERE Source = 'accounts'")] == ['Account modified']
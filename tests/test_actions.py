@@ -0,0 +1,91 @@
+import subprocess
+import actions
+from actions import Actions, FakeActions
+
+
+class FakeNetsh:
+    # Keeps the firewall rules netsh would hold, commands naming a failing address exit with an error
+    def __init__(self, failing=()):
+        self.rules = {}
+        self.failing = set(failing)
+
+    def __call__(self, args, check=False, timeout=None, **kwargs):
+        command = args[3]
+        options = dict(arg.split('=', 1) for arg in args[5:] if '=' in arg)
+        name = options.get('name')
+        addresses = options['remoteip'].split(',') if 'remoteip' in options else []
+        if self.failing.intersection(addresses) or (command in ('set', 'show', 'delete') and name not in self.rules):
+            returncode = 1
+        else:
+            returncode = 0
+            if command in ('add', 'set'):
+                self.rules[name] = addresses
+            elif command == 'delete':
+                del self.rules[name]
+        if returncode and check:
+            raise subprocess.CalledProcessError(returncode, args)
+        return subprocess.CompletedProcess(args, returncode)
+
+
+def blocked_addresses(scanner):
+    return {row[0] for row in scanner.database.query("SELECT IP_Address FROM BlockedConnections")}
+
+
+def firewall_addresses(netsh):
+    return {address for addresses in netsh.rules.values() for address in addresses}
+
+
+def test_failed_update_keeps_existing_blocks(make_scanner, monkeypatch):
+    netsh = FakeNetsh(failing={'203.0.113.66'})
+    monkeypatch.setattr(actions.subprocess, 'run', netsh)
+    scanner = make_scanner()
+    scanner.actions = scanner.responses.actions = Actions()
+
+    scanner.responses.submit('block_ip', '198.51.100.1')
+    assert scanner.responses.join(timeout=10)
+    assert netsh.rules == {'Hammer Blocked IPs 1': ['198.51.100.1']}
+
+    scanner.responses.submit('block_ip', '198.51.100.2')
+    scanner.responses.submit('block_ip', '203.0.113.66')
+    assert scanner.responses.join(timeout=10)
+    assert netsh.rules == {'Hammer Blocked IPs 1': ['198.51.100.1', '198.51.100.2']}
+    assert blocked_addresses(scanner) == firewall_addresses(netsh)
+
+
+def test_rule_deleted_by_hand_is_added_again(make_scanner, monkeypatch):
+    netsh = FakeNetsh()
+    monkeypatch.setattr(actions.subprocess, 'run', netsh)
+    scanner = make_scanner()
+    scanner.actions = scanner.responses.actions = Actions()
+
+    scanner.responses.submit('block_ip', '198.51.100.1')
+    assert scanner.responses.join(timeout=10)
+    netsh.rules.clear()
+    scanner.responses.submit('block_ip', '198.51.100.2')
+    assert scanner.responses.join(timeout=10)
+    assert netsh.rules == {'Hammer Blocked IPs 1': ['198.51.100.1', '198.51.100.2']}
+
+
+def test_fake_rules_come_from_blocked_addresses(monkeypatch):
+    def no_commands(*args, **kwargs):
+        raise AssertionError("a fake ran a command")
+
+    monkeypatch.setattr(actions.subprocess, 'run', no_commands)
+    fake = FakeActions(failing={'203.0.113.66'})
+    assert not fake.rule_exists('Hammer Blocked IPs 1')
+    assert fake.block_IPs(['198.51.100.1'])
+    assert not fake.block_IPs(['198.51.100.2', '203.0.113.66'])
+    assert fake.rule_exists('Hammer Blocked IPs 1') and not fake.rule_exists('Hammer Blocked IPs 2')
+    assert list(fake.blocked) == ['198.51.100.1']
+
+
+def test_null_actions_skip_and_never_mark_blocked(make_scanner):
+    scanner = make_scanner(backends={'firewall': 'fake'})
+    scanner.responses.submit('block_ip', '198.51.100.1')
+    scanner.responses.submit('block_ip', '198.51.100.2')
+    scanner.responses.submit('disable_user', 'mallory')
+    assert scanner.responses.join(timeout=10)
+    assert sorted(scanner.database.query("SELECT Target, Status FROM ActionLog")) == [
+        ('198.51.100.1', 'skipped'), ('198.51.100.2', 'skipped'), ('mallory', 'skipped')]
+    assert not scanner.database.query("SELECT * FROM BlockedConnections")
+    assert not scanner.trusted_networks.is_blocked('198.51.100.1')
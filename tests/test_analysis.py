@@ -0,0 +1,58 @@
+def snapshot(scanner, table, rows):
+    with scanner.database.writer().transaction() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.executemany(f"INSERT INTO {table} (FileName, FilePath, md5Hash) VALUES (?, ?, ?)", rows)
+
+
+def discrepancies(scanner):
+    return sorted(scanner.database.query("SELECT ChangeType, FilePath, md5Hash FROM ExecutableDiscrepancies"))
+
+
+def test_added_modified_and_removed(make_scanner):
+    scanner = make_scanner()
+    snapshot(scanner, 'BaselineExecutables', [('a.exe', r'C:\a.exe', 'aa'), ('b.exe', r'C:\b.exe', 'bb'), ('c.exe', r'C:\c.exe', 'cc')])
+    snapshot(scanner, 'CurrentExecutables', [('a.exe', r'C:\a.exe', 'aa'), ('b.exe', r'C:\b.exe', 'b2'), ('d.exe', r'C:\d.exe', 'dd')])
+    found = scanner.analysis.find_executable_discrepancies()
+    assert sorted((row[0], row[2], row[3]) for row in found) == [
+        ('added', r'C:\d.exe', 'dd'), ('modified', r'C:\b.exe', 'b2'), ('removed', r'C:\c.exe', 'cc')]
+    assert discrepancies(scanner) == sorted((row[0], row[2], row[3]) for row in found)
+
+
+def test_known_discrepancies_are_not_recorded_again(make_scanner):
+    scanner = make_scanner()
+    snapshot(scanner, 'BaselineExecutables', [('a.exe', r'C:\a.exe', 'aa')])
+    snapshot(scanner, 'CurrentExecutables', [('a.exe', r'C:\a.exe', 'a2')])
+    assert len(scanner.analysis.find_executable_discrepancies()) == 1
+    assert scanner.analysis.find_executable_discrepancies() == []
+
+    # A further change to the same file is a new discrepancy
+    snapshot(scanner, 'CurrentExecutables', [('a.exe', r'C:\a.exe', 'a3')])
+    assert [row[3] for row in scanner.analysis.find_executable_discrepancies()] == ['a3']
+    assert discrepancies(scanner) == [('modified', r'C:\a.exe', 'a2'), ('modified', r'C:\a.exe', 'a3')]
+
+
+def test_paths_limit_the_diff(make_scanner):
+    scanner = make_scanner()
+    snapshot(scanner, 'BaselineExecutables', [('a.exe', r'C:\a.exe', 'aa'), ('b.exe', r'C:\b.exe', 'bb'), ('c.exe', r'C:\c.exe', 'cc')])
+    snapshot(scanner, 'CurrentExecutables', [('a.exe', r'C:\a.exe', 'a2'), ('b.exe', r'C:\b.exe', 'b2')])
+    found = scanner.analysis.find_executable_discrepancies(paths=[r'C:\b.exe', r'C:\c.exe', r'C:\b.exe'])
+    assert sorted((row[0], row[2]) for row in found) == [('modified', r'C:\b.exe'), ('removed', r'C:\c.exe')]
+
+
+def test_account_discrepancies(make_scanner):
+    scanner = make_scanner()
+    with scanner.database.writer().transaction() as cursor:
+        cursor.executemany("INSERT INTO BaselineAccounts (UserName, SID, Flags, RID) VALUES (?, ?, ?, ?)",
+                           [('alice', 'S-1-5-21-1-1001', 512, 1001), ('bob', 'S-1-5-21-1-1002', 512, 1002)])
+        cursor.executemany("INSERT INTO CurrentAccounts (UserName, SID, Flags, RID) VALUES (?, ?, ?, ?)",
+                           [('alice', 'S-1-5-21-1-1001', 514, 1001), ('mallory', 'S-1-5-21-1-1003', 512, 1003)])
+    found = scanner.analysis.find_account_discrepancies()
+    assert sorted((row[0], row[2]) for row in found) == [('added', 'mallory'), ('modified', 'alice'), ('removed', 'bob')]
+
+
+def test_null_columns_compare_equal(make_scanner):
+    scanner = make_scanner()
+    with scanner.database.writer().transaction() as cursor:
+        for table in ('BaselineAccounts', 'CurrentAccounts'):
+            cursor.execute(f"INSERT INTO {table} (UserName, SID, Flags, RID) VALUES ('svc', 'S-1-5-21-1-1004', 512, NULL)")
+    assert scanner.analysis.find_account_discrepancies() == []
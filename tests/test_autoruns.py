@@ -0,0 +1,76 @@
+from actions import FakeActions
+from autoruns import AutorunCollector, AutorunEntry, FakeRegistry
+
+RUN = r'SOFTWARE\Microsoft\Windows\CurrentVersion\Run'
+WINLOGON = r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Winlogon'
+SESSION_MANAGER = r'SYSTEM\CurrentControlSet\Control\Session Manager'
+WINDOWS = r'SOFTWARE\Microsoft\Windows NT\CurrentVersion\Windows'
+
+
+def golden_registry():
+    return FakeRegistry({
+        ('HKLM', RUN): {'OneDrive': r'C:\Program Files\OneDrive\OneDrive.exe /background'},
+        ('HKLM', WINLOGON): {'Shell': 'explorer.exe', 'Userinit': 'C:\\Windows\\system32\\userinit.exe,'},
+        ('HKLM', SESSION_MANAGER): {'BootExecute': ['autocheck autochk *']},
+        ('HKLM', WINDOWS): {'AppInit_DLLs': '', 'LoadAppInit_DLLs': 0},
+    })
+
+
+def test_only_run_keys_are_removable():
+    collector = AutorunCollector(FakeRegistry(), startup_folders=[], task_folders=[])
+    assert collector.is_removable(AutorunEntry('HKLM', RUN, 'x', 'y'))
+    for subkey, name in ((WINLOGON, 'Userinit'), (SESSION_MANAGER, 'BootExecute'), (WINDOWS, 'AppInit_DLLs')):
+        assert not collector.is_removable(AutorunEntry('HKLM', subkey, name, 'y'))
+
+
+def test_changed_boot_values_are_reported_not_deleted(make_scanner):
+    registry = golden_registry()
+    actions = FakeActions()
+    scanner = make_scanner(registry=registry, actions=actions)
+    scanner.autorun_collector = AutorunCollector(registry, startup_folders=[], task_folders=[], logger=scanner.logger)
+    scanner.fetch_registry_autoruns()
+
+    registry.set_values('HKLM', WINLOGON, {'Userinit': 'C:\\Windows\\system32\\userinit.exe,C:\\evil.exe'})
+    registry.set_values('HKLM', SESSION_MANAGER, {'BootExecute': ['autocheck autochk *', 'evil']})
+    registry.set_values('HKLM', WINDOWS, {'AppInit_DLLs': r'C:\evil.dll', 'LoadAppInit_DLLs': 1})
+    registry.set_values('HKLM', RUN, {'Updater': r'C:\Users\Public\evil.exe'})
+    scanner.continuous_registry_autoruns()
+    assert scanner.responses.join(timeout=10)
+
+    deleted = [call for call in actions.calls if call[0] == 'delete_registry_autorun']
+    assert deleted == [('delete_registry_autorun', 'Updater', 'HKLM', RUN)]
+    # The boot and logon values are left in place but still alerted on
+    assert registry.values('HKLM', WINLOGON)
+    titles = {(row[0], row[1]) for row in scanner.database.query("SELECT Title, Target FROM Alerts")}
+    for subkey, name in ((WINLOGON, 'Userinit'), (SESSION_MANAGER, 'BootExecute'), (WINDOWS, 'AppInit_DLLs'),
+                         (WINDOWS, 'LoadAppInit_DLLs'), (RUN, 'Updater')):
+        assert ('Autorun added', f"HKLM\\{subkey}\\{name}") in titles
+
+
+def test_legacy_baseline_rows_match_on_name_and_value(make_scanner):
+    registry = golden_registry()
+    actions = FakeActions()
+    scanner = make_scanner(registry=registry, actions=actions)
+    scanner.autorun_collector = AutorunCollector(registry, startup_folders=[], task_folders=[], logger=scanner.logger)
+    # A database upgraded from before Hive and Subkey were recorded
+    scanner.database.execute("INSERT INTO autoruns (name, value) VALUES (?, ?)",
+                             ('OneDrive', r'C:\Program Files\OneDrive\OneDrive.exe /background'))
+
+    scanner.autoruns_scan()
+    assert scanner.responses.join(timeout=10)
+    assert not actions.calls
+    assert scanner.database.query("SELECT Hive, Subkey FROM autoruns WHERE name = 'OneDrive'") == [('HKLM', RUN)]
+
+
+def test_autoruns_baseline_is_taken_while_the_table_is_empty(make_scanner):
+    registry = golden_registry()
+    actions = FakeActions()
+    scanner = make_scanner(registry=registry, actions=actions)
+    scanner.autorun_collector = AutorunCollector(registry, startup_folders=[], task_folders=[], logger=scanner.logger)
+
+    scanner.autoruns_scan()
+    assert scanner.database.query("SELECT COUNT(*) FROM autoruns")[0][0] == 6
+    registry.set_values('HKLM', RUN, {'Updater': r'C:\Users\Public\evil.exe'})
+    scanner.autoruns_scan()
+    assert scanner.responses.join(timeout=10)
+    assert [call[:2] for call in actions.calls] == [('delete_registry_autorun', 'Updater')]
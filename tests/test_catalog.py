@@ -0,0 +1,65 @@
+import hashlib
+
+from actions import FakeActions
+from catalog import write_catalog
+
+
+def make_catalog(path, digest, contents):
+    write_catalog(str(path), digest, sorted(hashlib.new(digest, content).digest() for content in contents))
+
+
+def unknown_paths(scanner):
+    return sorted(path for (path,) in scanner.database.query(
+        "SELECT FilePath FROM ExecutableDiscrepancies WHERE ChangeType = 'unknown'"))
+
+
+def test_catalog_of_another_digest_is_not_used(make_scanner, tmp_path):
+    make_catalog(tmp_path / 'known_good.cat', 'blake2b', [b'tool'])
+    scanner = make_scanner()
+    assert scanner.load_catalog() is None
+
+    make_catalog(tmp_path / 'known_good.cat', 'sha256', [b'tool'])
+    catalog = scanner.load_catalog()
+    assert catalog is not None and catalog.contains({'sha256': hashlib.sha256(b'tool').hexdigest()})
+    catalog.close()
+
+
+def test_files_job_without_baseline_reports_unknowns_once(make_scanner, tmp_path):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    (root / 'tool.exe').write_bytes(b'tool')
+    (root / 'dropper.exe').write_bytes(b'dropper')
+    make_catalog(tmp_path / 'known_good.cat', 'sha256', [b'tool'])
+    actions = FakeActions()
+    scanner = make_scanner(watch=True, watch_paths=[str(root)], build_baseline=False, actions=actions)
+
+    scanner.files_scan()
+    assert unknown_paths(scanner) == [str(root / 'dropper.exe')]
+    assert not scanner.database.query("SELECT 1 FROM BaselineExecutables LIMIT 1")
+
+    # Already recorded, so a pass that hashes it again doesn't add a second row
+    scanner.ChangedExecutables_Scan([str(root / 'dropper.exe')])
+    assert unknown_paths(scanner) == [str(root / 'dropper.exe')]
+
+    (root / 'dropper.exe').write_bytes(b'dropper v2')
+    scanner.ChangedExecutables_Scan([str(root / 'dropper.exe')])
+    assert unknown_paths(scanner) == [str(root / 'dropper.exe')] * 2
+    assert scanner.responses.join(timeout=10)
+    assert not actions.calls
+
+
+def test_known_good_update_matches_on_the_catalogs_digest(make_scanner, tmp_path):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    (root / 'tool.exe').write_bytes(b'tool v1')
+    actions = FakeActions()
+    scanner = make_scanner(watch=True, watch_paths=[str(root)], digests=('md5', 'blake2b'), actions=actions)
+    scanner.files_scan()
+
+    (root / 'tool.exe').write_bytes(b'tool v2')
+    make_catalog(tmp_path / 'known_good.cat', 'blake2b', [b'tool v2'])
+    scanner.files_scan()
+    assert scanner.responses.join(timeout=10)
+    assert not actions.calls
+    assert scanner.database.query("SELECT Severity, Title FROM Alerts WHERE Source = 'executables'") == [
+        ('low', 'Executable modified (known-good)')]
@@ -0,0 +1,72 @@
+import os
+import shutil
+import sys
+import pytest
+from connections import Connection, NetstatSource, ProcNetSource
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'netstat_ano.txt')
+PROC_FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'proc')
+
+EXPECTED = [
+    Connection('TCP', '0.0.0.0', 135, '0.0.0.0', 0, 'LISTENING', 1032),
+    Connection('TCP', '192.168.1.20', 49712, '52.96.165.18', 443, 'ESTABLISHED', 6120),
+    Connection('TCP', '127.0.0.1', 5939, '127.0.0.1', 49678, 'TIME_WAIT', 0),
+    Connection('TCP', '::', 135, '::', 0, 'LISTENING', 1032),
+    Connection('TCP', 'fe80::1c2d:9a1f:4b2e:77a1%12', 139, '::', 0, 'LISTENING', 4),
+    Connection('UDP', '0.0.0.0', 123, '*', 0, None, 1756),
+    Connection('UDP', '::', 5353, '*', 0, None, 2200),
+    Connection('UDP', 'fe80::1c2d:9a1f:4b2e:77a1%12', 546, '*', 0, None, 3012),
+]
+
+
+def read_fixture():
+    with open(FIXTURE, 'rb') as file:
+        return file.read().decode('utf-8')
+
+
+def test_parse_recorded_netstat_output():
+    assert list(NetstatSource().parse(read_fixture())) == EXPECTED
+
+
+def test_parse_skips_malformed_lines():
+    output = "  TCP    0.0.0.0         0.0.0.0:0     LISTENING    4\r\n  UDP    0.0.0.0:123    *:*    1756\r\n"
+    assert list(NetstatSource().parse(output)) == [EXPECTED[5]]
+
+
+def test_connections_runs_the_command():
+    command = (sys.executable, '-c', f"import sys; sys.stdout.buffer.write(open({FIXTURE!r}, 'rb').read())")
+    assert list(NetstatSource(command=command).connections()) == EXPECTED
+
+
+PROC_EXPECTED = [
+    Connection('TCP', '127.0.0.1', 53, '0.0.0.0', 0, 'LISTEN', None),
+    Connection('TCP', '10.0.0.5', 50000, '192.168.47.91', 443, 'ESTABLISHED', None),
+    Connection('TCP', '10.0.0.5', 50001, '8.8.8.8', 53, 'TIME_WAIT', None),
+    Connection('TCP', '::', 22, '::', 0, 'LISTEN', None),
+    Connection('TCP', '::ffff:127.0.0.1', 8080, '::ffff:127.0.0.1', 54321, 'ESTABLISHED', None),
+    Connection('TCP', '2001:db8::5', 58052, '2001:db8::1', 443, 'ESTABLISHED', None),
+    Connection('UDP', '0.0.0.0', 68, '0.0.0.0', 0, None, None),
+    Connection('UDP', '127.0.0.53', 53, '0.0.0.0', 0, None, None),
+]
+
+
+def test_parse_recorded_proc_net_tables():
+    # The fixture has no udp6 table and a truncated udp line, both are skipped
+    assert ProcNetSource.available(PROC_FIXTURE)
+    assert not ProcNetSource.available(os.path.dirname(PROC_FIXTURE))
+    assert list(ProcNetSource(root=PROC_FIXTURE).connections()) == PROC_EXPECTED
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink') or sys.platform == 'win32', reason='needs symlinks')
+def test_proc_net_resolves_socket_owners(tmp_path):
+    root = tmp_path / 'proc'
+    shutil.copytree(PROC_FIXTURE, root)
+    for pid, inodes in (('1042', ['45122', '51290']), ('77', ['20320'])):
+        (root / pid / 'fd').mkdir(parents=True)
+        for fd, inode in enumerate(inodes, start=3):
+            os.symlink(f"socket:[{inode}]", root / pid / 'fd' / str(fd))
+        os.symlink('/dev/null', root / pid / 'fd' / '0')
+    (root / 'self').mkdir()
+    (root / '5').mkdir()
+    connections = list(ProcNetSource(root=str(root), resolve_pids=True).connections())
+    assert [connection.pid for connection in connections] == [None, 1042, None, None, None, 1042, None, 77]
@@ -0,0 +1,107 @@
+import sqlite3
+import pytest
+import database
+import metrics
+
+
+def test_unchanged_pass_writes_no_rows(make_scanner, tmp_path):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    for i in range(20):
+        (root / f"tool{i}.exe").write_bytes(b'tool %d' % i)
+    scanner = make_scanner(watch=True, watch_paths=[str(root)])
+    scanner.files_scan()
+    scanner.files_scan()
+    scanner.files_scan()
+    # The diff's temp tables hold a row per file but nothing in the database file changed
+    assert scanner.metrics.last_runs(name='executables')[-1]['rows'] == 0
+
+
+def test_rows_count_persisted_writes_only(make_scanner):
+    scanner = make_scanner()
+    with metrics.Metrics().stage('writes') as run:
+        with scanner.database.writer().transaction() as cursor:
+            cursor.execute("CREATE TEMP TABLE Scratch (IP_Address)")
+            cursor.executemany("INSERT INTO temp.Scratch VALUES (?)", [('198.51.100.1',), ('198.51.100.2',)])
+            cursor.execute("INSERT INTO TrustedConnections (IP_Address) SELECT IP_Address FROM temp.Scratch")
+            cursor.execute("DELETE FROM TrustedConnections WHERE IP_Address = '198.51.100.2'")
+            cursor.execute("DROP TABLE temp.Scratch")
+    assert run.counts['rows'] == 3
+
+
+def test_one_database_per_file(tmp_path):
+    path = str(tmp_path / 'shared.db')
+    assert database.get_database(path) is database.get_database(path)
+    assert database.get_database(path) is not database.get_database(str(tmp_path / 'other.db'))
+
+
+def test_writer_batches_and_keeps_statement_order(tmp_path):
+    db = database.Database(str(tmp_path / 'batch.db'))
+    db.execute("CREATE TABLE Items (Name TEXT PRIMARY KEY)")
+    with db.writer(flush_size=3, flush_interval=3600) as writer:
+        writer.add("INSERT INTO Items VALUES (?)", ('a',))
+        writer.add("INSERT INTO Items VALUES (?)", ('b',))
+        assert db.query("SELECT Name FROM Items") == []
+        writer.add("DELETE FROM Items WHERE Name = ?", ('a',))
+        # The third row flushes, the DELETE runs after the INSERTs queued before it
+        assert db.query("SELECT Name FROM Items") == [('b',)]
+        writer.add_many("INSERT INTO Items VALUES (?)", [('a',)])
+    assert db.query("SELECT Name FROM Items ORDER BY Name") == [('a',), ('b',)]
+    assert writer.rows_written == 4
+    db.close()
+
+
+def test_failed_transaction_writes_nothing(tmp_path):
+    db = database.Database(str(tmp_path / 'rollback.db'))
+    db.execute("CREATE TABLE Items (Name TEXT PRIMARY KEY)")
+    writer = db.writer(flush_size=100)
+    writer.add("INSERT INTO Items VALUES (?)", ('a',))
+    with pytest.raises(sqlite3.IntegrityError):
+        with writer.transaction() as cursor:
+            cursor.execute("INSERT INTO Items VALUES ('b')")
+            cursor.execute("INSERT INTO Items VALUES ('b')")
+    assert db.query("SELECT Name FROM Items") == []
+    db.close()
+
+
+def test_readers_are_read_only_and_pooled(tmp_path):
+    db = database.Database(str(tmp_path / 'readers.db'), readers=2)
+    db.execute("CREATE TABLE Items (Name TEXT)")
+    with db.reader() as first, db.reader() as second:
+        assert first is not second
+        with pytest.raises(sqlite3.OperationalError):
+            first.execute("INSERT INTO Items VALUES ('a')")
+    with db.reader() as again:
+        assert again in (first, second)
+    assert len(db._readers) == 2
+    db.close()
+
+
+def test_readers_see_committed_rows_during_a_write(tmp_path):
+    db = database.Database(str(tmp_path / 'wal.db'))
+    db.execute("CREATE TABLE Items (Name TEXT)")
+    db.execute("INSERT INTO Items VALUES ('a')")
+    with db.writer().transaction() as cursor:
+        cursor.execute("INSERT INTO Items VALUES ('b')")
+        # WAL lets the reader run, it sees the last committed state
+        assert db.query("SELECT Name FROM Items") == [('a',)]
+    assert db.query("SELECT Name FROM Items ORDER BY Name") == [('a',), ('b',)]
+    db.close()
+
+
+def test_migrate_runs_steps_once(tmp_path):
+    path = str(tmp_path / 'migrate.db')
+    calls = []
+    steps = [('items', lambda: calls.append('items'))]
+    db = database.Database(path)
+    assert db.migrate(1, steps)
+    db.run_once('items', lambda: calls.append('again'))
+    db.close()
+    # A new process finds the file already at this version
+    db = database.Database(path)
+    assert not db.migrate(1, steps)
+    db.close()
+    db = database.Database(path)
+    assert db.migrate(2, steps)
+    assert calls == ['items', 'items']
+    db.close()
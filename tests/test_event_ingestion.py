@@ -0,0 +1,69 @@
+import json
+import os
+from event_ingestion import EventIngestor, FileEventSource
+from rules import event_fields
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'security_events.jsonl')
+
+
+def detections(scanner):
+    return scanner.database.query("SELECT RecordId, RuleName FROM Highest_Sev_Highest_Conf ORDER BY id")
+
+
+def test_filters_event_ids_and_record_ids():
+    source = FileEventSource(FIXTURE)
+    assert [event['RecordId'] for event in source.events()] == [1001, 1003, 1004]
+    assert [event['RecordId'] for event in source.events(after_record_id=1001)] == [1003, 1004]
+    assert [event['RecordId'] for event in FileEventSource(FIXTURE, event_ids=()).events(1001)] == [1002, 1003, 1004]
+
+
+def test_reads_json_array_exports(tmp_path):
+    with open(FIXTURE, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file]
+    path = tmp_path / 'security.json'
+    path.write_text('\n  ' + json.dumps(records), encoding='utf-8')
+    assert list(FileEventSource(str(path)).records()) == records
+
+
+def test_detections_resume_from_bookmark(make_scanner, tmp_path):
+    path = tmp_path / 'security.jsonl'
+    with open(FIXTURE, encoding='utf-8') as file:
+        lines = file.readlines()
+    path.write_text(''.join(lines[:2]), encoding='utf-8')
+    scanner = make_scanner(event_source=FileEventSource(str(path)))
+    scanner.highest_highest.run_detections()
+    assert detections(scanner) == [('1001', 'LSASS_Access_From_Non_System_Account')]
+    assert scanner.database.query("SELECT Source, RecordId FROM EventBookmarks") == [('Highest_Highest', 1001)]
+
+    # Only the records after the bookmark are read, the first hit isn't raised again
+    path.write_text(''.join(lines), encoding='utf-8')
+    scanner.highest_highest.run_detections()
+    assert detections(scanner) == [('1001', 'LSASS_Access_From_Non_System_Account'),
+                                   ('1004', 'LSASS_Access_From_Non_System_Account')]
+    assert scanner.database.query("SELECT RecordId FROM EventBookmarks") == [(1004,)]
+
+    scanner.highest_highest.run_detections()
+    assert len(detections(scanner)) == 2
+
+
+def test_bookmark_only_moves_when_saved(make_scanner):
+    scanner = make_scanner()
+    ingestor = EventIngestor(scanner.database, FileEventSource(FIXTURE), 'replay')
+    assert [event['RecordId'] for event in ingestor.events()] == [1001, 1003, 1004]
+    # Nothing saved, the next run reads the same events again
+    assert [event['RecordId'] for event in ingestor.events()] == [1001, 1003, 1004]
+    ingestor.save_bookmark()
+    assert ingestor.bookmark() == 1004
+    assert list(ingestor.events()) == []
+
+
+def test_message_fallback_fields():
+    # Record 1004 has no EventData, the rule matches on the fields parsed from the rendered message
+    with open(FIXTURE, encoding='utf-8') as file:
+        event = [json.loads(line) for line in file][3]
+    fields = event_fields(event)
+    assert fields['ObjectType'] == 'Process'
+    assert fields['ObjectName'] == r'\Device\HarddiskVolume2\Windows\System32\lsass.exe'
+    assert fields['ProcessName'] == r'C:\Users\mallory\dump.exe'
+    assert fields['AccessMask'] == '0x1010'
+    assert fields['AccountName'] == 'mallory'
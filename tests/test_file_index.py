@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+from file_index import DIGEST_NAMES, FileIndex
+
+
+def count_hashes(scanner, monkeypatch):
+    hashed = []
+    hash_file = scanner.file_hasher.hash_file
+
+    def counting(file_path, *args, **kwargs):
+        hashed.append(file_path)
+        return hash_file(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(scanner.file_hasher, 'hash_file', counting)
+    return hashed
+
+
+def index_paths(scanner, scope):
+    return sorted(path for (path,) in scanner.database.query("SELECT FilePath FROM FileIndex WHERE Scope = ?", (scope,)))
+
+
+def test_watcher_scans_keep_the_current_index_up_to_date(make_scanner, tmp_path, monkeypatch):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    for name in ('a.exe', 'b.exe'):
+        (root / name).write_bytes(name.encode())
+    scanner = make_scanner(watch=True, watch_paths=[str(root)])
+    scanner.files_scan()
+    scanner.files_scan()
+
+    (root / 'a.exe').write_bytes(b'a v2')
+    (root / 'b.exe').unlink()
+    scanner.ChangedExecutables_Scan([str(root / 'a.exe'), str(root / 'b.exe')])
+    assert index_paths(scanner, 'current') == [str(root / 'a.exe')]
+
+    # The full pass finds nothing the watcher hasn't already handled
+    hashed = count_hashes(scanner, monkeypatch)
+    scanner.files_scan()
+    assert hashed == []
+
+
+def test_watcher_scans_wait_for_the_files_pass(make_scanner, tmp_path):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    (root / 'a.exe').write_bytes(b'a')
+    scanner = make_scanner(watch=True, watch_paths=[str(root)], watch_debounce=0)
+    scanner.files_scan()
+
+    thread = threading.Thread(target=scanner.process_changes, daemon=True)
+    with scanner.files_lock:
+        scanner.change_queue.put(str(root / 'a.exe'), 'modified')
+        thread.start()
+        thread.join(0.5)
+        assert index_paths(scanner, 'current') == []
+    deadline = time.monotonic() + 10
+    while not index_paths(scanner, 'current') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    scanner.change_queue.close()
+    thread.join(10)
+    assert index_paths(scanner, 'current') == [str(root / 'a.exe')]
+
+
+def test_unchanged_files_are_not_rehashed(make_scanner, tmp_path, monkeypatch):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    for name in ('a.exe', 'b.dll', 'c.ps1'):
+        (root / name).write_bytes(name.encode())
+    scanner = make_scanner(watch=True, watch_paths=[str(root)])
+    hashed = count_hashes(scanner, monkeypatch)
+    scanner.files_scan()
+    assert sorted(hashed) == sorted(str(root / name) for name in ('a.exe', 'b.dll', 'c.ps1'))
+
+    # The first current pass starts from the baseline's entries
+    hashed.clear()
+    scanner.files_scan()
+    assert hashed == []
+    assert index_paths(scanner, 'current') == index_paths(scanner, 'baseline')
+
+    (root / 'a.exe').write_bytes(b'a v2')
+    os.utime(root / 'b.dll', ns=(0, 1_000_000_000))
+    (root / 'c.ps1').unlink()
+    (root / 'd.exe').write_bytes(b'd')
+    scanner.files_scan()
+    assert sorted(hashed) == sorted(str(root / name) for name in ('a.exe', 'b.dll', 'd.exe'))
+    assert index_paths(scanner, 'current') == sorted(str(root / name) for name in ('a.exe', 'b.dll', 'd.exe'))
+    # The baseline's index is only rebuilt with the baseline
+    assert index_paths(scanner, 'baseline') == sorted(str(root / name) for name in ('a.exe', 'b.dll', 'c.ps1'))
+
+
+def test_index_keeps_digests_across_loads(make_scanner, tmp_path):
+    root = tmp_path / 'programs'
+    root.mkdir()
+    path = root / 'a.exe'
+    path.write_bytes(b'a')
+    scanner = make_scanner()
+    stat = os.stat(path)
+    digests = {name: 'ab' * 16 for name in DIGEST_NAMES}
+
+    index = FileIndex('current')
+    index.load(scanner.database)
+    assert index.lookup(str(path), stat) is None
+    index.update(str(path), stat, digests)
+    with scanner.database.writer() as writer:
+        index.save(writer)
+
+    reloaded = FileIndex('current')
+    reloaded.load(scanner.database)
+    assert reloaded.lookup(str(path), stat) == digests
+    path.write_bytes(b'a v2')
+    assert reloaded.lookup(str(path), os.stat(path)) is None
+    assert reloaded.previous(str(path)) == digests
+    # Another scope's or another root's entries aren't loaded
+    other = FileIndex('baseline')
+    other.load(scanner.database)
+    assert other.entries == {}
+    elsewhere = FileIndex('current', root=str(tmp_path / 'elsewhere'))
+    elsewhere.load(scanner.database)
+    assert elsewhere.entries == {}
@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import pytest
+from hashing import FileHasher, HashingPipeline, compute_md5
+
+SIZES = (0, 1, 64 * 1024, 64 * 1024 + 1, 300 * 1024 + 7)
+
+
+def write(path, size):
+    path.write_bytes(bytes(i % 251 for i in range(size)))
+    return str(path)
+
+
+@pytest.mark.parametrize('strategy', FileHasher.STRATEGIES)
+@pytest.mark.parametrize('size', SIZES)
+def test_every_strategy_gives_the_library_digests(tmp_path, strategy, size):
+    path = write(tmp_path / 'tool.exe', size)
+    data = open(path, 'rb').read()
+    # A small buffer makes the medium and large reads go around their loops several times
+    hasher = FileHasher(digests=('md5', 'sha256', 'blake2b'), buffer_size=4096)
+    assert hasher.digest(path, strategy=strategy) == {
+        'md5': hashlib.md5(data).hexdigest(),
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'blake2b': hashlib.blake2b(data).hexdigest(),
+    }
+
+
+def test_read_strategy_by_size():
+    hasher = FileHasher(small_file_size=10, mmap_file_size=100)
+    assert [hasher.read_strategy(size) for size in (0, 10, 11, 99, 100)] == ['read', 'read', 'readinto', 'readinto', 'mmap']
+
+
+def test_unsupported_digest():
+    with pytest.raises(ValueError):
+        FileHasher(digests=('sha1',))
+
+
+def test_two_tier_skips_crypto_digests_for_unchanged_content(tmp_path, monkeypatch):
+    path = write(tmp_path / 'tool.exe', 1000)
+    hasher = FileHasher(two_tier=True)
+    assert 'fast' in hasher.digests
+    previous = hasher.hash_file(path)
+
+    computed = []
+    digest = hasher.digest
+    monkeypatch.setattr(hasher, 'digest', lambda file_path, names=None, strategy=None: computed.append(names) or digest(file_path, names, strategy))
+    assert hasher.hash_file(path, previous) == previous
+    assert computed == [('fast',)]
+
+    computed.clear()
+    write(tmp_path / 'tool.exe', 1001)
+    changed = hasher.hash_file(path, previous)
+    assert changed['sha256'] != previous['sha256']
+    assert computed == [('fast',), None]
+
+
+def test_pipeline_hashes_every_item(tmp_path):
+    paths = [write(tmp_path / f"tool{i}.exe", i * 10) for i in range(50)]
+    results = list(HashingPipeline(workers=4, queue_size=4).run((path, i) for i, path in enumerate(paths)))
+    assert sorted(item for item, _, _ in results) == sorted((path, i) for i, path in enumerate(paths))
+    assert all(error is None and file_hash == compute_md5(item[0]) for item, file_hash, error in results)
+
+
+def test_pipeline_reports_errors_per_item(tmp_path):
+    path = write(tmp_path / 'tool.exe', 10)
+    missing = str(tmp_path / 'missing.exe')
+    results = {item[0]: (file_hash, error) for item, file_hash, error in HashingPipeline(workers=2).run([(path,), (missing,)])}
+    assert results[path] == (compute_md5(path), None)
+    assert results[missing][0] is None and isinstance(results[missing][1], OSError)
+
+
+def test_pipeline_raises_walker_errors():
+    def items():
+        yield ('a',)
+        raise PermissionError('walk failed')
+
+    with pytest.raises(PermissionError):
+        list(HashingPipeline(hash_func=len, workers=2).run(items()))
+
+
+def test_pipeline_threads_finish_when_the_consumer_stops_early():
+    before = set(threading.enumerate())
+    results = HashingPipeline(hash_func=len, workers=3, queue_size=2).run((str(i),) for i in range(1000))
+    next(results)
+    started = set(threading.enumerate()) - before
+    assert len(started) == 4
+    results.close()
+    for thread in started:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in started)
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import pytest
+
+from orchestrator import ScanOrchestrator
+
+
+def blocking(release):
+    def stage():
+        release.wait(10)
+        return 'done'
+    return stage
+
+
+def test_stage_past_its_timeout_is_abandoned_and_not_overlapped():
+    orchestrator = ScanOrchestrator()
+    release = threading.Event()
+    start = time.monotonic()
+    cycle = orchestrator.run([('slow', blocking(release), 0.2), ('fast', lambda: 'fast', None)])
+    assert time.monotonic() - start < 5
+    assert cycle.stages['slow'].status == 'timeout'
+    assert cycle.stages['fast'].status == 'ok' and cycle.stages['fast'].result == 'fast'
+
+    # The abandoned run is still going, so the next cycle doesn't start a second copy
+    assert orchestrator.run([('slow', blocking(release), 0.2)]).stages['slow'].status == 'skipped'
+    release.set()
+    orchestrator.active['slow'].result(timeout=5)
+    assert orchestrator.run([('slow', lambda: 'again', None)]).stages['slow'].result == 'again'
+
+
+def test_failed_stage_does_not_stop_the_others():
+    def broken():
+        raise OSError("access denied")
+
+    cycle = ScanOrchestrator().run([('broken', broken, None), ('fine', lambda: 1, None)])
+    assert cycle.stages['broken'].status == 'failed' and cycle.stages['broken'].error == 'access denied'
+    assert cycle.stages['fine'].status == 'ok'
+    assert not cycle.ok
+
+
+def test_cancel_stops_stages_that_have_not_started():
+    orchestrator = ScanOrchestrator()
+    release = threading.Event()
+
+    def first():
+        orchestrator.cancel()
+        release.wait(0.5)
+
+    cycle = orchestrator.run([('first', first, None), ('second', lambda: 1, None)], max_workers=1)
+    assert cycle.stages['second'].status == 'cancelled'
+    orchestrator.resume()
+    assert orchestrator.run([('second', lambda: 1, None)]).ok
+
+
+def test_each_scan_type_is_its_own_job(make_scanner, monkeypatch):
+    scanner = make_scanner(schedule={'connections': (60, 5, 30)})
+    monkeypatch.setattr(scanner.scheduler, 'start', lambda: None)
+    scanner.start_scans()
+    jobs = scanner.scheduler.jobs
+    assert sorted(jobs) == ['autoruns', 'connections', 'events', 'files', 'users']
+    assert (jobs['connections'].interval, jobs['connections'].jitter, jobs['connections'].max_runtime) == (60, 5, 30)
+    assert (jobs['users'].interval, jobs['users'].max_runtime) == (900, 600)
+
+
+def test_scheduled_stage_applies_the_stage_timeout(make_scanner):
+    scanner = make_scanner(stage_timeouts={'events': 0.2})
+    release = threading.Event()
+    job = scanner.scheduled_stage('events', blocking(release))
+    with pytest.raises(RuntimeError, match='timed out'):
+        job()
+    release.set()
+    scanner.orchestrator.active['events'].result(timeout=5)
+    assert scanner.scheduled_stage('events', lambda: 'ok')() == 'ok'
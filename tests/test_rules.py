@@ -0,0 +1,100 @@
+import pytest
+from Highest_Highest import RULES_PATH
+from rules import FieldMatcher, RuleEngine, parse_int
+
+LSASS = 'LSASS_Access_From_Non_System_Account'
+
+
+def lsass_event(event_id=4663, **fields):
+    data = {'ObjectType': 'Process', 'ObjectName': r'\Device\HarddiskVolume2\Windows\System32\lsass.exe',
+            'AccessMask': '0x1010', 'SubjectUserName': 'mallory', 'ProcessName': r'C:\Users\mallory\dump.exe'}
+    data.update(fields)
+    return {'Id': event_id, 'RecordId': 1, 'EventData': data}
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return RuleEngine.from_file(RULES_PATH)
+
+
+def fired(engine, event):
+    return [rule.name for rule in engine.evaluate(event)]
+
+
+def test_lsass_access_fires(engine):
+    assert fired(engine, lsass_event()) == [LSASS]
+    assert fired(engine, lsass_event(4656)) == [LSASS]
+    assert fired(engine, lsass_event(ObjectName=r'C:\WINDOWS\SYSTEM32\LSASS.EXE')) == [LSASS]
+
+
+@pytest.mark.parametrize('mask', ['0x40', '0x1000', '0x1400', '0x100000', '0x1410', '0x1010', '0x1438', '0x143a',
+                                  '0x1418', '0x1f0fff', '0x1f1fff', '0x1f2fff', '0x1f3fff', '0x1F0FFF', '4112'])
+def test_lsass_access_masks(engine, mask):
+    assert fired(engine, lsass_event(AccessMask=mask)) == [LSASS]
+
+
+@pytest.mark.parametrize('mask', ['0x10', '0x1', '0x1fffff', '0x0', '', 'Read'])
+def test_other_access_masks_are_ignored(engine, mask):
+    assert fired(engine, lsass_event(AccessMask=mask)) == []
+
+
+def test_machine_accounts_are_excluded(engine):
+    assert fired(engine, lsass_event(SubjectUserName='WS01$')) == []
+    assert fired(engine, lsass_event(SubjectUserName='dollar$sign')) == [LSASS]
+
+
+def test_wmiprvse_is_excluded_only_for_its_mask(engine):
+    wmi = r'C:\Windows\System32\wbem\WmiPrvSE.exe'
+    assert fired(engine, lsass_event(ProcessName=wmi, AccessMask='0x1410')) == []
+    assert fired(engine, lsass_event(ProcessName=wmi.upper(), AccessMask='0x1410')) == []
+    assert fired(engine, lsass_event(ProcessName=wmi, AccessMask='0x1010')) == [LSASS]
+    assert fired(engine, lsass_event(ProcessName=r'C:\Temp\WmiPrvSE.exe', AccessMask='0x1410')) == [LSASS]
+
+
+def test_other_filters(engine):
+    assert fired(engine, lsass_event(ProcessName=r'C:\Program Files\Defender\MsMpEng.exe')) == []
+    assert fired(engine, lsass_event(ProcessName=r'D:\SteamLibrary\steamapps\common\game.exe')) == []
+
+
+def test_non_matching_events(engine):
+    assert fired(engine, lsass_event(4624)) == []
+    assert fired(engine, lsass_event(ObjectType='File')) == []
+    assert fired(engine, lsass_event(ObjectName=r'C:\Windows\System32\lsass.exe.bak')) == []
+    assert fired(engine, {'Id': 'x', 'EventData': {}}) == []
+    event = lsass_event()
+    del event['EventData']['AccessMask']
+    assert fired(engine, event) == []
+
+
+def test_event_ids(engine):
+    assert engine.event_ids == (4656, 4663)
+    assert RuleEngine([{'name': 'any', 'selection': {'ObjectType': 'Process'}}]).event_ids == ()
+
+
+def test_rules_without_event_ids_see_every_event():
+    engine = RuleEngine([{'name': 'any', 'selection': {'ObjectType': 'Process'}},
+                         {'name': 'logon', 'event_ids': [4624], 'selection': {'LogonType': [3, 10]}}])
+    assert fired(engine, {'Id': 4624, 'EventData': {'ObjectType': 'Process', 'LogonType': '10'}}) == ['logon', 'any']
+    assert fired(engine, {'Id': 4625, 'EventData': {'ObjectType': 'Process', 'LogonType': '10'}}) == ['any']
+
+
+@pytest.mark.parametrize('key, values, value, expected', [
+    ('Name|contains', ['mimi', 'katz'], 'C:\\MIMIKATZ.exe', True),
+    ('Name|startswith', 'C:\\Temp', 'c:\\temp\\a.exe', True),
+    ('Name|startswith', 'C:\\Temp', 'D:\\C:\\Temp', False),
+    ('Name|endswith', '.ps1', 'a.ps1.txt', False),
+    ('Name|re', r'\\[a-z]{8}\.exe$', 'C:\\Temp\\abcdefgh.exe', True),
+    ('Name', 'a.b', 'axb', False),
+])
+def test_field_modifiers(key, values, value, expected):
+    matcher = FieldMatcher(key, values)
+    assert matcher.matches({'Name': value}, {}) is expected
+
+
+def test_unsupported_modifier():
+    with pytest.raises(ValueError):
+        FieldMatcher('Name|glob', '*.exe')
+
+
+def test_parse_int():
+    assert [parse_int(value) for value in (16, '0x10', ' 0X1F ', '16')] == [16, 16, 31, 16]
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import ScanScheduler
+
+
+class ListLogger:
+    def __init__(self):
+        self.messages = []
+
+    def log(self, message):
+        self.messages.append(message)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def job_status(scheduler, name):
+    return next(status for status in scheduler.status() if status['name'] == name)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ScanScheduler(logger=ListLogger())
+    yield scheduler
+    scheduler.stop(wait=True)
+
+
+def test_jobs_run_on_their_own_intervals(scheduler):
+    runs = {'fast': 0, 'slow': 0}
+    scheduler.add_job('fast', lambda: runs.__setitem__('fast', runs['fast'] + 1), interval=0.05)
+    scheduler.add_job('slow', lambda: runs.__setitem__('slow', runs['slow'] + 1), interval=60)
+    scheduler.add_job('later', lambda: None, interval=60, delay=60)
+    scheduler.start()
+    assert wait_for(lambda: runs['fast'] >= 4)
+    assert runs['slow'] == 1
+    assert job_status(scheduler, 'later')['runs'] == 0
+    assert 59 < job_status(scheduler, 'later')['next_run_in'] <= 60
+
+
+def test_run_now(scheduler):
+    ran = threading.Event()
+    scheduler.add_job('later', ran.set, interval=60, delay=60)
+    scheduler.start()
+    scheduler.run_now('later')
+    assert ran.wait(5)
+
+
+def test_overdue_runs_are_skipped_not_stacked(scheduler):
+    release = threading.Event()
+    active = []
+    overlapped = []
+
+    def slow():
+        overlapped.append(len(active))
+        active.append(1)
+        release.wait(10)
+        active.pop()
+
+    scheduler.add_job('slow', slow, interval=0.05, max_runtime=0.1)
+    scheduler.start()
+    assert wait_for(lambda: job_status(scheduler, 'slow')['skipped'] >= 3)
+    status = job_status(scheduler, 'slow')
+    assert status['running'] and status['runs'] == 0 and status['elapsed'] >= 0
+    assert wait_for(lambda: any('exceeded its max runtime' in message for message in scheduler.logger.messages))
+    release.set()
+    assert wait_for(lambda: job_status(scheduler, 'slow')['runs'] >= 2)
+    assert set(overlapped) == {0}
+    assert sum('exceeded its max runtime' in message for message in scheduler.logger.messages) == 1
+
+
+def test_failing_job_keeps_its_schedule(scheduler):
+    def fail():
+        raise RuntimeError('registry unavailable')
+
+    scheduler.add_job('autoruns', fail, interval=0.05)
+    scheduler.start()
+    assert wait_for(lambda: job_status(scheduler, 'autoruns')['runs'] >= 2)
+    assert job_status(scheduler, 'autoruns')['last_error'] == 'registry unavailable'
+    assert "Scan 'autoruns' failed: registry unavailable" in scheduler.logger.messages
+
+
+def test_stop_ends_the_thread(scheduler):
+    scheduler.add_job('idle', lambda: None, interval=60)
+    scheduler.start()
+    scheduler.start()
+    assert scheduler.is_running()
+    scheduler.stop(wait=True)
+    assert not scheduler.is_running()
@@ -0,0 +1,89 @@
+import ipaddress
+import random
+import pytest
+from trusted_networks import PrefixTrie, parse_ip
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('10.1.2.3', '10.1.2.3'),
+    ('[::1]', '::1'),
+    ('fe80::1c2d:9a1f:4b2e:77a1%12', 'fe80::1c2d:9a1f:4b2e:77a1'),
+    ('*', None),
+    ('', None),
+    ('10.0.0.0/8', None),
+])
+def test_parse_ip(value, expected):
+    assert parse_ip(value) == (ipaddress.ip_address(expected) if expected else None)
+
+
+def test_trie_matches_ipaddress():
+    rng = random.Random(1337)
+    networks = [ipaddress.ip_network(f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.0.0/{rng.randint(8, 24)}", strict=False)
+                for _ in range(200)]
+    trie = PrefixTrie(32)
+    for network in networks:
+        trie.insert(network)
+    for _ in range(2000):
+        address = ipaddress.ip_address(rng.getrandbits(32))
+        assert trie.contains(address) == any(address in network for network in networks)
+
+
+def test_trie_prefix_edges():
+    trie = PrefixTrie(32)
+    trie.insert(ipaddress.ip_network('192.168.1.0/24'))
+    trie.insert(ipaddress.ip_network('10.0.0.7/32'))
+    assert trie.contains(ipaddress.ip_address('192.168.1.0'))
+    assert trie.contains(ipaddress.ip_address('192.168.1.255'))
+    assert not trie.contains(ipaddress.ip_address('192.168.2.0'))
+    assert trie.contains(ipaddress.ip_address('10.0.0.7'))
+    assert not trie.contains(ipaddress.ip_address('10.0.0.6'))
+    everything = PrefixTrie(128)
+    everything.insert(ipaddress.ip_network('::/0'))
+    assert everything.contains(ipaddress.ip_address('2001:db8::1'))
+
+
+def trust(scanner, *values):
+    with scanner.database.writer().transaction() as cursor:
+        cursor.executemany("INSERT INTO TrustedConnections (IP_Address) VALUES (?)", [(value,) for value in values])
+
+
+def test_index_trusts_ranges_and_addresses(make_scanner):
+    scanner = make_scanner()
+    index = scanner.trusted_networks
+    trust(scanner, '10.0.0.0/8', '203.0.113.9', '2001:db8::/32', 'not an address')
+    index.refresh()
+    assert index.is_trusted('10.200.1.1')
+    assert index.is_trusted('203.0.113.9')
+    assert not index.is_trusted('203.0.113.10')
+    assert index.is_trusted('[2001:db8::5]')
+    assert index.is_trusted('::ffff:10.1.1.1')
+    assert not index.is_trusted('2001:db9::1')
+    assert not index.is_trusted('*')
+
+
+def test_index_reloads_only_when_the_table_changes(make_scanner):
+    scanner = make_scanner()
+    index = scanner.trusted_networks
+    trust(scanner, '10.0.0.0/8')
+    index.refresh()
+    tries = index.tries
+    index.refresh()
+    assert index.tries is tries
+
+    # Editing or removing a range is picked up as well as adding one
+    scanner.database.execute("UPDATE TrustedConnections SET IP_Address = '172.16.0.0/12' WHERE IP_Address = '10.0.0.0/8'")
+    index.refresh()
+    assert not index.is_trusted('10.1.1.1') and index.is_trusted('172.16.5.5')
+    scanner.database.execute("DELETE FROM TrustedConnections")
+    index.refresh()
+    assert not index.is_trusted('172.16.5.5')
+
+
+def test_blocked_addresses(make_scanner):
+    scanner = make_scanner()
+    index = scanner.trusted_networks
+    assert not index.is_blocked('198.51.100.7')
+    index.mark_blocked('198.51.100.7')
+    index.mark_blocked('198.51.100.7')
+    assert index.is_blocked('198.51.100.7')
+    assert scanner.database.query("SELECT IP_Address FROM BlockedConnections") == [('198.51.100.7',)]
@@ -0,0 +1,75 @@
+import os
+import sys
+import pytest
+from walker import ExecutableWalker, has_executable_extension
+
+
+def make_tree(root, paths):
+    for path in paths:
+        full = root.joinpath(*path.split('/'))
+        full.parent.mkdir(parents=True, exist_ok=True)
+        full.write_bytes(b'x')
+
+
+def walked(walker, root):
+    return sorted(os.path.relpath(entry.path, root).replace(os.sep, '/') for entry in walker.walk(str(root)))
+
+
+def test_extension_check():
+    assert has_executable_extension('setup.EXE')
+    assert has_executable_extension('lib.dll')
+    assert not has_executable_extension('.exe')
+    assert not has_executable_extension('notes.exe.txt')
+    assert not has_executable_extension('exe')
+
+
+def test_walk_finds_executables_in_every_directory(tmp_path):
+    make_tree(tmp_path, ['a.exe', 'readme.txt', 'bin/b.DLL', 'bin/deep/c.ps1', 'bin/deep/d.png', 'e.exe/f.bat'])
+    assert walked(ExecutableWalker(), tmp_path) == ['a.exe', 'bin/b.DLL', 'bin/deep/c.ps1', 'e.exe/f.bat']
+
+
+def test_excluded_directories_are_pruned(tmp_path):
+    make_tree(tmp_path, ['a.exe', 'cache/b.exe', 'cache/sub/c.exe', 'keep/d.exe', 'keep/e.tmp.exe'])
+    walker = ExecutableWalker(exclude=[str(tmp_path / 'cache'), '*.tmp.exe'])
+    listed = []
+    scandir = os.scandir
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(os, 'scandir', lambda path: listed.append(path) or scandir(path))
+        assert walked(walker, tmp_path) == ['a.exe', 'keep/d.exe']
+    assert str(tmp_path / 'cache') not in listed
+
+
+def test_include_and_custom_extensions(tmp_path):
+    make_tree(tmp_path, ['a.exe', 'tools/b.exe', 'tools/c.sys'])
+    assert walked(ExecutableWalker(include=['*/tools/*']), tmp_path) == ['tools/b.exe']
+    assert walked(ExecutableWalker(extensions=['.SYS']), tmp_path) == ['tools/c.sys']
+
+
+def test_matches_applies_the_walk_filters(tmp_path):
+    walker = ExecutableWalker(exclude=[str(tmp_path / 'cache')])
+    assert walker.matches(str(tmp_path / 'a.exe'))
+    assert not walker.matches(str(tmp_path / 'a.txt'))
+    assert not walker.matches(str(tmp_path / 'cache' / 'sub' / 'b.exe'))
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink') or sys.platform == 'win32', reason='needs symlinks')
+def test_symlinks_are_not_followed(tmp_path):
+    make_tree(tmp_path, ['real/a.exe'])
+    os.symlink(tmp_path / 'real', tmp_path / 'linked')
+    os.symlink(tmp_path / 'real' / 'a.exe', tmp_path / 'b.exe')
+    assert walked(ExecutableWalker(), tmp_path) == ['real/a.exe']
+
+
+def test_unreadable_directories_are_reported(tmp_path, monkeypatch):
+    make_tree(tmp_path, ['a.exe', 'locked/b.exe'])
+    scandir = os.scandir
+
+    def denied(path):
+        if path == str(tmp_path / 'locked'):
+            raise PermissionError(13, 'Access is denied', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', denied)
+    errors = []
+    assert walked(ExecutableWalker(on_error=lambda path, e: errors.append(path)), tmp_path) == ['a.exe']
+    assert errors == [str(tmp_path / 'locked')]
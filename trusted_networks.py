@@ -0,0 +1,108 @@
+import ipaddress
+
+
+def parse_ip(value):
+    # Accepts the address forms netstat and users produce ("[::1]", "fe80::1%4", "10.0.0.0/8"),
+    # returns None for wildcards and anything else that isn't an address
+    value = value.strip()
+    if value.startswith('[') and value.endswith(']'):
+        value = value[1:-1]
+    value = value.split('%', 1)[0]
+    try:
+        return ipaddress.ip_address(value)
+    except ValueError:
+        return None
+
+
+class PrefixTrie:
+    # Binary radix trie over address bits, a lookup walks at most max_prefixlen nodes
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = {}
+
+    def insert(self, network):
+        node = self.root
+        value = int(network.network_address)
+        for i in range(network.prefixlen):
+            bit = (value >> (self.bits - 1 - i)) & 1
+            node = node.setdefault(bit, {})
+        node['end'] = True
+
+    def contains(self, address):
+        node = self.root
+        value = int(address)
+        for i in range(self.bits):
+            if 'end' in node:
+                return True
+            node = node.get((value >> (self.bits - 1 - i)) & 1)
+            if node is None:
+                return False
+        return 'end' in node
+
+
+class TrustedNetworkIndex:
+    # In-memory view of TrustedConnections (single addresses or CIDR ranges) and BlockedConnections.
+    # refresh() reloads the trusted ranges only when the table has changed since the last load: triggers
+    # bump TrustedConnectionsVersion on every insert, update and delete, so an edited range is picked up too.
+    def __init__(self, database, logger=None):
+        self.database = database
+        self.logger = logger
+        self.signature = None
+        self.tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        self.blocked = None
+
+    def setup_database(self):
+        with self.database.writer().transaction() as cursor:
+            cursor.execute('''
+                           CREATE TABLE IF NOT EXISTS TrustedConnectionsVersion (
+                               id INTEGER PRIMARY KEY CHECK (id = 1),
+                               Version INTEGER NOT NULL
+                            )
+                        ''')
+            cursor.execute("INSERT OR IGNORE INTO TrustedConnectionsVersion (id, Version) VALUES (1, 0)")
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f'''
+                               CREATE TRIGGER IF NOT EXISTS trg_TrustedConnections_{event.lower()} AFTER {event} ON TrustedConnections
+                               BEGIN
+                                   UPDATE TrustedConnectionsVersion SET Version = Version + 1 WHERE id = 1;
+                               END
+                            ''')
+
+    def refresh(self):
+        signature = self.database.query("SELECT Version FROM TrustedConnectionsVersion WHERE id = 1")[0][0]
+        if signature != self.signature:
+            tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+            for (value,) in self.database.query("SELECT IP_Address FROM TrustedConnections"):
+                try:
+                    network = ipaddress.ip_network(value.strip().strip('[]'), strict=False)
+                except ValueError:
+                    if self.logger is not None:
+                        self.logger.log(f"Ignoring invalid trusted address: {value}")
+                    continue
+                tries[network.version].insert(network)
+            self.tries = tries
+            self.signature = signature
+
+        if self.blocked is None:
+            self.blocked = {row[0] for row in self.database.query("SELECT IP_Address FROM BlockedConnections")}
+
+    def is_trusted(self, ip):
+        address = parse_ip(ip) if isinstance(ip, str) else ip
+        if address is None:
+            return False
+        # IPv4-mapped IPv6 addresses are checked against the IPv4 ranges
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return self.tries[address.version].contains(address)
+
+    def is_blocked(self, ip):
+        if self.blocked is None:
+            self.refresh()
+        return ip in self.blocked
+
+    def mark_blocked(self, ip):
+        if self.blocked is None:
+            self.refresh()
+        if ip not in self.blocked:
+            self.blocked.add(ip)
+            self.database.execute("INSERT INTO BlockedConnections (IP_Address) VALUES (?)", (ip,))
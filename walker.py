@@ -0,0 +1,82 @@
+import fnmatch
+import os
+import re
+
+EXECUTABLE_EXTENSIONS = frozenset(['.exe', '.bat', '.cmd', '.msi', '.ps1', '.py', '.vbs', '.dll'])
+
+
+def has_executable_extension(name, extensions=EXECUTABLE_EXTENSIONS):
+    dot = name.rfind('.')
+    return dot > 0 and name[dot:].lower() in extensions
+
+
+class ExecutableWalker:
+    # Streams executable files under a directory using os.scandir, so file type and stat data come
+    # from the directory listing instead of an extra stat per file. Excluded directories are pruned
+    # before they are descended into.
+    def __init__(self, extensions=EXECUTABLE_EXTENSIONS, include=None, exclude=None, on_error=None):
+        self.extensions = frozenset(ext.lower() for ext in extensions)
+        self.include = self._compile(include)
+        self.exclude = self._compile(exclude)
+        self.on_error = on_error
+
+    @staticmethod
+    def _compile(patterns):
+        # Merge all globs into one case-insensitive regex so each path is matched once
+        if not patterns:
+            return None
+        return re.compile('|'.join(fnmatch.translate(os.path.normcase(p)) for p in patterns), re.IGNORECASE)
+
+    def is_excluded(self, path):
+        return self.exclude is not None and self.exclude.match(os.path.normcase(path)) is not None
+
+    def is_excluded_tree(self, path):
+        # True when the path or any directory above it is excluded, walk() would never have reached it
+        if self.exclude is None:
+            return False
+        path = os.path.normcase(path)
+        while True:
+            if self.exclude.match(path):
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+
+    def matches(self, path):
+        # Same filters as walk() for a single path reported by a watcher, without touching the disk
+        if not has_executable_extension(os.path.basename(path), self.extensions):
+            return False
+        if self.is_excluded_tree(path):
+            return False
+        return self.include is None or self.include.match(os.path.normcase(path)) is not None
+
+    def walk(self, start_dir):
+        # Yields os.DirEntry objects for matching files
+        stack = [start_dir]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self.exclude is None or not self.exclude.match(os.path.normcase(entry.path)):
+                                    stack.append(entry.path)
+                                continue
+
+                            if not has_executable_extension(entry.name, self.extensions):
+                                continue
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            if self.exclude is not None and self.exclude.match(os.path.normcase(entry.path)):
+                                continue
+                            if self.include is not None and not self.include.match(os.path.normcase(entry.path)):
+                                continue
+                            yield entry
+                        except OSError as e:
+                            if self.on_error is not None:
+                                self.on_error(entry.path, e)
+            except OSError as e:
+                if self.on_error is not None:
+                    self.on_error(directory, e)
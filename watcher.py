@@ -0,0 +1,359 @@
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# inotify event masks from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+INOTIFY_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# ReadDirectoryChangesW actions
+FILE_ACTIONS = {1: 'created', 2: 'deleted', 3: 'modified', 4: 'deleted', 5: 'created'}
+
+
+class ChangeQueue:
+    # Collects path change events and only hands a path out once it has been quiet for `debounce`
+    # seconds, so a file written in many chunks (or created, modified and renamed) is hashed once
+    def __init__(self, debounce=2.0, clock=time.monotonic):
+        self.debounce = debounce
+        self.clock = clock
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.rescan = False
+        self.closed = False
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+    def put(self, path, kind):
+        with self.condition:
+            self.pending[path] = (kind, self.clock())
+            self.condition.notify()
+
+    def request_rescan(self):
+        # Watchers call this when events were lost, e.g. a kernel queue overflow
+        with self.condition:
+            self.rescan = True
+            self.condition.notify()
+
+    def take_rescan(self):
+        with self.condition:
+            rescan, self.rescan = self.rescan, False
+            return rescan
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def get_batch(self, timeout=None):
+        # Returns {path: kind} for every settled path, or an empty dict on timeout, close or rescan request
+        deadline = None if timeout is None else self.clock() + timeout
+        with self.condition:
+            while True:
+                now = self.clock()
+                settled = {path: kind for path, (kind, seen) in self.pending.items() if now - seen >= self.debounce}
+                if settled:
+                    for path in settled:
+                        del self.pending[path]
+                    return settled
+                if self.closed or self.rescan:
+                    return {}
+
+                wait = None
+                if self.pending:
+                    wait = min(self.debounce - (now - seen) for _, seen in self.pending.values())
+                if deadline is not None:
+                    if now >= deadline:
+                        return {}
+                    wait = deadline - now if wait is None else min(wait, deadline - now)
+                self.condition.wait(timeout=None if wait is None else max(wait, 0.01))
+
+
+class FileWatcher:
+    # Base class for the change watchers: runs on a background thread and pushes executable paths
+    # that were created, modified, renamed or deleted under the roots into a ChangeQueue
+    def __init__(self, roots, queue, walker, logger=None):
+        self.roots = list(roots)
+        self.queue = queue
+        self.walker = walker
+        self.logger = logger
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def log(self, message):
+        if self.logger is not None:
+            self.logger.log(message)
+
+    def emit(self, path, kind):
+        if self.walker.matches(path):
+            self.queue.put(path, kind)
+
+    def emit_tree(self, directory):
+        # A directory that appears (or is moved in) already has files in it by the time it is watched
+        for entry in self.walker.walk(directory):
+            self.queue.put(entry.path, 'created')
+
+    def targets(self):
+        return [(self.run, ())]
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self.threads)
+
+    def start(self):
+        if self.is_running():
+            return
+        self.stopping.clear()
+        self.threads = [threading.Thread(target=target, args=args, name=type(self).__name__, daemon=True)
+                        for target, args in self.targets()]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, wait=True):
+        self.stopping.set()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def run(self):
+        raise NotImplementedError
+
+
+class InotifyWatcher(FileWatcher):
+    # Linux backend: one inotify watch per directory, added recursively and for directories created later
+    def __init__(self, roots, queue, walker, logger=None):
+        super().__init__(roots, queue, walker, logger)
+        import ctypes
+        import ctypes.util
+        self.ctypes = ctypes
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = None
+        self.watches = {}
+
+    @staticmethod
+    def available():
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+            return hasattr(libc, 'inotify_init1')
+        except OSError:
+            return False
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            error = self.ctypes.get_errno()
+            if error == errno.ENOSPC:
+                # Out of fs.inotify.max_user_watches, the reconciliation scan covers what isn't watched
+                self.log(f"inotify watch limit reached, not watching {directory}")
+                self.queue.request_rescan()
+            elif error not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                self.log(f"Error watching directory: {directory} - {os.strerror(error)}")
+            return
+        self.watches[wd] = directory
+
+    def add_tree(self, root):
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            self.add_watch(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and not self.walker.is_excluded(entry.path):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def run(self):
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.log(f"inotify_init1 failed: {os.strerror(self.ctypes.get_errno())}")
+            return
+        try:
+            for root in self.roots:
+                self.add_tree(root)
+            self.log(f"Watching {len(self.watches)} directories with inotify")
+            poller = select.poll()
+            poller.register(self.fd, select.POLLIN)
+            while not self.stopping.is_set():
+                # Block in the kernel until something changes, waking once a second to check for stop()
+                if not poller.poll(1000):
+                    continue
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                self.handle(data)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+            self.watches.clear()
+
+    def handle(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.log("inotify queue overflowed, requesting a reconciliation scan")
+                self.queue.request_rescan()
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self.walker.is_excluded(path):
+                    self.add_tree(path)
+                    self.emit_tree(path)
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self.emit(path, 'deleted')
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self.emit(path, 'created')
+            else:
+                self.emit(path, 'modified')
+
+
+class WindowsWatcher(FileWatcher):
+    # Windows backend: one overlapped ReadDirectoryChangesW per root watching the whole subtree
+    def __init__(self, roots, queue, walker, logger=None, buffer_size=64 * 1024):
+        super().__init__(roots, queue, walker, logger)
+        import pywintypes
+        import win32con
+        import win32event
+        import win32file
+        self.pywintypes = pywintypes
+        self.win32con = win32con
+        self.win32event = win32event
+        self.win32file = win32file
+        self.buffer_size = buffer_size
+
+    @staticmethod
+    def available():
+        if sys.platform != 'win32':
+            return False
+        try:
+            import win32file
+            return True
+        except ImportError:
+            return False
+
+    def targets(self):
+        # One thread per root, each blocked on its own directory handle
+        return [(self.watch_root, (root,)) for root in self.roots]
+
+    def watch_root(self, root):
+        win32con, win32event, win32file = self.win32con, self.win32event, self.win32file
+        handle = win32file.CreateFile(
+            root, 0x0001,  # FILE_LIST_DIRECTORY
+            win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+            None, win32con.OPEN_EXISTING,
+            win32con.FILE_FLAG_BACKUP_SEMANTICS | win32con.FILE_FLAG_OVERLAPPED, None)
+        flags = (win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_DIR_NAME |
+                 win32con.FILE_NOTIFY_CHANGE_SIZE | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE)
+        buffer = win32file.AllocateReadBuffer(self.buffer_size)
+        overlapped = self.pywintypes.OVERLAPPED()
+        overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
+        self.log(f"Watching {root} with ReadDirectoryChangesW")
+        try:
+            while not self.stopping.is_set():
+                win32file.ReadDirectoryChangesW(handle, buffer, True, flags, overlapped)
+                # Wait on the event so stop() is noticed within a second
+                while win32event.WaitForSingleObject(overlapped.hEvent, 1000) == win32event.WAIT_TIMEOUT:
+                    if self.stopping.is_set():
+                        win32file.CancelIo(handle)
+                        return
+                size = win32file.GetOverlappedResult(handle, overlapped, True)
+                win32event.ResetEvent(overlapped.hEvent)
+                if size == 0:
+                    # The change buffer overflowed and the events are lost
+                    self.log(f"Change buffer overflowed for {root}, requesting a reconciliation scan")
+                    self.queue.request_rescan()
+                    continue
+                for action, name in win32file.FILE_NOTIFY_INFORMATION(buffer, size):
+                    path = os.path.join(root, name)
+                    kind = FILE_ACTIONS.get(action, 'modified')
+                    if kind == 'created' and os.path.isdir(path):
+                        if not self.walker.is_excluded(path):
+                            self.emit_tree(path)
+                        continue
+                    self.emit(path, kind)
+        finally:
+            handle.Close()
+
+
+class PollingWatcher(FileWatcher):
+    # Fallback backend: walks the roots every `interval` seconds and diffs (size, mtime) against the
+    # previous walk. Costs a full directory walk per pass but no hashing for unchanged files.
+    def __init__(self, roots, queue, walker, logger=None, interval=30):
+        super().__init__(roots, queue, walker, logger)
+        self.interval = interval
+        self.snapshot = None
+
+    def take_snapshot(self):
+        snapshot = {}
+        for root in self.roots:
+            for entry in self.walker.walk(root):
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def poll(self):
+        snapshot = self.take_snapshot()
+        if self.snapshot is not None:
+            for path, signature in snapshot.items():
+                previous = self.snapshot.get(path)
+                if previous is None:
+                    self.queue.put(path, 'created')
+                elif previous != signature:
+                    self.queue.put(path, 'modified')
+            for path in self.snapshot.keys() - snapshot.keys():
+                self.queue.put(path, 'deleted')
+        self.snapshot = snapshot
+
+    def run(self):
+        self.log(f"Polling {', '.join(self.roots)} for changes every {self.interval}s")
+        while not self.stopping.is_set():
+            self.poll()
+            self.stopping.wait(self.interval)
+
+
+def default_file_watcher(roots, queue, walker, logger=None):
+    if WindowsWatcher.available():
+        return WindowsWatcher(roots, queue, walker, logger)
+    if InotifyWatcher.available():
+        return InotifyWatcher(roots, queue, walker, logger)
+    return PollingWatcher(roots, queue, walker, logger)